@@ -1,11 +1,15 @@
+import asyncio
+import contextvars
 import datetime
 import operator
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Annotated, TypedDict, List, Optional
 
 from langchain_core.messages import AnyMessage, HumanMessage, SystemMessage, ToolMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.config import get_stream_writer
 from langgraph.graph import END, StateGraph
 import traceback
 
@@ -14,6 +18,9 @@ from src.tools.vuelos import flights_finder
 from src.tools.hoteles import hotels_finder
 from src.tools.donde import destination_explorer_tool, initialize_destination_explorer
 from src.tools.itinerario_simple import itinerary_planner_tool
+from src.utils.checkpointer import create_checkpointer
+from src.utils.context import build_context, estimate_tokens, summary_messages, window_start
+from src.config import CONTEXT_MAX_TOKENS, CONTEXT_SUMMARY_MIN_TOKENS, CONTEXT_KEEP_TOOL_TURNS, TOOL_MAX_CONCURRENCY
 
 
 CURRENT_YEAR = datetime.datetime.now().year
@@ -31,6 +38,8 @@ class AgentState(TypedDict):
     last_hotel_info: Optional[str]
     explorer_conversation_history: Optional[List[dict]]
     explorer_is_finished: bool
+    conversation_summary: Optional[str]
+    summarized_until: Optional[int]
 
 
 TOOLS_SYSTEM_PROMPT = f"""You are a smart travel agency. Use the tools to look up information.
@@ -97,6 +106,13 @@ TOOLS_SYSTEM_PROMPT = f"""You are a smart travel agency. Use the tools to look u
     - Once 'destination_explorer_tool' finalizes (main agent state 'explorer_is_finished' is 'True' and 'destination' is set), the user will likely respond to the tool's transition question. Your job is to take that user response and call the next appropriate tool (flights, hotels, itinerary) or answer directly.
     """
 
+def emit_progress(event: dict):
+    """Emite un evento de progreso en el stream 'custom' del grafo (no hace nada fuera de un stream)."""
+    try:
+        get_stream_writer()(event)
+    except Exception:
+        pass
+
 # --- LISTA DE HERRAMIENTAS ---
 TOOLS = [flights_finder, hotels_finder, real_itinerary_tool, itinerary_planner_tool, destination_explorer_tool]
 
@@ -109,17 +125,21 @@ class Agent:
 
         try:
             self._tools_llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.2).bind_tools(tools)
+            self._summary_llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0)
             print("Orchestrator LLM (gemini-2.0-flash) initialized and tools bound.")
         except Exception as e:
             print(f"ERROR initializing orchestrator LLM: {e}")
             raise
 
         builder = StateGraph(AgentState)
-        builder.add_node('call_tools_llm', self.call_tools_llm)
-        builder.add_node('invoke_tools', self.invoke_tools_and_update_state)
-        builder.add_node('generate_itinerary_node', self.invoke_specific_itinerary_tool)
+        # Cada nodo tiene versión síncrona (graph.invoke) y asíncrona (graph.ainvoke / astream)
+        builder.add_node('manage_context', RunnableLambda(self.manage_context, afunc=self.amanage_context))
+        builder.add_node('call_tools_llm', RunnableLambda(self.call_tools_llm, afunc=self.acall_tools_llm))
+        builder.add_node('invoke_tools', RunnableLambda(self.invoke_tools_and_update_state, afunc=self.ainvoke_tools_and_update_state))
+        builder.add_node('generate_itinerary_node', RunnableLambda(self.invoke_specific_itinerary_tool, afunc=self.ainvoke_specific_itinerary_tool))
 
-        builder.set_entry_point('call_tools_llm')
+        builder.set_entry_point('manage_context')
+        builder.add_edge('manage_context', 'call_tools_llm')
 
         builder.add_conditional_edges(
             'call_tools_llm',
@@ -139,8 +159,8 @@ class Agent:
         
         builder.add_edge('generate_itinerary_node', 'call_tools_llm')
 
-        memory = MemorySaver()
-        self.graph = builder.compile(checkpointer=memory)
+        self.checkpointer = create_checkpointer("travel_agent")
+        self.graph = builder.compile(checkpointer=self.checkpointer)
         print("Orchestrator agent graph compiled.")
 
     @staticmethod
@@ -156,152 +176,273 @@ class Agent:
         print("    No tool calls from LLM. Ending.")
         return 'end'
 
-    def call_tools_llm(self, state: AgentState):
+    def _build_llm_messages(self, state: AgentState):
         messages = state['messages']
         current_state_snapshot = {k: v for k, v in state.items() if k != 'messages'}
         print(f"  [Orchestrator call_tools_llm] Current state snapshot: {current_state_snapshot}")
-        final_messages_for_llm = [SystemMessage(content=TOOLS_SYSTEM_PROMPT)] + messages
-        print(f"  [Orchestrator call_tools_llm] Calling LLM with {len(final_messages_for_llm)} messages.")
+        final_messages_for_llm = build_context(
+            TOOLS_SYSTEM_PROMPT, messages,
+            summary=state.get('conversation_summary'),
+            summarized_until=state.get('summarized_until') or 0,
+            max_tokens=CONTEXT_MAX_TOKENS,
+            keep_tool_turns=CONTEXT_KEEP_TOOL_TURNS,
+        )
+        print(f"  [Orchestrator call_tools_llm] Calling LLM with {len(final_messages_for_llm)} of {len(messages) + 1} messages (~{estimate_tokens(final_messages_for_llm)} tokens).")
         if messages: print(f"    Last message to LLM: {type(messages[-1])} Content: {str(messages[-1].content)[:100]}...")
+        return final_messages_for_llm
+
+    def _pending_summary(self, state: AgentState):
+        """Messages that left the context window and are not summarized yet, or None if there are too few"""
+        messages = state['messages']
+        summarized_until = state.get('summarized_until') or 0
+        start = window_start(messages, CONTEXT_MAX_TOKENS, CONTEXT_KEEP_TOOL_TURNS)
+        pending = messages[summarized_until:start]
+        if not pending or estimate_tokens(pending) < CONTEXT_SUMMARY_MIN_TOKENS:
+            return None, start
+        print(f"  [Node manage_context] Summarizing {len(pending)} messages (~{estimate_tokens(pending)} tokens) before index {start}.")
+        return summary_messages(state.get('conversation_summary'), pending), start
+
+    def manage_context(self, state: AgentState):
+        summary_prompt, start = self._pending_summary(state)
+        if summary_prompt is None:
+            return {}
+        try:
+            summary = self._summary_llm.invoke(summary_prompt)
+        except Exception as e:
+            # Sin resumen el turno sigue funcionando con la ventana completa
+            print(f"    [ERROR] Error summarizing context: {e}")
+            return {}
+        return {'conversation_summary': str(summary.content), 'summarized_until': start}
+
+    async def amanage_context(self, state: AgentState):
+        summary_prompt, start = self._pending_summary(state)
+        if summary_prompt is None:
+            return {}
+        try:
+            summary = await self._summary_llm.ainvoke(summary_prompt)
+        except Exception as e:
+            # Sin resumen el turno sigue funcionando con la ventana completa
+            print(f"    [ERROR] Error summarizing context: {e}")
+            return {}
+        return {'conversation_summary': str(summary.content), 'summarized_until': start}
+
+    def call_tools_llm(self, state: AgentState):
+        final_messages_for_llm = self._build_llm_messages(state)
         ai_message = self._tools_llm.invoke(final_messages_for_llm)
         print(f"    LLM Response (AIMessage): tool_calls={ai_message.tool_calls}, content='{str(ai_message.content)[:100]}...'")
         return {'messages': [ai_message]}
-    
-    def invoke_tools_and_update_state(self, state: AgentState):
-        print("  [Node invoke_tools_and_update_state]")
+
+    async def acall_tools_llm(self, state: AgentState):
+        final_messages_for_llm = self._build_llm_messages(state)
+        ai_message = await self._tools_llm.ainvoke(final_messages_for_llm)
+        print(f"    LLM Response (AIMessage): tool_calls={ai_message.tool_calls}, content='{str(ai_message.content)[:100]}...'")
+        return {'messages': [ai_message]}
+
+    @staticmethod
+    def _pending_tool_calls(state: AgentState):
         if not state['messages'] or not isinstance(state['messages'][-1], AIMessage) or not state['messages'][-1].tool_calls:
             print("    [ERROR] Expected AIMessage with tool_calls as last message.")
-            return {"messages": [ToolMessage(content="Error: Estado inconsistente, no se encontraron tool_calls.", tool_call_id="error_state_no_tool_calls")]}
+            return None
+        return state['messages'][-1].tool_calls
 
-        tool_calls = state['messages'][-1].tool_calls
-        results = []
-        updated_state_values = {} 
+    def _prepare_tool_params(self, tool_name: str, tool_args_from_llm: dict, state: AgentState) -> dict:
+        params_to_invoke_tool_with = tool_args_from_llm
+        
+        if tool_name == flights_finder.name or tool_name == hotels_finder.name:
+            if "params" not in tool_args_from_llm:
+                print(f"      [WARNING] LLM args for {tool_name} did not contain 'params' key. Args: {tool_args_from_llm}. Tool might fail if it expects 'params'.")
+            # Tool invocation will proceed with tool_args_from_llm; it might fail if structure is wrong.
+            # params_for_state_update will use tool_args_from_llm.get("params", {}) later if needed
+                
+        elif tool_name == self.explorer_tool_name:
+            user_input_for_explorer = tool_args_from_llm.get("user_input", "")
+            if not user_input_for_explorer and state.get("messages"):
+                for msg in reversed(state["messages"]):
+                    if isinstance(msg, HumanMessage):
+                        user_input_for_explorer = msg.content
+                        print(f"      [INFO] Explorer tool called without 'user_input' arg, using last HumanMessage: '{user_input_for_explorer[:50]}...'")
+                        break
+            
+            params_to_invoke_tool_with = {
+                "user_input": user_input_for_explorer,
+                "current_explorer_state_messages": state.get("explorer_conversation_history")
+            }
+        return params_to_invoke_tool_with
+
+    def _process_tool_result(self, tool_name: str, tool_args_from_llm: dict, result, state: AgentState, updated_state_values: dict) -> str:
+        # --- Process result and update state ---
+        params_for_state_update = tool_args_from_llm
+        if tool_name == flights_finder.name or tool_name == hotels_finder.name:
+            if "params" in tool_args_from_llm:
+                 params_for_state_update = tool_args_from_llm.get("params", {})
+            # else: params_for_state_update remains tool_args_from_llm, state update might be less effective
+
+        if tool_name == self.explorer_tool_name:
+            result_content = result.get("explorer_response", "El explorador de destinos no proporcionó respuesta.")
+            updated_state_values["explorer_conversation_history"] = result.get("updated_explorer_messages_history")
+            explorer_is_finished_from_tool = result.get("is_finished", False)
+            updated_state_values["explorer_is_finished"] = explorer_is_finished_from_tool
+            print(f"      Explorer tool: finished={updated_state_values['explorer_is_finished']}, response='{str(result_content)[:100]}...'")
+
+            if explorer_is_finished_from_tool:
+                final_data = result.get("final_data")
+                if final_data and final_data.get("Destino Elegido"):
+                    updated_state_values["destination"] = final_data["Destino Elegido"]
+                    updated_state_values["intereses"] = final_data.get("intereses", state.get("intereses"))
+                    print(f"      Explorer tool finalized. Destination: '{updated_state_values['destination']}', Intereses: '{updated_state_values.get('intereses')}'")
+                else:
+                    print("      [WARNING] Explorer tool finished but no valid final_data for destination.")
+        else:
+            result_content = str(result)
 
-        for t_call in tool_calls:
-            tool_name = t_call['name']
-            tool_args_from_llm = t_call['args']
-            print(f"    Calling: {tool_name} with raw args from LLM: {tool_args_from_llm}")
+        if tool_name == flights_finder.name:
+            updated_state_values["flight_info_gathered"] = True
+            updated_state_values["last_flight_info"] = result_content
+            # Update state from params_for_state_update (which is tool_args_from_llm.get("params", {}))
+            if not state.get("destination") and params_for_state_update.get("ciudad_destino"):
+                updated_state_values["destination"] = params_for_state_update["ciudad_destino"]
+            if not state.get("departure_date") and params_for_state_update.get("fecha_salida"):
+                updated_state_values["departure_date"] = params_for_state_update["fecha_salida"]
+            if not state.get("arrival_date") and params_for_state_update.get("fecha_vuelta"):
+                updated_state_values["arrival_date"] = params_for_state_update["fecha_vuelta"]
+            print(f"      Set flight_info_gathered=True, updated related state: { {k:v for k,v in updated_state_values.items() if k in ['destination','departure_date','arrival_date']} }")
+
+        elif tool_name == hotels_finder.name:
+            updated_state_values["hotel_info_gathered"] = True
+            updated_state_values["last_hotel_info"] = result_content
+            # Update state from params_for_state_update (which is tool_args_from_llm.get("params", {}))
+            if not state.get("destination") and params_for_state_update.get("ciudad"):
+                updated_state_values["destination"] = params_for_state_update["ciudad"]
+            if not state.get("departure_date") and params_for_state_update.get("fecha_entrada"):
+                 updated_state_values["departure_date"] = params_for_state_update["fecha_entrada"]
+            if not state.get("arrival_date") and params_for_state_update.get("fecha_vuelta"):
+                 updated_state_values["arrival_date"] = params_for_state_update["fecha_vuelta"]
+            print(f"      Set hotel_info_gathered=True, updated related state: { {k:v for k,v in updated_state_values.items() if k in ['destination','departure_date','arrival_date']} }")
+        
+        elif tool_name == self.itinerary_tool_name or tool_name == self.simple_itinerary_tool_name:
+            updated_state_values["itinerary_generated"] = True
+            itinerary_args_used = tool_args_from_llm # LLM passes direct args for itinerary tools
+
+            param_mapping = [
+                ("destination", ["destination", "ciudad"]), 
+                ("departure_date", ["departure_date", "fecha_salida"]),
+                ("arrival_date", ["arrival_date", "fecha_vuelta", "fecha_llegada"]), # Added more flexible keys
+                ("intereses", ["intereses"])
+            ]
+
+            for state_key, llm_arg_keys in param_mapping:
+                for llm_arg_key in llm_arg_keys:
+                    if llm_arg_key in itinerary_args_used and itinerary_args_used[llm_arg_key]:
+                        value_from_llm = itinerary_args_used[llm_arg_key]
+                        current_pending_update = updated_state_values.get(state_key)
+                        current_state_value = state.get(state_key)
+
+                        if current_pending_update is not None: 
+                            if current_pending_update != value_from_llm:
+                                updated_state_values[state_key] = value_from_llm 
+                        else: 
+                            if current_state_value is None or current_state_value != value_from_llm:
+                                updated_state_values[state_key] = value_from_llm
+                        break 
+            
+            tool_type_msg = "comprehensive" if tool_name == self.itinerary_tool_name else "simple"
+            print(f"      LLM called {tool_type_msg} itinerary tool ({tool_name}). Set itinerary_generated=True. Relevant state updates: { {k:v for k,v in updated_state_values.items() if k in ['destination','departure_date','arrival_date', 'intereses', 'itinerary_generated']} }")
 
-            if tool_name not in self._tools:
-                print(f"      [ERROR] Bad tool name: '{tool_name}'. Available: {list(self._tools.keys())}")
-                result_content = f"Error: Tool '{tool_name}' no encontrada."
-            else:
+        return result_content
+
+    def _run_tool_call(self, t_call: dict, state: AgentState) -> tuple:
+        # Solo ejecuta la tool: su resultado se procesa después, en orden, en _tools_node_output
+        tool_name = t_call['name']
+        tool_args_from_llm = t_call['args']
+        print(f"    Calling: {tool_name} with raw args from LLM: {tool_args_from_llm}")
+
+        if tool_name not in self._tools:
+            print(f"      [ERROR] Bad tool name: '{tool_name}'. Available: {list(self._tools.keys())}")
+            return t_call, None, f"Error: Tool '{tool_name}' no encontrada."
+        try:
+            params_to_invoke_tool_with = self._prepare_tool_params(tool_name, tool_args_from_llm, state)
+            emit_progress({"type": "tool_start", "tool": tool_name, "tool_call_id": t_call['id']})
+            result = self._tools[tool_name].invoke(params_to_invoke_tool_with)
+            emit_progress({"type": "tool_end", "tool": tool_name, "tool_call_id": t_call['id'], "ok": True})
+            return t_call, result, None
+        except Exception as e:
+            print(f"      [ERROR] Error invoking tool {tool_name}: {e}")
+            traceback.print_exc()
+            emit_progress({"type": "tool_end", "tool": tool_name, "tool_call_id": t_call['id'], "ok": False})
+            return t_call, None, f"Error al ejecutar la herramienta {tool_name}: {str(e)}"
+
+    async def _arun_tool_call(self, t_call: dict, state: AgentState) -> tuple:
+        tool_name = t_call['name']
+        tool_args_from_llm = t_call['args']
+        print(f"    Calling (async): {tool_name} with raw args from LLM: {tool_args_from_llm}")
+
+        if tool_name not in self._tools:
+            print(f"      [ERROR] Bad tool name: '{tool_name}'. Available: {list(self._tools.keys())}")
+            return t_call, None, f"Error: Tool '{tool_name}' no encontrada."
+        try:
+            params_to_invoke_tool_with = self._prepare_tool_params(tool_name, tool_args_from_llm, state)
+            emit_progress({"type": "tool_start", "tool": tool_name, "tool_call_id": t_call['id']})
+            # Las tools sin corrutina propia se ejecutan en el executor por defecto de langchain
+            result = await self._tools[tool_name].ainvoke(params_to_invoke_tool_with)
+            emit_progress({"type": "tool_end", "tool": tool_name, "tool_call_id": t_call['id'], "ok": True})
+            return t_call, result, None
+        except Exception as e:
+            print(f"      [ERROR] Error invoking tool {tool_name}: {e}")
+            traceback.print_exc()
+            emit_progress({"type": "tool_end", "tool": tool_name, "tool_call_id": t_call['id'], "ok": False})
+            return t_call, None, f"Error al ejecutar la herramienta {tool_name}: {str(e)}"
+
+    def _tools_node_output(self, outcomes: list, state: AgentState) -> dict:
+        # Las tools se ejecutan en paralelo, pero sus resultados se procesan aquí uno a uno, en el
+        # orden de los tool_calls y sobre el mismo updated_state_values, igual que en la ejecución
+        # secuencial: el mapeo de parámetros del itinerario ve lo que han actualizado las tools
+        # anteriores del mismo paso (p. ej. el destino que fija flights_finder)
+        results = []
+        updated_state_values = {}
+        for t_call, result, error_content in outcomes:
+            tool_name = t_call['name']
+            result_content = error_content
+            if error_content is None:
                 try:
-                    params_to_invoke_tool_with = tool_args_from_llm
-                    
-                    if tool_name == flights_finder.name or tool_name == hotels_finder.name:
-                        if "params" not in tool_args_from_llm:
-                            print(f"      [WARNING] LLM args for {tool_name} did not contain 'params' key. Args: {tool_args_from_llm}. Tool might fail if it expects 'params'.")
-                        # Tool invocation will proceed with tool_args_from_llm; it might fail if structure is wrong.
-                        # params_for_state_update will use tool_args_from_llm.get("params", {}) later if needed
-                            
-                    elif tool_name == self.explorer_tool_name:
-                        user_input_for_explorer = tool_args_from_llm.get("user_input", "")
-                        if not user_input_for_explorer and state.get("messages"):
-                            for msg in reversed(state["messages"]):
-                                if isinstance(msg, HumanMessage):
-                                    user_input_for_explorer = msg.content
-                                    print(f"      [INFO] Explorer tool called without 'user_input' arg, using last HumanMessage: '{user_input_for_explorer[:50]}...'")
-                                    break
-                        
-                        params_to_invoke_tool_with = {
-                            "user_input": user_input_for_explorer,
-                            "current_explorer_state_messages": state.get("explorer_conversation_history")
-                        }
-
-                    result = self._tools[tool_name].invoke(params_to_invoke_tool_with)
-                    
-                    # --- Process result and update state ---
-                    params_for_state_update = tool_args_from_llm
-                    if tool_name == flights_finder.name or tool_name == hotels_finder.name:
-                        if "params" in tool_args_from_llm:
-                             params_for_state_update = tool_args_from_llm.get("params", {})
-                        # else: params_for_state_update remains tool_args_from_llm, state update might be less effective
-
-                    if tool_name == self.explorer_tool_name:
-                        result_content = result.get("explorer_response", "El explorador de destinos no proporcionó respuesta.")
-                        updated_state_values["explorer_conversation_history"] = result.get("updated_explorer_messages_history")
-                        explorer_is_finished_from_tool = result.get("is_finished", False)
-                        updated_state_values["explorer_is_finished"] = explorer_is_finished_from_tool
-                        print(f"      Explorer tool: finished={updated_state_values['explorer_is_finished']}, response='{str(result_content)[:100]}...'")
-
-                        if explorer_is_finished_from_tool:
-                            final_data = result.get("final_data")
-                            if final_data and final_data.get("Destino Elegido"):
-                                updated_state_values["destination"] = final_data["Destino Elegido"]
-                                updated_state_values["intereses"] = final_data.get("intereses", state.get("intereses"))
-                                print(f"      Explorer tool finalized. Destination: '{updated_state_values['destination']}', Intereses: '{updated_state_values.get('intereses')}'")
-                            else:
-                                print("      [WARNING] Explorer tool finished but no valid final_data for destination.")
-                    else:
-                        result_content = str(result)
-
-                    if tool_name == flights_finder.name:
-                        updated_state_values["flight_info_gathered"] = True
-                        updated_state_values["last_flight_info"] = result_content
-                        # Update state from params_for_state_update (which is tool_args_from_llm.get("params", {}))
-                        if not state.get("destination") and params_for_state_update.get("ciudad_destino"):
-                            updated_state_values["destination"] = params_for_state_update["ciudad_destino"]
-                        if not state.get("departure_date") and params_for_state_update.get("fecha_salida"):
-                            updated_state_values["departure_date"] = params_for_state_update["fecha_salida"]
-                        if not state.get("arrival_date") and params_for_state_update.get("fecha_vuelta"):
-                            updated_state_values["arrival_date"] = params_for_state_update["fecha_vuelta"]
-                        print(f"      Set flight_info_gathered=True, updated related state: { {k:v for k,v in updated_state_values.items() if k in ['destination','departure_date','arrival_date']} }")
-
-                    elif tool_name == hotels_finder.name:
-                        updated_state_values["hotel_info_gathered"] = True
-                        updated_state_values["last_hotel_info"] = result_content
-                        # Update state from params_for_state_update (which is tool_args_from_llm.get("params", {}))
-                        if not state.get("destination") and params_for_state_update.get("ciudad"):
-                            updated_state_values["destination"] = params_for_state_update["ciudad"]
-                        if not state.get("departure_date") and params_for_state_update.get("fecha_entrada"):
-                             updated_state_values["departure_date"] = params_for_state_update["fecha_entrada"]
-                        if not state.get("arrival_date") and params_for_state_update.get("fecha_vuelta"):
-                             updated_state_values["arrival_date"] = params_for_state_update["fecha_vuelta"]
-                        print(f"      Set hotel_info_gathered=True, updated related state: { {k:v for k,v in updated_state_values.items() if k in ['destination','departure_date','arrival_date']} }")
-                    
-                    elif tool_name == self.itinerary_tool_name or tool_name == self.simple_itinerary_tool_name:
-                        updated_state_values["itinerary_generated"] = True
-                        itinerary_args_used = tool_args_from_llm # LLM passes direct args for itinerary tools
-
-                        param_mapping = [
-                            ("destination", ["destination", "ciudad"]), 
-                            ("departure_date", ["departure_date", "fecha_salida"]),
-                            ("arrival_date", ["arrival_date", "fecha_vuelta", "fecha_llegada"]), # Added more flexible keys
-                            ("intereses", ["intereses"])
-                        ]
-
-                        for state_key, llm_arg_keys in param_mapping:
-                            for llm_arg_key in llm_arg_keys:
-                                if llm_arg_key in itinerary_args_used and itinerary_args_used[llm_arg_key]:
-                                    value_from_llm = itinerary_args_used[llm_arg_key]
-                                    current_pending_update = updated_state_values.get(state_key)
-                                    current_state_value = state.get(state_key)
-
-                                    if current_pending_update is not None: 
-                                        if current_pending_update != value_from_llm:
-                                            updated_state_values[state_key] = value_from_llm 
-                                    else: 
-                                        if current_state_value is None or current_state_value != value_from_llm:
-                                            updated_state_values[state_key] = value_from_llm
-                                    break 
-                        
-                        tool_type_msg = "comprehensive" if tool_name == self.itinerary_tool_name else "simple"
-                        print(f"      LLM called {tool_type_msg} itinerary tool ({tool_name}). Set itinerary_generated=True. Relevant state updates: { {k:v for k,v in updated_state_values.items() if k in ['destination','departure_date','arrival_date', 'intereses', 'itinerary_generated']} }")
-                        
+                    result_content = self._process_tool_result(tool_name, t_call['args'], result, state, updated_state_values)
                 except Exception as e:
-                    print(f"      [ERROR] Error invoking tool {tool_name}: {e}")
+                    print(f"      [ERROR] Error processing result of tool {tool_name}: {e}")
                     traceback.print_exc()
                     result_content = f"Error al ejecutar la herramienta {tool_name}: {str(e)}"
-            
             results.append(ToolMessage(tool_call_id=t_call['id'], name=tool_name, content=result_content))
-        
         print(f"    Tools invoked. Results ({len(results)}) sent back.")
         final_return = {"messages": results}
         if updated_state_values:
             final_return.update(updated_state_values)
         return final_return
 
+    def invoke_tools_and_update_state(self, state: AgentState):
+        print("  [Node invoke_tools_and_update_state]")
+        tool_calls = self._pending_tool_calls(state)
+        if not tool_calls:
+            return {"messages": [ToolMessage(content="Error: Estado inconsistente, no se encontraron tool_calls.", tool_call_id="error_state_no_tool_calls")]}
+
+        if len(tool_calls) == 1:
+            return self._tools_node_output([self._run_tool_call(tool_calls[0], state)], state)
+        # Cada llamada corre con su propia copia del contexto para conservar el stream writer de langgraph
+        with ThreadPoolExecutor(max_workers=min(len(tool_calls), TOOL_MAX_CONCURRENCY)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, self._run_tool_call, t_call, state) for t_call in tool_calls]
+            return self._tools_node_output([future.result() for future in futures], state)
+
+    async def ainvoke_tools_and_update_state(self, state: AgentState):
+        print("  [Node invoke_tools_and_update_state] (async)")
+        tool_calls = self._pending_tool_calls(state)
+        if not tool_calls:
+            return {"messages": [ToolMessage(content="Error: Estado inconsistente, no se encontraron tool_calls.", tool_call_id="error_state_no_tool_calls")]}
+
+        semaphore = asyncio.Semaphore(TOOL_MAX_CONCURRENCY)
+
+        async def run(t_call):
+            async with semaphore:
+                return await self._arun_tool_call(t_call, state)
+
+        return self._tools_node_output(await asyncio.gather(*(run(t_call) for t_call in tool_calls)), state)
+
     def should_generate_itinerary_or_continue(self, state: AgentState):
         print("  [Router should_generate_itinerary_or_continue]")
         
@@ -361,9 +502,7 @@ class Agent:
         print("Conditions for auto-itinerary not met or itinerary already generated. Continuing to LLM.")
         return 'continue_to_llm'
 
-    def invoke_specific_itinerary_tool(self, state: AgentState):
-        # This node automatically calls the COMPREHENSIVE itinerary tool
-        print(f"  [Node invoke_specific_itinerary_tool] (Auto-triggered Itinerary - using {self.itinerary_tool_name})")
+    def _auto_itinerary_args(self, state: AgentState):
         destination = state.get("destination")
         departure_date = state.get("departure_date")
         arrival_date = state.get("arrival_date")
@@ -374,27 +513,56 @@ class Agent:
         if not (destination and departure_date and arrival_date and intereses): # Ensure interests are present
             error_msg = "Error: (Auto-Itinerary) Missing essential parameters (destination, dates, or interests) from state for comprehensive itinerary."
             print(f"    {error_msg} - State: dest={destination}, dep_date={departure_date}, arr_date={arrival_date}, interests={intereses}")
-            return {"messages": [ToolMessage(content=error_msg, name=self.itinerary_tool_name, tool_call_id="error_auto_itinerary_params")]}
+            return None, {"messages": [ToolMessage(content=error_msg, name=self.itinerary_tool_name, tool_call_id="error_auto_itinerary_params")]}
 
         # Args for the comprehensive tool
         tool_args = { "ciudad": destination, "departure_date": departure_date, "arrival_date": arrival_date, "intereses": intereses, "flight_details": last_flight_info, "hotel_details": last_hotel_info }
         print(f"    Calling {self.itinerary_tool_name} with auto-gathered args: {tool_args}")
+        return tool_args, None
+
+    def _auto_itinerary_success(self, result):
+        emit_progress({"type": "tool_end", "tool": self.itinerary_tool_name, "tool_call_id": "auto_itinerary", "ok": True})
+        result_content = str(result)
+        tool_call_id = f"auto_itinerary_call_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+        tool_message = ToolMessage(tool_call_id=tool_call_id, name=self.itinerary_tool_name, content=result_content)
+        updated_state_values = {"itinerary_generated": True, "messages": [tool_message]}
+        print(f"    {self.itinerary_tool_name} invoked successfully by system. Itinerary generated.")
+        return updated_state_values
+
+    def _auto_itinerary_error(self, e: Exception):
+        emit_progress({"type": "tool_end", "tool": self.itinerary_tool_name, "tool_call_id": "auto_itinerary", "ok": False})
+        print(f"      [ERROR] Error auto-invoking {self.itinerary_tool_name}: {e}")
+        traceback.print_exc()
+        result_content = f"Error al auto-ejecutar {self.itinerary_tool_name}: {str(e)}"
+        tool_call_id = f"error_auto_itinerary_exec_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+        return {"messages": [ToolMessage(tool_call_id=tool_call_id, name=self.itinerary_tool_name, content=result_content)]}
+
+    def invoke_specific_itinerary_tool(self, state: AgentState):
+        # This node automatically calls the COMPREHENSIVE itinerary tool
+        print(f"  [Node invoke_specific_itinerary_tool] (Auto-triggered Itinerary - using {self.itinerary_tool_name})")
+        tool_args, error_return = self._auto_itinerary_args(state)
+        if error_return:
+            return error_return
         
+        emit_progress({"type": "tool_start", "tool": self.itinerary_tool_name, "tool_call_id": "auto_itinerary"})
         try:
             # Using self.itinerary_tool_name which points to real_itinerary_tool (comprehensive)
             result = self._tools[self.itinerary_tool_name].invoke(tool_args)
-            result_content = str(result)
-            tool_call_id = f"auto_itinerary_call_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
-            tool_message = ToolMessage(tool_call_id=tool_call_id, name=self.itinerary_tool_name, content=result_content)
-            updated_state_values = {"itinerary_generated": True, "messages": [tool_message]}
-            print(f"    {self.itinerary_tool_name} invoked successfully by system. Itinerary generated.")
-            return updated_state_values
+            return self._auto_itinerary_success(result)
         except Exception as e:
-            print(f"      [ERROR] Error auto-invoking {self.itinerary_tool_name}: {e}")
-            traceback.print_exc()
-            result_content = f"Error al auto-ejecutar {self.itinerary_tool_name}: {str(e)}"
-            tool_call_id = f"error_auto_itinerary_exec_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
-            return {"messages": [ToolMessage(tool_call_id=tool_call_id, name=self.itinerary_tool_name, content=result_content)]}
+            return self._auto_itinerary_error(e)
 
+    async def ainvoke_specific_itinerary_tool(self, state: AgentState):
+        print(f"  [Node invoke_specific_itinerary_tool] (Auto-triggered Itinerary, async - using {self.itinerary_tool_name})")
+        tool_args, error_return = self._auto_itinerary_args(state)
+        if error_return:
+            return error_return
+
+        emit_progress({"type": "tool_start", "tool": self.itinerary_tool_name, "tool_call_id": "auto_itinerary"})
+        try:
+            result = await self._tools[self.itinerary_tool_name].ainvoke(tool_args)
+            return self._auto_itinerary_success(result)
+        except Exception as e:
+            return self._auto_itinerary_error(e)
 
 travel_agent = Agent(tools=TOOLS)
\ No newline at end of file
@@ -1,7 +1,7 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
 from src.utils.logger_config import setup_logger
+from src.utils.checkpointer import create_checkpointer
 from src.tools.buscar_vuelos import buscar_vuelos
 from src.tools.buscar_hoteles import buscar_hoteles
 
@@ -104,7 +104,7 @@ RECUERDA:
 - Adapta tus respuestas al contexto y preferencias del usuario
 """
 
-memory = MemorySaver()
+checkpointer = create_checkpointer("core_agent")
 
 core_agent = create_react_agent(
     name="core_agent",
@@ -113,5 +113,5 @@ core_agent = create_react_agent(
     ),
     tools=[buscar_vuelos, buscar_hoteles],
     prompt=prompt,
-    checkpointer=memory,
+    checkpointer=checkpointer,
 )
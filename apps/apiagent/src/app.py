@@ -1,7 +1,19 @@
-from fastapi import FastAPI, Request
+import json
+
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from src.utils.graph import process_message, process_message_agente2, get_messages
+from src.config import MESSAGES_PAGE_SIZE, MESSAGES_MAX_PAGE_SIZE
+from src.utils.graph import aprocess_message, aprocess_message_agente2, aget_thread_snapshot, messages_etag, messages_page, astream_message_agente2
+from src.utils.logger_config import setup_logger
+from src.agents.agente import travel_agent
+from src.agents.core import checkpointer as core_checkpointer
+from src.tools.cache import cache_metrics
+from src.utils import http_client
+from src.utils.id_tokens import id_token_cache
+
+logger = setup_logger('api_agent.app')
 
 app = FastAPI()
 
@@ -16,18 +28,60 @@ class Input(BaseModel):
 def read_root():
     return {"message": "Welcome to the Travel Planning Agent"}
 
+@app.get("/metrics/checkpointer")
+def checkpointer_metrics():
+    # Solo los checkpointers en memoria acotada exponen métricas
+    return {
+        name: checkpointer.metrics()
+        for name, checkpointer in (("travel_agent", travel_agent.checkpointer), ("core_agent", core_checkpointer))
+        if hasattr(checkpointer, "metrics")
+    }
+
+@app.get("/metrics/tool-cache")
+def tool_cache_metrics():
+    return cache_metrics()
+
+@app.get("/metrics/http")
+def http_metrics():
+    return http_client.latency_stats()
+
+@app.get("/metrics/id-tokens")
+def id_token_metrics():
+    return id_token_cache.metrics()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await http_client.aclose()
+
 @app.get("/messages")
-def messages(thread_id: str):
-    result = get_messages(thread_id)
-    return result
+async def messages(request: Request, thread_id: str, since: int = Query(0, ge=0), limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_MAX_PAGE_SIZE)):
+    snapshot = await aget_thread_snapshot(thread_id)
+    etag = messages_etag(thread_id, snapshot)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(messages_page(snapshot, since, limit), headers={"ETag": etag})
 
 @app.post("/chat2")
 async def chat(input: Input):
-    result = process_message(input.message, input.thread_id)
+    result = await aprocess_message(input.message, input.thread_id)
     return result
 
 @app.post("/chat")
 async def chat2(input: Input):
-    result = process_message_agente2(input.message, input.thread_id)
+    result = await aprocess_message_agente2(input.message, input.thread_id)
     return result
 
+@app.post("/chat/stream")
+async def chat_stream(input: Input):
+    async def sse():
+        try:
+            async for event in astream_message_agente2(input.message, input.thread_id):
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+        except Exception as e:
+            logger.exception(f"Error streaming thread {input.thread_id}")
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'message': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(sse(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
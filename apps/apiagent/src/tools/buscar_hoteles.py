@@ -1,9 +1,10 @@
 from typing import Optional, Dict, Any
 from langchain_core.tools import tool
 from datetime import date, timedelta
-import requests
 import os
 from src.utils.logger_config import setup_logger
+from src.utils import http_client
+from src.tools.cache import hotels_cache, is_miss, normalizar_adultos, normalizar_ciudad, normalizar_fecha
 
 logger = setup_logger("tools.buscar_hoteles")
 
@@ -44,13 +45,18 @@ def buscar_hoteles(
 
         # Preparar el payload
         payload = {
-            "ciudad": ciudad,
-            "fecha_entrada": fecha_entrada,
-            "fecha_vuelta": fecha_vuelta,
-            "adults": min(max(1, adults), 9),  # Asegurar que esté entre 1 y 9
+            "ciudad": normalizar_ciudad(ciudad),
+            "fecha_entrada": normalizar_fecha(fecha_entrada),
+            "fecha_vuelta": normalizar_fecha(fecha_vuelta),
+            "adults": normalizar_adultos(adults),  # Asegurar que esté entre 1 y 9
             "valoración": valoracion,
         }
 
+        clave = hotels_cache.key("apidata", payload)
+        cacheado = hotels_cache.get(clave)
+        if not is_miss(cacheado):
+            return cacheado
+
         # Obtener la URL base del entorno
         base_url = os.environ.get("DATA_API_URL")
         if not base_url:
@@ -64,10 +70,12 @@ def buscar_hoteles(
         url_api = f"{base_url}/hoteles"
         headers = {"Content-Type": "application/json"}
 
-        response = requests.post(url=url_api, headers=headers, json=payload)
+        response = http_client.post(url=url_api, headers=headers, json=payload, timeout=60)
 
         if response.status_code == 200:
-            return response.json()
+            resultado = response.json()
+            hotels_cache.put(clave, resultado)
+            return resultado
         else:
             logger.error(f"Error en la búsqueda de hoteles: {response.status_code}")
             return {
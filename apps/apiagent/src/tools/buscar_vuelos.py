@@ -1,9 +1,10 @@
 from typing import Optional, Dict, Any
 from langchain_core.tools import tool
 from datetime import date, timedelta
-import requests
 import os
 from src.utils.logger_config import setup_logger
+from src.utils import http_client
+from src.tools.cache import flights_cache, is_miss, normalizar_adultos, normalizar_fecha, normalizar_iata
 
 logger = setup_logger('tools.buscar_vuelos')
 
@@ -37,19 +38,26 @@ def buscar_vuelos(
         tipo_de_viaje_num = 1 if tipo_de_viaje == "Ida y Vuelta" else 2
         
         # Validar fechas
+        fecha_salida = normalizar_fecha(fecha_salida)
+        fecha_vuelta = normalizar_fecha(fecha_vuelta)
         if tipo_de_viaje_num == 1 and not fecha_vuelta:
             fecha_vuelta = (date.fromisoformat(fecha_salida) + timedelta(days=7)).isoformat()
         
         # Preparar el payload
         payload = {
-            "ciudad_origen": ciudad_origen.upper(),
-            "ciudad_destino": ciudad_destino.upper(),
+            "ciudad_origen": normalizar_iata(ciudad_origen),
+            "ciudad_destino": normalizar_iata(ciudad_destino),
             "fecha_salida": fecha_salida,
             "fecha_vuelta": fecha_vuelta,
-            "adults": min(max(1, adults), 9),  # Asegurar que esté entre 1 y 9
-            "cabin_class": cabin_class.upper(),
+            "adults": normalizar_adultos(adults),  # Asegurar que esté entre 1 y 9
+            "cabin_class": cabin_class.strip().upper(),
             "tipo_de_viaje": tipo_de_viaje_num
         }
+
+        clave = flights_cache.key("apidata", payload)
+        cacheado = flights_cache.get(clave)
+        if not is_miss(cacheado):
+            return cacheado
         
         # Obtener la URL base del entorno
         base_url = os.environ.get("DATA_API_URL")
@@ -64,14 +72,17 @@ def buscar_vuelos(
         url_api = f"{base_url}/vuelos"
         headers = {'Content-Type': 'application/json'}
         
-        response = requests.post(
+        response = http_client.post(
             url=url_api,
             headers=headers,
-            json=payload
+            json=payload,
+            timeout=120
         )
         
         if response.status_code == 200:
-            return response.json()
+            resultado = response.json()
+            flights_cache.put(clave, resultado)
+            return resultado
         else:
             logger.error(f"Error en la búsqueda de vuelos: {response.status_code}")
             return {
@@ -0,0 +1,126 @@
+# cache.py
+
+import copy
+import datetime
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from src.config import TOOL_CACHE_TTL, TOOL_CACHE_MAX_ENTRIES
+
+_MISS = object()
+_DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%Y%m%d")
+
+
+# --- Normalización de argumentos: búsquedas equivalentes comparten entrada de caché ---
+def normalizar_iata(codigo: Optional[str]) -> Optional[str]:
+    return codigo.strip().upper() if isinstance(codigo, str) else codigo
+
+def normalizar_fecha(fecha: Optional[str]) -> Optional[str]:
+    """Devuelve la fecha en ISO (YYYY-MM-DD); si no se reconoce el formato se deja tal cual."""
+    if not isinstance(fecha, str):
+        return fecha
+    texto = fecha.strip()[:10] if "T" in fecha else fecha.strip()
+    for formato in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(texto, formato).date().isoformat()
+        except ValueError:
+            continue
+    return fecha.strip()
+
+def normalizar_adultos(adults: Optional[int]) -> int:
+    try:
+        return min(max(1, int(adults)), 9)
+    except (TypeError, ValueError):
+        return 1
+
+def normalizar_ciudad(ciudad: Optional[str]) -> Optional[str]:
+    return " ".join(ciudad.split()) if isinstance(ciudad, str) else ciudad
+
+
+def es_resultado_cacheable(resultado: Any) -> bool:
+    """Solo se guardan respuestas válidas: nunca errores, timeouts o validaciones fallidas."""
+    def es_error(elemento):
+        return isinstance(elemento, dict) and any(str(k).startswith("error") for k in elemento)
+
+    if isinstance(resultado, list):
+        return not any(es_error(elemento) for elemento in resultado)
+    return not es_error(resultado)
+
+
+class ToolResultCache:
+    """
+    Caché LRU con TTL para resultados de herramientas, compartida entre hilos y
+    conversaciones. La clave son los argumentos ya normalizados.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float = TOOL_CACHE_TTL, max_entries: int = TOOL_CACHE_MAX_ENTRIES):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(origen: str, args: Dict[str, Any]) -> str:
+        """Clave por origen de datos (CF o apidata), que devuelven formatos distintos, y argumentos normalizados."""
+        return origen + ":" + json.dumps(args, sort_keys=True, ensure_ascii=False, default=str).casefold()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = entry[1]
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return _MISS
+        # Copia para que quien la reciba no modifique la entrada compartida
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: Any) -> None:
+        if self.ttl_seconds <= 0 or not es_resultado_cacheable(value):
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries,
+            }
+
+
+def is_miss(value: Any) -> bool:
+    return value is _MISS
+
+
+# Una caché por tipo de búsqueda, compartida por las herramientas del agente y del core_agent
+flights_cache = ToolResultCache("vuelos")
+hotels_cache = ToolResultCache("hoteles")
+
+def cache_metrics() -> Dict[str, Dict[str, Any]]:
+    return {cache.name: cache.metrics() for cache in (flights_cache, hotels_cache)}
@@ -7,7 +7,8 @@ from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
 from langchain_core.tools import tool
 import uuid
-import requests
+
+from src.utils import http_client
 
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 TAVILY_API_KEY = os.environ.get("TAVILY_API_KEY")
@@ -97,7 +98,7 @@ def tavily_search(query: str) -> str:
     if not TAVILY_API_KEY: return "Error: Tavily API key no configurada."
     try:
         print(f"[EXPLORADOR_TOOL_CALL] Tavily search: \"{query}\"")
-        response = requests.post("https://api.tavily.com/search", json={ "api_key": TAVILY_API_KEY, "query": query, "search_depth": "basic", "include_answer": True, "max_results": 5 })
+        response = http_client.post("https://api.tavily.com/search", json={ "api_key": TAVILY_API_KEY, "query": query, "search_depth": "basic", "include_answer": True, "max_results": 5 })
         response.raise_for_status()
         results = response.json()
         output_parts = []
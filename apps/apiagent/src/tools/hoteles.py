@@ -1,52 +1,70 @@
 # hoteles.py
 
 import os
-import requests
+import httpx
 import json
 import traceback
 from typing import Optional, List, Dict, Any
 
-import google.auth
-import google.auth.transport.requests
-from google.oauth2 import id_token
-
 from langchain.pydantic_v1 import BaseModel, Field
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
+
+from src.utils import http_client
+from src.utils.id_tokens import id_token_cache
+from src.tools.cache import hotels_cache, is_miss, normalizar_adultos, normalizar_ciudad, normalizar_fecha
 
 CLOUD_FUNCTION_URL = "https://europe-west1-dataproject3-458310.cloudfunctions.net/hoteles"
 
-def llamar_api_hoteles_cf(payload_data: Dict[str, Any], authenticated: bool = True) -> Optional[Dict[str, Any]]:
+def _cabeceras_hoteles_cf(authenticated: bool = True) -> Dict[str, str]:
     headers = {
         "Content-Type": "application/json"
     }
     if authenticated:
         try:
-            creds, project = google.auth.default(scopes=['openid', 'email', 'profile'])
-            auth_req = google.auth.transport.requests.Request()
-            identity_token = id_token.fetch_id_token(auth_req, CLOUD_FUNCTION_URL)
-            headers["Authorization"] = f"Bearer {identity_token}"
+            headers["Authorization"] = f"Bearer {id_token_cache.get(CLOUD_FUNCTION_URL)}"
         except Exception as e:
             print(f"[llamar_api_hoteles_cf ERROR] Error obteniendo credenciales o token: {e}")
             print("[llamar_api_hoteles_cf] Intentando llamar sin autenticación (puede fallar si es requerida).")
+    return headers
+
+async def _acabeceras_hoteles_cf(authenticated: bool = True) -> Dict[str, str]:
+    headers = {
+        "Content-Type": "application/json"
+    }
+    if authenticated:
+        try:
+            headers["Authorization"] = f"Bearer {await id_token_cache.aget(CLOUD_FUNCTION_URL)}"
+        except Exception as e:
+            print(f"[allamar_api_hoteles_cf ERROR] Error obteniendo credenciales o token: {e}")
+            print("[allamar_api_hoteles_cf] Intentando llamar sin autenticación (puede fallar si es requerida).")
+    return headers
+
+def _interpretar_respuesta_hoteles(response) -> Dict[str, Any]:
+    if response.status_code == 200:
+        try:
+            return response.json()
+        except ValueError:
+            print(f"[llamar_api_hoteles_cf ERROR] Respuesta no es JSON. Texto: {response.text[:500]}")
+            return {"error_raw_text": f"La API devolvió un contenido no JSON (status {response.status_code}). Respuesta: {response.text[:200]}"}
+    else:
+        # ... (manejo de errores sin cambios) ...
+        error_text = response.text
+        print(f"[llamar_api_hoteles_cf ERROR] Error en la API. Status: {response.status_code}. Respuesta: {error_text[:500]}")
+        try:
+            error_json = response.json()
+            if isinstance(error_json, dict) and "error" in error_json: return {"error_api": f"Error de la API (status {response.status_code}): {error_json['error']}"}
+            if isinstance(error_json, dict) and "message" in error_json: return {"error_api": f"Error de la API (status {response.status_code}): {error_json['message']}"}
+        except ValueError: pass
+        return {"error_api": f"Error de la API (status {response.status_code}). Respuesta: {error_text[:200]}"}
+
+def llamar_api_hoteles_cf(payload_data: Dict[str, Any], authenticated: bool = True) -> Optional[Dict[str, Any]]:
+    headers = _cabeceras_hoteles_cf(authenticated)
     try:
-        response = requests.post(CLOUD_FUNCTION_URL, json=payload_data, headers=headers, timeout=60)
-        if response.status_code == 200:
-            try:
-                return response.json()
-            except requests.exceptions.JSONDecodeError:
-                print(f"[llamar_api_hoteles_cf ERROR] Respuesta no es JSON. Texto: {response.text[:500]}")
-                return {"error_raw_text": f"La API devolvió un contenido no JSON (status {response.status_code}). Respuesta: {response.text[:200]}"}
-        else:
-            # ... (manejo de errores sin cambios) ...
-            error_text = response.text
-            print(f"[llamar_api_hoteles_cf ERROR] Error en la API. Status: {response.status_code}. Respuesta: {error_text[:500]}")
-            try:
-                error_json = response.json()
-                if isinstance(error_json, dict) and "error" in error_json: return {"error_api": f"Error de la API (status {response.status_code}): {error_json['error']}"}
-                if isinstance(error_json, dict) and "message" in error_json: return {"error_api": f"Error de la API (status {response.status_code}): {error_json['message']}"}
-            except requests.exceptions.JSONDecodeError: pass
-            return {"error_api": f"Error de la API (status {response.status_code}). Respuesta: {error_text[:200]}"}
-    except requests.exceptions.RequestException as e:
+        response = http_client.post(CLOUD_FUNCTION_URL, json=payload_data, headers=headers, timeout=60)
+        if response.status_code in (401, 403):
+            id_token_cache.invalidate(CLOUD_FUNCTION_URL)
+        return _interpretar_respuesta_hoteles(response)
+    except httpx.HTTPError as e:
         print(f"[llamar_api_hoteles_cf ERROR] Excepción en la petición: {e}")
         return {"error_request": f"Error de conexión llamando a la API: {str(e)}"}
     except Exception as e:
@@ -54,6 +72,21 @@ def llamar_api_hoteles_cf(payload_data: Dict[str, Any], authenticated: bool = Tr
         traceback.print_exc()
         return {"error_unexpected": f"Error inesperado al llamar a la API: {str(e)}"}
 
+async def allamar_api_hoteles_cf(payload_data: Dict[str, Any], authenticated: bool = True) -> Optional[Dict[str, Any]]:
+    headers = await _acabeceras_hoteles_cf(authenticated)
+    try:
+        response = await http_client.apost(CLOUD_FUNCTION_URL, json=payload_data, headers=headers, timeout=60)
+        if response.status_code in (401, 403):
+            id_token_cache.invalidate(CLOUD_FUNCTION_URL)
+        return _interpretar_respuesta_hoteles(response)
+    except httpx.HTTPError as e:
+        print(f"[allamar_api_hoteles_cf ERROR] Excepción en la petición: {e}")
+        return {"error_request": f"Error de conexión llamando a la API: {str(e)}"}
+    except Exception as e:
+        print(f"[allamar_api_hoteles_cf ERROR] Excepción inesperada: {e}")
+        traceback.print_exc()
+        return {"error_unexpected": f"Error inesperado al llamar a la API: {str(e)}"}
+
 
 class HotelsFinderCloudInput(BaseModel):
     ciudad: str = Field(description='Location (city) of the hotel. e.g., "París", "Nueva York"')
@@ -63,35 +96,27 @@ class HotelsFinderCloudInput(BaseModel):
     max_price: Optional[float] = Field(None, description='Maximum total price for the stay. e.g., 250.0')
     valoracion: Optional[float] = Field(None, description='Minimum hotel rating (e.g., 4.0 for 4 stars and above).')
 
-@tool(args_schema=HotelsFinderCloudInput)
-def hotels_finder(
+def _payload_hoteles(
     ciudad: str,
     fecha_entrada: str,
     fecha_vuelta: str,
     adults: Optional[int] = 1,
     max_price: Optional[float] = None,
     valoracion: Optional[float] = None
-) -> List[Dict[str, Any]]:
-    '''
-    Finds hotels using a custom Google Cloud Function.
-    Provide the city, check-in date (YYYY-MM-DD), and check-out date (YYYY-MM-DD).
-    Optionally, specify adults, max_price, and valoracion.
-    Returns a list of hotel details: name, price, rating, and hotel's check-in/out dates.
-    '''
+) -> Dict[str, Any]:
     print(f"[hotels_finder] Args recibidos: ciudad='{ciudad}', fecha_entrada='{fecha_entrada}', fecha_vuelta='{fecha_vuelta}', adults={adults}, max_price={max_price}, valoracion={valoracion}")
 
     payload_cf = {
-        "ciudad": ciudad,
-        "fecha_entrada": fecha_entrada,
-        "fecha_vuelta": fecha_vuelta,
-        "adults": adults
+        "ciudad": normalizar_ciudad(ciudad),
+        "fecha_entrada": normalizar_fecha(fecha_entrada),
+        "fecha_vuelta": normalizar_fecha(fecha_vuelta),
+        "adults": normalizar_adultos(adults)
     }
-    if adults is not None: payload_cf["adults"] = adults
     if max_price is not None: payload_cf["max_price"] = max_price
     if valoracion is not None: payload_cf["valoracion"] = valoracion
-    
-    api_response = llamar_api_hoteles_cf(payload_cf, authenticated=True) 
+    return payload_cf
 
+def _formatear_resultado_hoteles(api_response) -> List[Dict[str, Any]]:
     if api_response is None: return [{"error": "Error crítico al contactar el servicio de hoteles."}]
     if "error_request" in api_response: return [{"error": api_response["error_request"]}]
     if "error_api" in api_response: return [{"error": api_response["error_api"]}]
@@ -137,4 +162,57 @@ def hotels_finder(
         if "message" in api_response: return [{"message": api_response['message']}]
         return [{"error": "Respuesta dict inesperada de la API."}]
     else: 
-        return [{"error": "Respuesta API inesperada/mal formateada."}]
\ No newline at end of file
+        return [{"error": "Respuesta API inesperada/mal formateada."}]
+
+
+def _hotels_finder(
+    ciudad: str,
+    fecha_entrada: str,
+    fecha_vuelta: str,
+    adults: Optional[int] = 1,
+    max_price: Optional[float] = None,
+    valoracion: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    payload_cf = _payload_hoteles(ciudad, fecha_entrada, fecha_vuelta, adults, max_price, valoracion)
+    clave = hotels_cache.key("cf", payload_cf)
+    cacheado = hotels_cache.get(clave)
+    if not is_miss(cacheado):
+        return cacheado
+
+    api_response = llamar_api_hoteles_cf(payload_cf, authenticated=True)
+    resultado = _formatear_resultado_hoteles(api_response)
+    hotels_cache.put(clave, resultado)
+    return resultado
+
+async def _ahotels_finder(
+    ciudad: str,
+    fecha_entrada: str,
+    fecha_vuelta: str,
+    adults: Optional[int] = 1,
+    max_price: Optional[float] = None,
+    valoracion: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    payload_cf = _payload_hoteles(ciudad, fecha_entrada, fecha_vuelta, adults, max_price, valoracion)
+    clave = hotels_cache.key("cf", payload_cf)
+    cacheado = hotels_cache.get(clave)
+    if not is_miss(cacheado):
+        return cacheado
+
+    api_response = await allamar_api_hoteles_cf(payload_cf, authenticated=True)
+    resultado = _formatear_resultado_hoteles(api_response)
+    hotels_cache.put(clave, resultado)
+    return resultado
+
+# Herramienta con ruta síncrona (invoke) y asíncrona (ainvoke) para el grafo del agente
+hotels_finder = StructuredTool.from_function(
+    func=_hotels_finder,
+    coroutine=_ahotels_finder,
+    name="hotels_finder",
+    args_schema=HotelsFinderCloudInput,
+    description='''
+    Finds hotels using a custom Google Cloud Function.
+    Provide the city, check-in date (YYYY-MM-DD), and check-out date (YYYY-MM-DD).
+    Optionally, specify adults, max_price, and valoracion.
+    Returns a list of hotel details: name, price, rating, and hotel's check-in/out dates.
+    '''
+)
@@ -5,13 +5,15 @@ import json
 import re
 import traceback
 import datetime
-import requests
+import httpx
 from typing import List, Dict, Any, TypedDict, Optional
 
 from langgraph.graph import StateGraph, END
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 
+from src.utils import http_client
+
 
 class ItineraryState(TypedDict):
     traveler_data: Dict[str, Any]
@@ -67,14 +69,14 @@ def verify_with_tavily(place_name: str, destination: str, api_key: Optional[str]
             "search_depth": "basic", "include_answer": True, "max_results": 3
         }
         headers = {"content-type": "application/json"}
-        response = requests.post(url, json=payload, headers=headers, timeout=15)
+        response = http_client.post(url, json=payload, headers=headers, timeout=15)
         response.raise_for_status()
         result = response.json()
         if "answer" in result and result["answer"]:
             return {"status": "success", "information": result["answer"],
                     "sources": [source["url"] for source in result.get("results", [])[:2] if source.get("url")]}
         return {"status": "no_answer", "message": "No se encontró respuesta específica o la respuesta estaba vacía.", "raw_result": result}
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"  -> HTTP Error en verificación Tavily para {place_name}: {e}")
         return {"status": "error", "message": f"Error HTTP: {e}"}
     except Exception as e:
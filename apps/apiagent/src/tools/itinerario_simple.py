@@ -7,7 +7,9 @@ from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
 from langchain_core.tools import tool
 import uuid
-import requests
+import httpx
+
+from src.utils import http_client
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
@@ -18,7 +20,7 @@ def tavily_search(query: str) -> str:
         return "Error: Tavily API key no configurada o es un placeholder."
     try:
         print(f"[PLANNER_TOOL_CALL] Tavily search: \"{query}\"")
-        response = requests.post(
+        response = http_client.post(
             "https://api.tavily.com/search",
             json={
                 "api_key": TAVILY_API_KEY,
@@ -48,8 +50,8 @@ def tavily_search(query: str) -> str:
         if not output_parts:
             return "No se encontraron resultados directos o detallados en Tavily para esta consulta. Intenta reformular tu búsqueda."
         return "\n\n".join(output_parts)
-    except requests.exceptions.HTTPError as e:
-        return f"Error HTTP durante la búsqueda con Tavily: {e}. Respuesta: {e.response.text if e.response else 'N/A'}"
+    except httpx.HTTPStatusError as e:
+        return f"Error HTTP durante la búsqueda con Tavily: {e}. Respuesta: {e.response.text if e.response is not None else 'N/A'}"
     except Exception as e:
         return f"Error durante la búsqueda con Tavily: {e}"
 
@@ -1,63 +1,80 @@
 # vuelos.py
 
 import os
-import requests
+import httpx
 import json
 import traceback
 from typing import Optional, List, Dict, Any, Union # Añadido Union
 
-# --- Autenticación con Google ---
-import google.auth
-import google.auth.transport.requests
-from google.oauth2 import id_token
-
 # --- Langchain ---
 from langchain.pydantic_v1 import BaseModel, Field
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
+
+from src.utils import http_client
+from src.utils.id_tokens import id_token_cache
+from src.tools.cache import flights_cache, is_miss, normalizar_adultos, normalizar_fecha, normalizar_iata
 
 # --- Definición de la Cloud Function de Vuelos y su llamada ---
 FLIGHTS_CF_URL = "https://europe-west1-dataproject3-458310.cloudfunctions.net/vuelos"
 
-def llamar_api_vuelos_cf(payload_data: Dict[str, Any], authenticated: bool = True) -> Optional[Union[List[Dict[str, Any]], Dict[str, Any]]]: # Tipo de retorno ajustado
-    """
-    Llama a la Cloud Function 'vuelos'.
-    Devuelve el JSON parseado de la respuesta o un dict de error.
-    """
+def _cabeceras_vuelos_cf(authenticated: bool = True) -> Dict[str, str]:
+    """Construye las cabeceras de la llamada, con el ID token (cacheado) si se pide autenticación."""
     headers = {"Content-Type": "application/json"}
     if authenticated:
         try:
-            creds, project = google.auth.default(scopes=['openid', 'email', 'profile'])
-            auth_req = google.auth.transport.requests.Request()
-            identity_token = id_token.fetch_id_token(auth_req, FLIGHTS_CF_URL)
-            headers["Authorization"] = f"Bearer {identity_token}"
+            headers["Authorization"] = f"Bearer {id_token_cache.get(FLIGHTS_CF_URL)}"
         except Exception as e:
             print(f"[llamar_api_vuelos_cf ERROR] Error obteniendo credenciales o token: {e}")
             print("[llamar_api_vuelos_cf] Intentando llamar sin autenticación.")
+    return headers
+
+async def _acabeceras_vuelos_cf(authenticated: bool = True) -> Dict[str, str]:
+    headers = {"Content-Type": "application/json"}
+    if authenticated:
+        try:
+            headers["Authorization"] = f"Bearer {await id_token_cache.aget(FLIGHTS_CF_URL)}"
+        except Exception as e:
+            print(f"[allamar_api_vuelos_cf ERROR] Error obteniendo credenciales o token: {e}")
+            print("[allamar_api_vuelos_cf] Intentando llamar sin autenticación.")
+    return headers
+
+def _interpretar_respuesta_vuelos(response) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """Traduce la respuesta HTTP de la CF (httpx) al JSON parseado o a un dict de error."""
+    if response.status_code == 200:
+        try:
+            response_json = response.json()
+            # Imprimir aquí la respuesta cruda para depuración es MUY útil
+            print(f"[llamar_api_vuelos_cf DEBUG] Respuesta JSON CRUDA de la CF (Vuelos):\n{json.dumps(response_json, indent=2, ensure_ascii=False)}")
+            return response_json # Devuelve el JSON parseado directamente
+        except ValueError:
+            print(f"[llamar_api_vuelos_cf ERROR] Respuesta no es JSON. Texto: {response.text[:500]}")
+            return {"error_raw_text": f"API de vuelos devolvió contenido no JSON (status {response.status_code}). Resp: {response.text[:200]}"}
+    else:
+        error_text = response.text
+        print(f"[llamar_api_vuelos_cf ERROR] Error en API vuelos. Status: {response.status_code}. Resp: {error_text[:500]}")
+        try:
+            error_json = response.json()
+            if isinstance(error_json, dict) and "error" in error_json: return {"error_api_details": error_json} # Devuelve el error de la API
+            if isinstance(error_json, dict) and "message" in error_json: return {"error_api_message": error_json["message"]}
+        except ValueError: pass
+        return {"error_api_status": f"Error API vuelos (status {response.status_code}). Resp: {error_text[:200]}"}
+
+def llamar_api_vuelos_cf(payload_data: Dict[str, Any], authenticated: bool = True) -> Optional[Union[List[Dict[str, Any]], Dict[str, Any]]]: # Tipo de retorno ajustado
+    """
+    Llama a la Cloud Function 'vuelos'.
+    Devuelve el JSON parseado de la respuesta o un dict de error.
+    """
+    headers = _cabeceras_vuelos_cf(authenticated)
 
     try:
-        response = requests.post(FLIGHTS_CF_URL, json=payload_data, headers=headers, timeout=120)
-        if response.status_code == 200:
-            try:
-                response_json = response.json()
-                # Imprimir aquí la respuesta cruda para depuración es MUY útil
-                print(f"[llamar_api_vuelos_cf DEBUG] Respuesta JSON CRUDA de la CF (Vuelos):\n{json.dumps(response_json, indent=2, ensure_ascii=False)}")
-                return response_json # Devuelve el JSON parseado directamente
-            except requests.exceptions.JSONDecodeError:
-                print(f"[llamar_api_vuelos_cf ERROR] Respuesta no es JSON. Texto: {response.text[:500]}")
-                return {"error_raw_text": f"API de vuelos devolvió contenido no JSON (status {response.status_code}). Resp: {response.text[:200]}"}
-        else:
-            error_text = response.text
-            print(f"[llamar_api_vuelos_cf ERROR] Error en API vuelos. Status: {response.status_code}. Resp: {error_text[:500]}")
-            try:
-                error_json = response.json()
-                if isinstance(error_json, dict) and "error" in error_json: return {"error_api_details": error_json} # Devuelve el error de la API
-                if isinstance(error_json, dict) and "message" in error_json: return {"error_api_message": error_json["message"]}
-            except requests.exceptions.JSONDecodeError: pass
-            return {"error_api_status": f"Error API vuelos (status {response.status_code}). Resp: {error_text[:200]}"}
-    except requests.exceptions.Timeout:
+        response = http_client.post(FLIGHTS_CF_URL, json=payload_data, headers=headers, timeout=120)
+        if response.status_code in (401, 403):
+            id_token_cache.invalidate(FLIGHTS_CF_URL)
+        return _interpretar_respuesta_vuelos(response)
+    except httpx.TimeoutException:
         print(f"[llamar_api_vuelos_cf ERROR] Timeout llamando a {FLIGHTS_CF_URL}.")
         return {"error_request_timeout": f"Timeout llamando a API de vuelos."}
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"[llamar_api_vuelos_cf ERROR] Excepción en la petición: {e}")
         return {"error_request_exception": f"Error de conexión llamando a API de vuelos: {str(e)}"}
     except Exception as e:
@@ -65,6 +82,28 @@ def llamar_api_vuelos_cf(payload_data: Dict[str, Any], authenticated: bool = Tru
         traceback.print_exc()
         return {"error_unexpected_cf_call": f"Error inesperado al llamar a API de vuelos: {str(e)}"}
 
+async def allamar_api_vuelos_cf(payload_data: Dict[str, Any], authenticated: bool = True) -> Optional[Union[List[Dict[str, Any]], Dict[str, Any]]]:
+    """
+    Versión asíncrona de llamar_api_vuelos_cf: no bloquea el event loop mientras espera a la CF.
+    """
+    headers = await _acabeceras_vuelos_cf(authenticated)
+
+    try:
+        response = await http_client.apost(FLIGHTS_CF_URL, json=payload_data, headers=headers, timeout=120)
+        if response.status_code in (401, 403):
+            id_token_cache.invalidate(FLIGHTS_CF_URL)
+        return _interpretar_respuesta_vuelos(response)
+    except httpx.TimeoutException:
+        print(f"[allamar_api_vuelos_cf ERROR] Timeout llamando a {FLIGHTS_CF_URL}.")
+        return {"error_request_timeout": f"Timeout llamando a API de vuelos."}
+    except httpx.HTTPError as e:
+        print(f"[allamar_api_vuelos_cf ERROR] Excepción en la petición: {e}")
+        return {"error_request_exception": f"Error de conexión llamando a API de vuelos: {str(e)}"}
+    except Exception as e:
+        print(f"[allamar_api_vuelos_cf ERROR] Excepción inesperada: {e}")
+        traceback.print_exc()
+        return {"error_unexpected_cf_call": f"Error inesperado al llamar a API de vuelos: {str(e)}"}
+
 # --- Definición de Inputs para la Herramienta Langchain ---
 class FlightsCloudInput(BaseModel):
     ciudad_origen: str = Field(description='Mandatory. The IATA code of the departure city/airport. Example: "MAD" for Madrid.')
@@ -74,42 +113,41 @@ class FlightsCloudInput(BaseModel):
     adults: int = Field(default=1, description='Number of adult passengers. Defaults to 1. Example: 1.')
     cabin_class: Optional[str] = Field("ECONOMY", description='Optional. Cabin class. Examples: "ECONOMY", "PREMIUM_ECONOMY", "BUSINESS", "FIRST". Defaults to "ECONOMY".')
     tipo_de_viaje: int = Field(description='Mandatory. Type of trip: 0 for one-way, 1 for round trip. Example: 1.')
+    flex_dias: Optional[int] = Field(None, description='Optional. Flexible dates: also search N days before and after fecha_salida (1-3; the return date shifts by the same amount). Returns a price-per-day calendar with the best offer of each day instead of the flight list. Example: 3.')
 
-@tool(args_schema=FlightsCloudInput)
-def flights_finder(
+def _payload_vuelos(
     ciudad_origen: str,
     ciudad_destino: str,
     fecha_salida: str,
     tipo_de_viaje: int,
     fecha_vuelta: Optional[str] = None,
     adults: Optional[int] = 1,
-    cabin_class: Optional[str] = "ECONOMY"
-) -> List[Dict[str, Any]]: # Mantenemos el tipo de retorno como List[Dict] para el agente
-    '''Tool to find flight information using a custom Cloud Function.
-    Returns the raw JSON data from the flight API.
-    Provide departure city, arrival city, departure date, and trip type (0 for one-way, 1 for round trip).
-    For round trips (tipo_de_viaje=1), a return date (fecha_vuelta) is also mandatory.
-    Dates must be in YYYY-MM-DD format.
-    '''
-    print(f"[flights_finder CF RAW] Args: origen='{ciudad_origen}', destino='{ciudad_destino}', salida='{fecha_salida}', tipo_viaje={tipo_de_viaje}, vuelta='{fecha_vuelta}', adultos={adults}, cabina='{cabin_class}'")
+    cabin_class: Optional[str] = "ECONOMY",
+    flex_dias: Optional[int] = None
+) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+    """Valida los argumentos del LLM y construye el payload de la CF (o la lista de error de validación)."""
+    print(f"[flights_finder CF RAW] Args: origen='{ciudad_origen}', destino='{ciudad_destino}', salida='{fecha_salida}', tipo_viaje={tipo_de_viaje}, vuelta='{fecha_vuelta}', adultos={adults}, cabina='{cabin_class}', flex_dias={flex_dias}")
 
     if tipo_de_viaje == 1 and not fecha_vuelta:
         # Devolver una lista con un diccionario de error, como esperan las herramientas
         return [{"error_validation": "Para un viaje de ida y vuelta (tipo_de_viaje=1), se requiere 'fecha_vuelta'."}]
 
     payload_cf = {
-        "ciudad_origen": ciudad_origen,
-        "ciudad_destino": ciudad_destino,
-        "fecha_salida": fecha_salida,
-        "adults": adults,
-        "cabin_class": cabin_class,
+        "ciudad_origen": normalizar_iata(ciudad_origen),
+        "ciudad_destino": normalizar_iata(ciudad_destino),
+        "fecha_salida": normalizar_fecha(fecha_salida),
+        "adults": normalizar_adultos(adults),
+        "cabin_class": (cabin_class or "ECONOMY").strip().upper(),
         "tipo_de_viaje": tipo_de_viaje
     }
     if fecha_vuelta:
-        payload_cf["fecha_vuelta"] = fecha_vuelta
-    
-    api_response_raw = llamar_api_vuelos_cf(payload_cf, authenticated=True)
+        payload_cf["fecha_vuelta"] = normalizar_fecha(fecha_vuelta)
+    if flex_dias:
+        # La CF busca todos los días de la ventana a la vez y devuelve el calendario de precios
+        payload_cf["flex_dias"] = int(flex_dias)
+    return payload_cf
 
+def _formatear_resultado_vuelos(api_response_raw) -> List[Dict[str, Any]]:
     # Langchain tools suelen esperar una List[Dict[str, Any]] como resultado.
     # Si api_response_raw es un diccionario (ej. un error), lo envolvemos en una lista.
     # Si api_response_raw ya es una lista (de vuelos), la usamos directamente.
@@ -128,3 +166,68 @@ def flights_finder(
     else:
         # Tipo inesperado
         return [{"error_unexpected_response_type": f"Respuesta inesperada de la API de vuelos. Tipo: {type(api_response_raw)}"}]
+
+def _flights_finder(
+    ciudad_origen: str,
+    ciudad_destino: str,
+    fecha_salida: str,
+    tipo_de_viaje: int,
+    fecha_vuelta: Optional[str] = None,
+    adults: Optional[int] = 1,
+    cabin_class: Optional[str] = "ECONOMY",
+    flex_dias: Optional[int] = None
+) -> List[Dict[str, Any]]: # Mantenemos el tipo de retorno como List[Dict] para el agente
+    payload_cf = _payload_vuelos(ciudad_origen, ciudad_destino, fecha_salida, tipo_de_viaje, fecha_vuelta, adults, cabin_class, flex_dias)
+    if isinstance(payload_cf, list):
+        return payload_cf
+
+    clave = flights_cache.key("cf", payload_cf)
+    cacheado = flights_cache.get(clave)
+    if not is_miss(cacheado):
+        return cacheado
+
+    api_response_raw = llamar_api_vuelos_cf(payload_cf, authenticated=True)
+    resultado = _formatear_resultado_vuelos(api_response_raw)
+    flights_cache.put(clave, resultado)
+    return resultado
+
+async def _aflights_finder(
+    ciudad_origen: str,
+    ciudad_destino: str,
+    fecha_salida: str,
+    tipo_de_viaje: int,
+    fecha_vuelta: Optional[str] = None,
+    adults: Optional[int] = 1,
+    cabin_class: Optional[str] = "ECONOMY",
+    flex_dias: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    payload_cf = _payload_vuelos(ciudad_origen, ciudad_destino, fecha_salida, tipo_de_viaje, fecha_vuelta, adults, cabin_class, flex_dias)
+    if isinstance(payload_cf, list):
+        return payload_cf
+
+    clave = flights_cache.key("cf", payload_cf)
+    cacheado = flights_cache.get(clave)
+    if not is_miss(cacheado):
+        return cacheado
+
+    api_response_raw = await allamar_api_vuelos_cf(payload_cf, authenticated=True)
+    resultado = _formatear_resultado_vuelos(api_response_raw)
+    flights_cache.put(clave, resultado)
+    return resultado
+
+# Herramienta con ruta síncrona (invoke) y asíncrona (ainvoke) para el grafo del agente
+flights_finder = StructuredTool.from_function(
+    func=_flights_finder,
+    coroutine=_aflights_finder,
+    name="flights_finder",
+    args_schema=FlightsCloudInput,
+    description='''Tool to find flight information using a custom Cloud Function.
+    Returns the raw JSON data from the flight API.
+    Provide departure city, arrival city, departure date, and trip type (0 for one-way, 1 for round trip).
+    For round trips (tipo_de_viaje=1), a return date (fecha_vuelta) is also mandatory.
+    Dates must be in YYYY-MM-DD format.
+    For questions like "what is the cheapest day that week", call it ONCE with flex_dias
+    instead of once per date: it returns {"calendario": [{fecha_salida, fecha_vuelta, precio_min,
+    ofertas, mejor, proveedores}], "mejor_dia"} covering every day of the window.
+    '''
+)
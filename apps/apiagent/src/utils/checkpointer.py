@@ -0,0 +1,626 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.config import CHECKPOINTER_URL, CHECKPOINTER_BATCH_SIZE, MEMORY_BUDGET_MB, MEMORY_THREAD_TTL, MEMORY_SPILL_DIR
+from src.utils.logger_config import setup_logger
+
+# Create logger for this module
+logger = setup_logger('api_agent.checkpointer')
+
+
+class _SQLiteBackend:
+    """Local backend: a single sqlite3 connection shared between threads behind a lock"""
+    placeholder = "?"
+    blob_type = "BLOB"
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def cursor(self):
+        with self._lock:
+            cur = self._conn.cursor()
+            try:
+                yield cur
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            finally:
+                cur.close()
+
+
+class _PostgresBackend:
+    """Production backend: psycopg connection pool, one transaction per cursor() block"""
+    placeholder = "%s"
+    blob_type = "BYTEA"
+
+    def __init__(self, url: str):
+        # Optional dependency, only needed when CHECKPOINTER_URL points to Postgres
+        from psycopg_pool import ConnectionPool
+        self._pool = ConnectionPool(url, min_size=1, max_size=10, open=True)
+
+    @contextmanager
+    def cursor(self):
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                yield cur
+
+
+class SQLCheckpointSaver(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer stored in SQL (SQLite locally, Postgres in production).
+
+    Writes are buffered in memory and persisted in a single transaction when the
+    turn ends (flush), when the buffer reaches batch_size, or before any read of
+    the same thread. Reads only load the checkpoint that is requested: list()
+    fetches ids and metadata first and deserializes each checkpoint on demand.
+    """
+
+    def __init__(self, url: str, table_prefix: str = "agent", batch_size: int = 50, serde=None):
+        super().__init__(serde=serde)
+        if url.startswith("sqlite:///"):
+            self._db = _SQLiteBackend(url[len("sqlite:///"):])
+        elif url.startswith(("postgres://", "postgresql://")):
+            self._db = _PostgresBackend(url)
+        else:
+            raise ValueError(f"Unsupported checkpointer url: {url}")
+
+        self.batch_size = batch_size
+        self._checkpoints_table = f"{table_prefix}_checkpoints"
+        self._writes_table = f"{table_prefix}_writes"
+        self._buffer_lock = threading.Lock()
+        # Held for the whole flush, so a reader that finds its thread buffered waits for the commit
+        self._flush_lock = threading.Lock()
+        self._checkpoint_rows: List[tuple] = []
+        self._write_rows: List[tuple] = []
+        self._special_write_rows: List[tuple] = []
+        self._buffered_threads = set()
+        self.setup()
+
+    # --- Schema ---
+
+    def setup(self):
+        blob = self._db.blob_type
+        with self._db.cursor() as cur:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self._checkpoints_table} (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint {blob},
+                    metadata_type TEXT,
+                    metadata {blob},
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                )
+            """)
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self._writes_table} (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    value {blob},
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                )
+            """)
+
+    def _sql(self, query: str) -> str:
+        return query.replace("?", self._db.placeholder)
+
+    # --- Batched writes ---
+
+    def flush(self):
+        """Persist every buffered checkpoint and write in one transaction"""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._buffer_lock:
+            checkpoint_rows, self._checkpoint_rows = self._checkpoint_rows, []
+            write_rows, self._write_rows = self._write_rows, []
+            special_write_rows, self._special_write_rows = self._special_write_rows, []
+        if not (checkpoint_rows or write_rows or special_write_rows):
+            return
+
+        columns = "thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value"
+        try:
+            with self._db.cursor() as cur:
+                if checkpoint_rows:
+                    cur.executemany(self._sql(f"""
+                        INSERT INTO {self._checkpoints_table}
+                            (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id) DO UPDATE SET
+                            parent_checkpoint_id = excluded.parent_checkpoint_id,
+                            type = excluded.type,
+                            checkpoint = excluded.checkpoint,
+                            metadata_type = excluded.metadata_type,
+                            metadata = excluded.metadata
+                    """), checkpoint_rows)
+                if write_rows:
+                    cur.executemany(self._sql(f"""
+                        INSERT INTO {self._writes_table} ({columns})
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id, task_id, idx) DO NOTHING
+                    """), write_rows)
+                if special_write_rows:
+                    # Errors/interrupts replace previous values, like in MemorySaver
+                    cur.executemany(self._sql(f"""
+                        INSERT INTO {self._writes_table} ({columns})
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id, task_id, idx) DO UPDATE SET
+                            channel = excluded.channel,
+                            type = excluded.type,
+                            value = excluded.value
+                    """), special_write_rows)
+        except Exception:
+            logger.exception("Error flushing checkpoints, keeping them buffered")
+            with self._buffer_lock:
+                self._checkpoint_rows = checkpoint_rows + self._checkpoint_rows
+                self._write_rows = write_rows + self._write_rows
+                self._special_write_rows = special_write_rows + self._special_write_rows
+            raise
+        # Only after the commit: threads with rows buffered meanwhile stay marked
+        with self._buffer_lock:
+            self._buffered_threads = {row[0] for row in self._checkpoint_rows + self._write_rows + self._special_write_rows}
+        logger.debug(f"Flushed {len(checkpoint_rows)} checkpoints and {len(write_rows) + len(special_write_rows)} writes")
+
+    def _buffer(self, thread_id: str, checkpoint_row: Optional[tuple] = None, write_rows=(), special_write_rows=()):
+        with self._buffer_lock:
+            if checkpoint_row:
+                self._checkpoint_rows.append(checkpoint_row)
+            self._write_rows.extend(write_rows)
+            self._special_write_rows.extend(special_write_rows)
+            self._buffered_threads.add(thread_id)
+            pending = len(self._checkpoint_rows) + len(self._write_rows) + len(self._special_write_rows)
+        if pending >= self.batch_size:
+            self.flush()
+
+    def _flush_if_buffered(self, thread_id: str):
+        # Read-your-writes: a thread with buffered rows is flushed before reading it
+        if thread_id in self._buffered_threads:
+            self.flush()
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(metadata)
+        self._buffer(thread_id, checkpoint_row=(
+            thread_id, checkpoint_ns, checkpoint["id"], parent_checkpoint_id,
+            type_, serialized_checkpoint, metadata_type, serialized_metadata
+        ))
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        write_rows, special_write_rows = [], []
+        for idx, (channel, value) in enumerate(writes):
+            type_, serialized_value = self.serde.dumps_typed(value)
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, serialized_value)
+            (special_write_rows if channel in WRITES_IDX_MAP else write_rows).append(row)
+        self._buffer(thread_id, write_rows=write_rows, special_write_rows=special_write_rows)
+
+    # --- Lazy reads ---
+
+    def _load_tuple(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, parent_checkpoint_id: Optional[str], metadata_type: str, metadata) -> Optional[CheckpointTuple]:
+        with self._db.cursor() as cur:
+            cur.execute(self._sql(f"""
+                SELECT type, checkpoint FROM {self._checkpoints_table}
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+            """), (thread_id, checkpoint_ns, checkpoint_id))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            cur.execute(self._sql(f"""
+                SELECT task_id, channel, type, value FROM {self._writes_table}
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                ORDER BY task_id, idx
+            """), (thread_id, checkpoint_ns, checkpoint_id))
+            writes = cur.fetchall()
+
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((row[0], bytes(row[1]))),
+            metadata=self.serde.loads_typed((metadata_type, bytes(metadata))),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                if parent_checkpoint_id else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((type_, bytes(value))))
+                for task_id, channel, type_, value in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"].get("checkpoint_id")
+        self._flush_if_buffered(thread_id)
+
+        query = f"""
+            SELECT checkpoint_id, parent_checkpoint_id, metadata_type, metadata FROM {self._checkpoints_table}
+            WHERE thread_id = ? AND checkpoint_ns = ?
+        """
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id:
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        else:
+            # uuid6 ids sort chronologically: the latest checkpoint is the greatest id
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._db.cursor() as cur:
+            cur.execute(self._sql(query), params)
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return self._load_tuple(thread_id, checkpoint_ns, *row)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        self.flush()
+        query = f"SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, metadata_type, metadata FROM {self._checkpoints_table}"
+        conditions, params = [], []
+        if config:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if config["configurable"].get("checkpoint_id"):
+                conditions.append("checkpoint_id = ?")
+                params.append(config["configurable"]["checkpoint_id"])
+        if before and before["configurable"].get("checkpoint_id"):
+            conditions.append("checkpoint_id < ?")
+            params.append(before["configurable"]["checkpoint_id"])
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY checkpoint_id DESC"
+        # With a metadata filter the limit is applied after filtering
+        if limit and not filter:
+            query += f" LIMIT {int(limit)}"
+
+        with self._db.cursor() as cur:
+            cur.execute(self._sql(query), params)
+            rows = cur.fetchall()
+
+        yielded = 0
+        for thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, metadata_type, metadata in rows:
+            if filter:
+                decoded = self.serde.loads_typed((metadata_type, bytes(metadata)))
+                if not all(decoded.get(k) == v for k, v in filter.items()):
+                    continue
+            checkpoint_tuple = self._load_tuple(thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, metadata_type, metadata)
+            if checkpoint_tuple is None:
+                continue
+            yield checkpoint_tuple
+            yielded += 1
+            if limit and yielded >= limit:
+                break
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.flush()
+        with self._db.cursor() as cur:
+            cur.execute(self._sql(f"DELETE FROM {self._checkpoints_table} WHERE thread_id = ?"), (thread_id,))
+            cur.execute(self._sql(f"DELETE FROM {self._writes_table} WHERE thread_id = ?"), (thread_id,))
+
+    # --- Async API: the database work runs in a worker thread ---
+
+    async def aflush(self):
+        await asyncio.to_thread(self.flush)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        # Normally this only serializes and buffers; when it triggers a flush it runs in a thread
+        if self._buffer_full():
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        if self._buffer_full():
+            await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+        else:
+            self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def _buffer_full(self) -> bool:
+        return len(self._checkpoint_rows) + len(self._write_rows) + len(self._special_write_rows) + 1 >= self.batch_size
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    MemorySaver with a byte budget for the threads kept in RAM.
+
+    When the resident size goes over max_bytes, or a thread stays idle longer
+    than ttl_seconds, the least recently used threads are written to a
+    compressed snapshot in spill_dir and removed from memory. The next read or
+    write of that thread (a /chat or /messages call) loads it back.
+    Sizes are the serialized size of the stored channel values and writes, so
+    they are an estimate of the real Python memory used.
+
+    Every operation holds the lock from loading the thread until it is done, so
+    a thread cannot be evicted halfway through a read or write. Eviction is
+    checked after every operation and by a background sweep every
+    sweep_seconds, so idle threads expire even when nothing is written.
+    """
+
+    def __init__(self, spill_dir: str, max_bytes: int, ttl_seconds: int = 3600, min_idle_seconds: int = 30, sweep_seconds: int = 60, serde=None):
+        super().__init__(serde=serde)
+        self.spill_dir = spill_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.min_idle_seconds = min_idle_seconds
+        os.makedirs(spill_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        # thread_id -> [bytes, last access], ordered from least to most recently used
+        self._resident: "OrderedDict[str, list]" = OrderedDict()
+        self._resident_bytes = 0
+        self._evictions = 0
+        self._rehydrations = 0
+
+        if sweep_seconds > 0:
+            threading.Thread(target=self._sweep, args=(sweep_seconds,), name="checkpointer-sweep", daemon=True).start()
+
+    # --- Bookkeeping ---
+
+    def _snapshot_path(self, thread_id: str) -> str:
+        return os.path.join(self.spill_dir, hashlib.sha1(thread_id.encode()).hexdigest() + ".json.gz")
+
+    def _touch(self, thread_id: str, added_bytes: int = 0):
+        # Only called with the lock held, right after _ensure_resident
+        entry = self._resident[thread_id]
+        entry[0] += added_bytes
+        entry[1] = time.monotonic()
+        self._resident_bytes += added_bytes
+        self._resident.move_to_end(thread_id)
+
+    def _ensure_resident(self, thread_id: str):
+        with self._lock:
+            if thread_id not in self._resident:
+                if os.path.exists(self._snapshot_path(thread_id)):
+                    self._rehydrate(thread_id)
+                else:
+                    self._resident[thread_id] = [0, 0.0]
+            self._touch(thread_id)
+
+    @contextmanager
+    def _resident_thread(self, thread_id: Optional[str]):
+        """Keep the thread in memory (and the lock held) for the whole operation"""
+        with self._lock:
+            if thread_id is not None:
+                self._ensure_resident(thread_id)
+            yield
+            self._evict_if_needed()
+
+    def _sweep(self, interval: int):
+        while True:
+            time.sleep(interval)
+            try:
+                self._evict_if_needed()
+            except Exception:
+                logger.exception("Error in checkpointer eviction sweep")
+
+    def _values_size(self, checkpoint: Checkpoint, new_versions: ChannelVersions) -> int:
+        values = checkpoint.get("channel_values", {})
+        return sum(len(self.serde.dumps_typed(values[k])[1]) for k in new_versions if k in values)
+
+    def _writes_size(self, writes) -> int:
+        return sum(len(self.serde.dumps_typed(value)[1]) for _, value in writes)
+
+    def _evict_if_needed(self):
+        with self._lock:
+            now = time.monotonic()
+            for thread_id, (size, last_access) in list(self._resident.items()):
+                idle = now - last_access
+                over_budget = self._resident_bytes > self.max_bytes
+                if idle < self.min_idle_seconds:
+                    # The rest of the threads were used even more recently
+                    break
+                if over_budget or idle > self.ttl_seconds:
+                    self._evict(thread_id)
+            if self._resident_bytes > self.max_bytes:
+                logger.warning(f"Checkpointer over budget ({self._resident_bytes} > {self.max_bytes} bytes) with only active threads in memory")
+
+    def _evict(self, thread_id: str):
+        tuples = list(super().list({"configurable": {"thread_id": thread_id}}))
+        records = []
+        for checkpoint_tuple in reversed(tuples):
+            records.append({
+                "config": checkpoint_tuple.config["configurable"],
+                "parent_checkpoint_id": (checkpoint_tuple.parent_config or {}).get("configurable", {}).get("checkpoint_id"),
+                "checkpoint": self._encode(checkpoint_tuple.checkpoint),
+                "metadata": self._encode(checkpoint_tuple.metadata),
+                "writes": [[task_id, channel, self._encode(value)] for task_id, channel, value in checkpoint_tuple.pending_writes or []],
+            })
+        path = self._snapshot_path(thread_id)
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump({"thread_id": thread_id, "records": records}, f)
+        os.replace(path + ".tmp", path)
+
+        super().delete_thread(thread_id)
+        size, _ = self._resident.pop(thread_id)
+        self._resident_bytes -= size
+        self._evictions += 1
+        logger.info(f"Evicted thread {thread_id} to disk ({size} bytes)")
+
+    def _rehydrate(self, thread_id: str):
+        path = self._snapshot_path(thread_id)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+
+        # Sizes are measured as in put/put_writes: only the channel versions that
+        # changed from the previous checkpoint of the namespace, plus the writes
+        size = 0
+        previous_versions: Dict[str, dict] = {}
+        for record in snapshot["records"]:
+            checkpoint = self._decode(record["checkpoint"])
+            metadata = self._decode(record["metadata"])
+            checkpoint_ns = record["config"].get("checkpoint_ns", "")
+            config = {"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": record["parent_checkpoint_id"],
+            }}
+            saved_config = super().put(config, checkpoint, metadata, checkpoint["channel_versions"])
+            previous = previous_versions.get(checkpoint_ns, {})
+            changed = {k: v for k, v in checkpoint["channel_versions"].items() if previous.get(k) != v}
+            size += self._values_size(checkpoint, changed)
+            previous_versions[checkpoint_ns] = checkpoint["channel_versions"]
+
+            writes_by_task = OrderedDict()
+            for task_id, channel, value in record["writes"]:
+                writes_by_task.setdefault(task_id, []).append((channel, self._decode(value)))
+            for task_id, writes in writes_by_task.items():
+                super().put_writes(saved_config, writes, task_id)
+                size += self._writes_size(writes)
+
+        os.remove(path)
+        self._resident[thread_id] = [size, time.monotonic()]
+        self._resident_bytes += size
+        self._rehydrations += 1
+        logger.info(f"Rehydrated thread {thread_id} from disk ({size} bytes)")
+
+    def _encode(self, value) -> list:
+        type_, data = self.serde.dumps_typed(value)
+        return [type_, base64.b64encode(data).decode("ascii")]
+
+    def _decode(self, value: list):
+        return self.serde.loads_typed((value[0], base64.b64decode(value[1])))
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "resident_bytes": self._resident_bytes,
+                "resident_threads": len(self._resident),
+                "max_bytes": self.max_bytes,
+                "spilled_threads": len([f for f in os.listdir(self.spill_dir) if f.endswith(".json.gz")]),
+                "evictions": self._evictions,
+                "rehydrations": self._rehydrations,
+            }
+
+    # --- BaseCheckpointSaver API ---
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with self._resident_thread(config["configurable"]["thread_id"]):
+            return super().get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        # Without a thread only the threads in memory are listed. The result is
+        # materialized under the lock so an eviction cannot cut the iteration short.
+        with self._resident_thread(config["configurable"]["thread_id"] if config else None):
+            return iter(list(super().list(config, filter=filter, before=before, limit=limit)))
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        with self._resident_thread(thread_id):
+            saved_config = super().put(config, checkpoint, metadata, new_versions)
+            self._touch(thread_id, self._values_size(checkpoint, new_versions))
+            return saved_config
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        with self._resident_thread(thread_id):
+            super().put_writes(config, writes, task_id, task_path)
+            self._touch(thread_id, self._writes_size(writes))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            super().delete_thread(thread_id)
+            size, _ = self._resident.pop(thread_id, [0, 0.0])
+            self._resident_bytes -= size
+            if os.path.exists(self._snapshot_path(thread_id)):
+                os.remove(self._snapshot_path(thread_id))
+
+    # Loading a snapshot from disk, evicting or waiting for the lock should not block the event loop
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        for checkpoint_tuple in await asyncio.to_thread(self.list, config, filter=filter, before=before, limit=limit):
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+
+def create_checkpointer(name: str):
+    """
+    Build the checkpointer for an agent graph from CHECKPOINTER_URL:
+    'memory' (in-process, bounded and spilled to disk), 'sqlite:///path.sqlite' or 'postgresql://...'.
+    Each agent gets its own tables so thread_ids do not collide between graphs.
+    """
+    if CHECKPOINTER_URL == "memory":
+        logger.info(f"Checkpointer for {name}: BoundedMemorySaver ({MEMORY_BUDGET_MB} MB)")
+        return BoundedMemorySaver(
+            spill_dir=os.path.join(MEMORY_SPILL_DIR, name),
+            max_bytes=MEMORY_BUDGET_MB * 1024 * 1024,
+            ttl_seconds=MEMORY_THREAD_TTL,
+        )
+    logger.info(f"Checkpointer for {name}: {CHECKPOINTER_URL.split('://')[0]}")
+    return SQLCheckpointSaver(CHECKPOINTER_URL, table_prefix=name, batch_size=CHECKPOINTER_BATCH_SIZE)
+
+
+def flush_checkpointer(checkpointer):
+    """Persist the buffered checkpoints of a turn (no-op for checkpointers without buffer)"""
+    if hasattr(checkpointer, "flush"):
+        checkpointer.flush()
+
+
+async def aflush_checkpointer(checkpointer):
+    if hasattr(checkpointer, "aflush"):
+        await checkpointer.aflush()
@@ -0,0 +1,97 @@
+from typing import List, Optional
+
+from langchain_core.messages import AnyMessage, HumanMessage, SystemMessage, ToolMessage
+
+# Aproximación sin tokenizer: ~4 caracteres por token para texto en español/inglés
+CHARS_PER_TOKEN = 4
+# Por debajo de este tamaño un resultado de herramienta se deja tal cual
+MIN_ELIDED_CHARS = 600
+PREVIEW_CHARS = 200
+
+SUMMARY_SYSTEM_PROMPT = """Eres el encargado de mantener la memoria de una conversación entre un usuario y una agencia de viajes.
+Recibes el resumen anterior (si existe) y los mensajes nuevos que ya no caben en el contexto.
+Devuelve un único resumen actualizado, en español y en menos de 250 palabras, que conserve:
+- destino, fechas, origen, número de viajeros, presupuesto e intereses del usuario
+- vuelos y hoteles que el usuario ha elegido o descartado (aerolínea/hotel y precio)
+- si ya se generó un itinerario y las preferencias expresadas sobre él
+- preguntas pendientes de respuesta
+No incluyas listados completos de vuelos u hoteles ni el texto íntegro de itinerarios."""
+
+
+def estimate_tokens(messages: List[AnyMessage]) -> int:
+    return sum(len(str(msg.content)) for msg in messages) // CHARS_PER_TOKEN
+
+
+def turn_starts(messages: List[AnyMessage]) -> List[int]:
+    """Índices de los HumanMessage: los únicos puntos donde se puede cortar sin dejar ToolMessages huérfanos"""
+    return [i for i, msg in enumerate(messages) if isinstance(msg, HumanMessage)]
+
+
+def window_start(messages: List[AnyMessage], max_tokens: int, keep_tool_turns: int = 1) -> int:
+    """
+    Primer mensaje de la ventana más larga que empieza en un turno de usuario y
+    cabe en max_tokens. El turno actual se incluye siempre, aunque no quepa.
+    """
+    starts = turn_starts(messages)
+    if not starts:
+        return 0
+    chosen = starts[-1]
+    for start in reversed(starts[:-1]):
+        if estimate_tokens(elide_stale_tool_messages(messages[start:], keep_tool_turns)) > max_tokens:
+            break
+        chosen = start
+    return chosen
+
+
+def elide_stale_tool_messages(messages: List[AnyMessage], keep_last_turns: int = 1) -> List[AnyMessage]:
+    """
+    Sustituye los resultados grandes de herramientas de turnos anteriores por un
+    extracto. Los datos siguen en el estado (last_flight_info, last_hotel_info).
+    """
+    starts = turn_starts(messages)
+    if keep_last_turns <= 0:
+        cutoff = len(messages)
+    elif len(starts) >= keep_last_turns:
+        cutoff = starts[-keep_last_turns]
+    else:
+        cutoff = 0
+    elided = []
+    for i, msg in enumerate(messages):
+        content = str(msg.content)
+        if i < cutoff and isinstance(msg, ToolMessage) and len(content) > MIN_ELIDED_CHARS:
+            msg = msg.model_copy(update={"content": (
+                f"{content[:PREVIEW_CHARS]}... [resultado de {msg.name or 'la herramienta'} omitido: "
+                f"{len(content)} caracteres de un turno anterior]"
+            )})
+        elided.append(msg)
+    return elided
+
+
+def build_context(
+    system_prompt: str,
+    messages: List[AnyMessage],
+    summary: Optional[str],
+    summarized_until: int,
+    max_tokens: int,
+    keep_tool_turns: int,
+) -> List[AnyMessage]:
+    """
+    Mensajes que se envían al LLM: prompt de sistema, resumen de lo anterior y
+    la ventana reciente con los resultados antiguos de herramientas recortados.
+    Nada se descarta sin estar resumido: la ventana empieza como tarde donde acaba el resumen.
+    """
+    start = min(window_start(messages, max_tokens, keep_tool_turns), summarized_until) if summary else 0
+    # Gemini solo admite un mensaje de sistema al principio: el resumen va dentro
+    if summary:
+        system_prompt = f"{system_prompt}\n\n    Resumen de la conversación anterior:\n{summary}"
+    return [SystemMessage(content=system_prompt)] + elide_stale_tool_messages(messages[start:], keep_tool_turns)
+
+
+def summary_messages(previous_summary: Optional[str], messages: List[AnyMessage]) -> List[AnyMessage]:
+    transcript = "\n".join(
+        f"{type(msg).__name__.replace('Message', '')}: {msg.content}" for msg in elide_stale_tool_messages(messages, keep_last_turns=0) if msg.content
+    )
+    return [
+        SystemMessage(content=SUMMARY_SYSTEM_PROMPT),
+        HumanMessage(content=f"Resumen anterior:\n{previous_summary or '(ninguno)'}\n\nMensajes nuevos:\n{transcript}"),
+    ]
@@ -1,52 +1,75 @@
+import hashlib
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from src.agents.core import core_agent
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, AIMessageChunk, ToolMessage
+from src.agents.core import core_agent, checkpointer as core_checkpointer
 from src.agents.agente import travel_agent
 from src.utils.logger_config import setup_logger
+from src.utils.checkpointer import flush_checkpointer, aflush_checkpointer
 from typing import Dict, Any
 
 
 # Create logger for this module
 logger = setup_logger('api_agent.graph')
 
-def get_messages(thread_id: str):
-    config = {"configurable": {"thread_id": thread_id}}
-    messages = travel_agent.graph.get_state(config)[0].get('messages', [])
-    
+def transcript_entries(messages) -> list:
+    """
+    (index, message) pairs shown in the chat: every user message and the final
+    answer of each turn (the message right before the next user message, or the
+    last one if the turn has finished). The index is the position in the thread
+    state, which only grows, so it can be used as a cursor.
+    """
     def format(msg):
         return {
             'role': 'user' if isinstance(msg, HumanMessage) else 'assistant',
             'content': msg.content
         }
 
-    if not messages:
-        return []
-    elif len(messages) == 1:
-        return [format(messages[0])]
-    else:
-        respuesta = []
-        for i in range(1, len(messages)):
-            if isinstance(messages[i], HumanMessage):
-                respuesta.append(format(messages[i-1]))
-                respuesta.append(format(messages[i]))
-        respuesta.append(format(messages[-1]))
-        return respuesta
+    indexes = set()
+    for i, msg in enumerate(messages):
+        if isinstance(msg, HumanMessage):
+            indexes.add(i)
+            if i > 0:
+                indexes.add(i - 1)
+    # A turn still in progress (pending tool calls or tool results) is not shown yet
+    if messages and not isinstance(messages[-1], ToolMessage) and not getattr(messages[-1], 'tool_calls', None):
+        indexes.add(len(messages) - 1)
+    return [(i, format(messages[i])) for i in sorted(indexes)]
 
-def process_message(message: str, thread_id: str) -> dict:
-    """Process a single message and return the response and reasoning chain"""
-    logger.info(f"Processing message for thread {thread_id}")
-    
-    # Setup config for memory
+def format_messages(messages) -> list:
+    return [entry for _, entry in transcript_entries(messages)]
+
+def get_messages(thread_id: str):
     config = {"configurable": {"thread_id": thread_id}}
-    
-    # Setup state
-    state = {"messages": [HumanMessage(content=message)]}
-    logger.debug(f"Initial state: {state}")
-    
-    # Process message through the graph
-    response = core_agent.invoke(state, config)
+    messages = travel_agent.graph.get_state(config)[0].get('messages', [])
+    return format_messages(messages)
+
+async def aget_thread_snapshot(thread_id: str):
+    config = {"configurable": {"thread_id": thread_id}}
+    return await travel_agent.graph.aget_state(config)
+
+def messages_etag(thread_id: str, snapshot) -> str:
+    """
+    Version of the thread: the latest checkpoint id changes with every new message.
+    A client that already holds this version has nothing new to fetch, whatever its cursor.
+    """
+    checkpoint_id = (snapshot.config or {}).get("configurable", {}).get("checkpoint_id", "empty")
+    return '"' + hashlib.sha1(f"{thread_id}:{checkpoint_id}".encode()).hexdigest() + '"'
+
+def messages_page(snapshot, since: int, limit: int) -> dict:
+    """Transcript entries after the cursor 'since', at most 'limit', plus the cursor for the next call"""
+    messages = snapshot.values.get('messages', [])
+    entries = [(i, entry) for i, entry in transcript_entries(messages) if i >= since]
+    page = entries[:limit]
+    return {
+        "messages": [entry for _, entry in page],
+        "cursor": page[-1][0] + 1 if page else since,
+        "has_more": len(entries) > limit
+    }
+
+def format_response(response: dict) -> dict:
+    """Build the API response (final answer + reasoning chain) from the graph output"""
     logger.info(f"Agent response: {response}")
 
     # Obtenemos los mensajes
@@ -61,10 +84,8 @@ def process_message(message: str, thread_id: str) -> dict:
         "reasoning_chain": "\n".join(message.pretty_repr(html=False) for message in last_interaction_messages)
     }
 
-
-
-def process_message_agente2(message: str, thread_id: str) -> dict:
-    """Process a single message and return the response and reasoning chain"""
+def build_input(message: str, thread_id: str):
+    """Build the graph input state and the memory config for a thread"""
     logger.info(f"Processing message for thread {thread_id}")
     
     # Setup config for memory
@@ -73,22 +94,68 @@ def process_message_agente2(message: str, thread_id: str) -> dict:
     # Setup state
     state = {"messages": [HumanMessage(content=message)]}
     logger.debug(f"Initial state: {state}")
+    return state, config
+
+def process_message(message: str, thread_id: str) -> dict:
+    """Process a single message and return the response and reasoning chain"""
+    state, config = build_input(message, thread_id)
     
     # Process message through the graph
-    response = travel_agent.graph.invoke(state, config)
-    logger.info(f"Agent response: {response}")
+    response = core_agent.invoke(state, config)
+    flush_checkpointer(core_checkpointer)
+    return format_response(response)
 
-    # Obtenemos los mensajes
-    messages = response["messages"]
+async def aprocess_message(message: str, thread_id: str) -> dict:
+    """Async version of process_message: does not block the event loop"""
+    state, config = build_input(message, thread_id)
+    response = await core_agent.ainvoke(state, config)
+    await aflush_checkpointer(core_checkpointer)
+    return format_response(response)
 
-    # Obtenemos los mensajes de la última interacción
-    last_interaction_messages = get_last_interaction_messages(messages)
-    logger.info(f"Last interaction messages: {last_interaction_messages}")
+def process_message_agente2(message: str, thread_id: str) -> dict:
+    """Process a single message and return the response and reasoning chain"""
+    state, config = build_input(message, thread_id)
     
-    return {
-        "response": messages[-1].content,
-        "reasoning_chain": "\n".join(message.pretty_repr(html=False) for message in last_interaction_messages)
-    }
+    # Process message through the graph
+    response = travel_agent.graph.invoke(state, config)
+    flush_checkpointer(travel_agent.checkpointer)
+    return format_response(response)
+
+async def aprocess_message_agente2(message: str, thread_id: str) -> dict:
+    """Async version of process_message_agente2: does not block the event loop"""
+    state, config = build_input(message, thread_id)
+    response = await travel_agent.graph.ainvoke(state, config)
+    await aflush_checkpointer(travel_agent.checkpointer)
+    return format_response(response)
+
+async def astream_message_agente2(message: str, thread_id: str):
+    """
+    Stream a turn of the travel agent as events:
+    tokens from call_tools_llm, tool start/end, node progress (including the
+    itinerary subgraph) and a final 'done' event with the same payload as /chat
+    """
+    state, config = build_input(message, thread_id)
+
+    async for namespace, mode, chunk in travel_agent.graph.astream(
+        state, config, stream_mode=["messages", "updates", "custom"], subgraphs=True
+    ):
+        if mode == "messages":
+            message_chunk, metadata = chunk
+            # Solo los tokens del orquestador, no los de herramientas o subgrafos
+            if namespace or metadata.get("langgraph_node") != "call_tools_llm":
+                continue
+            # call_tools_llm runs once per step: the id tells clients which LLM call a token belongs to
+            if isinstance(message_chunk, AIMessageChunk) and isinstance(message_chunk.content, str) and message_chunk.content:
+                yield {"type": "token", "content": message_chunk.content, "id": message_chunk.id}
+        elif mode == "custom":
+            yield chunk
+        elif mode == "updates":
+            for node in chunk:
+                yield {"type": "node", "node": node, "subgraph": "/".join(namespace)}
+
+    await aflush_checkpointer(travel_agent.checkpointer)
+    snapshot = await travel_agent.graph.aget_state(config)
+    yield {"type": "done", **format_response(snapshot.values)}
 
 def get_last_interaction_messages (messages):
     # Find the index of the last HumanMessage
@@ -0,0 +1,156 @@
+import asyncio
+import math
+import statistics
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from src.config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP2_ENABLED
+from src.utils.logger_config import setup_logger
+
+logger = setup_logger('api_agent.http_client')
+
+# Muestras de latencia que se conservan por host para los percentiles
+LATENCY_SAMPLES = 256
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("HTTP2_ENABLED=1 pero el paquete 'h2' no está instalado: se usa HTTP/1.1")
+        return False
+
+_HTTP2 = _http2_available()
+_LIMITS = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+
+
+def _timeout(timeout: Optional[float]) -> httpx.Timeout:
+    """Un timeout numérico es el de lectura; la conexión siempre usa HTTP_CONNECT_TIMEOUT."""
+    return httpx.Timeout(timeout if timeout is not None else HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+class _HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def as_dict(self) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50_ms": round(statistics.median(samples), 1) if samples else None,
+            "p95_ms": round(samples[math.ceil(len(samples) * 0.95) - 1], 1) if samples else None,
+            "max_ms": round(samples[-1], 1) if samples else None,
+        }
+
+
+_stats: Dict[str, _HostStats] = {}
+_stats_lock = threading.Lock()
+
+def _record(url: str, started: float, error: bool) -> None:
+    host = urlsplit(url).netloc
+    with _stats_lock:
+        stats = _stats.setdefault(host, _HostStats())
+        stats.requests += 1
+        stats.errors += int(error)
+        stats.samples.append((time.perf_counter() - started) * 1000)
+
+def latency_stats() -> Dict[str, Dict[str, Any]]:
+    with _stats_lock:
+        return {host: stats.as_dict() for host, stats in _stats.items()}
+
+
+# --- Clientes compartidos: uno síncrono por proceso y uno asíncrono por event loop ---
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+# Clave: el propio loop (no su id, que un loop nuevo puede reutilizar). La entrada se borra al
+# cerrar el cliente con su loop; si el loop se cierra sin shutdown_asyncgens(), en la siguiente
+# llamada a get_async_client (el generador registrado referencia al loop y lo mantiene vivo)
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple]" = weakref.WeakKeyDictionary()
+
+def get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(http2=_HTTP2, limits=_LIMITS, timeout=_timeout(None))
+    return _client
+
+async def _close_with_loop(client: httpx.AsyncClient):
+    # Generador asíncrono registrado en el loop: asyncio.run (y uvicorn) llaman a
+    # shutdown_asyncgens() antes de cerrar el loop, y eso ejecuta este finally
+    try:
+        yield
+    finally:
+        await client.aclose()
+        loop = asyncio.get_running_loop()
+        entry = _async_clients.get(loop)
+        if entry is not None and entry[0] is client:
+            del _async_clients[loop]
+
+async def _start(generator) -> None:
+    await generator.__anext__()
+
+def get_async_client() -> httpx.AsyncClient:
+    # Un AsyncClient queda ligado al loop en el que abre conexiones
+    loop = asyncio.get_running_loop()
+    for other in [other for other in list(_async_clients) if other.is_closed()]:
+        _async_clients.pop(other, None)
+    entry = _async_clients.get(loop)
+    if entry is None or entry[0].is_closed:
+        client = httpx.AsyncClient(http2=_HTTP2, limits=_LIMITS, timeout=_timeout(None))
+        closer = _close_with_loop(client)
+        # El loop solo guarda una referencia débil al generador: la fuerte la tiene la entrada.
+        # La tarea no se guarda: referencia al loop y la entrada no caducaría nunca
+        loop.create_task(_start(closer))
+        entry = _async_clients[loop] = (client, closer)
+    return entry[0]
+
+
+def request(method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+    started = time.perf_counter()
+    try:
+        response = get_client().request(method, url, timeout=_timeout(timeout), **kwargs)
+    except httpx.HTTPError:
+        _record(url, started, error=True)
+        raise
+    _record(url, started, error=response.status_code >= 500)
+    return response
+
+async def arequest(method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+    started = time.perf_counter()
+    try:
+        response = await get_async_client().request(method, url, timeout=_timeout(timeout), **kwargs)
+    except httpx.HTTPError:
+        _record(url, started, error=True)
+        raise
+    _record(url, started, error=response.status_code >= 500)
+    return response
+
+def post(url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+    return request("POST", url, timeout=timeout, **kwargs)
+
+async def apost(url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+    return await arequest("POST", url, timeout=timeout, **kwargs)
+
+
+async def aclose() -> None:
+    """Cierra los clientes al apagar la aplicación (el asíncrono del loop actual; el resto se cierran con su loop)."""
+    global _client
+    entry = _async_clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[1].aclose()
+    if _client is not None:
+        _client.close()
+        _client = None
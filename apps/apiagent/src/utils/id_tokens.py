@@ -0,0 +1,163 @@
+import asyncio
+import base64
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import ID_TOKEN_PROVIDER, ID_TOKEN_REFRESH_MARGIN, ID_TOKEN_LOCAL_LIFETIME
+from src.utils.logger_config import setup_logger
+
+logger = setup_logger('api_agent.id_tokens')
+
+# Si no se puede leer 'exp' del token se asume la vida estándar de Google (1 hora)
+DEFAULT_LIFETIME = 3600
+# Por debajo de este margen el token ya no se sirve: se pide uno nuevo en línea
+MIN_REMAINING = 30
+
+
+def _jwt_expiry(token: str) -> Optional[float]:
+    """Lee el claim 'exp' sin verificar la firma (la verifica quien recibe el token)."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, ValueError, TypeError):
+        return None
+
+
+class GoogleIdTokenProvider:
+    """ID tokens de Google para invocar Cloud Functions (metadata server o credenciales locales)."""
+
+    def fetch(self, audience: str) -> Tuple[str, float]:
+        import google.auth.transport.requests
+        from google.oauth2 import id_token
+
+        token = id_token.fetch_id_token(google.auth.transport.requests.Request(), audience)
+        return token, _jwt_expiry(token) or time.time() + DEFAULT_LIFETIME
+
+
+class LocalIdTokenProvider:
+    """
+    Sustituto sin red para desarrollo y pruebas: emite tokens con forma de JWT
+    (sin firma) y la vida indicada. Las Cloud Functions reales los rechazan.
+    """
+
+    def __init__(self, lifetime: float = ID_TOKEN_LOCAL_LIFETIME):
+        self.lifetime = lifetime
+        self.fetches = 0
+
+    def fetch(self, audience: str) -> Tuple[str, float]:
+        self.fetches += 1
+        expiry = time.time() + self.lifetime
+
+        def encode(data: dict) -> str:
+            return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+        token = f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode({'aud': audience, 'exp': int(expiry), 'n': self.fetches})}."
+        return token, expiry
+
+
+class IdTokenCache:
+    """
+    Reutiliza un ID token por audiencia hasta poco antes de que caduque. Dentro
+    del margen de refresco se sigue sirviendo el token vigente mientras un hilo
+    en segundo plano obtiene el siguiente, así ninguna búsqueda espera al
+    metadata server salvo la primera.
+    """
+
+    def __init__(self, provider, refresh_margin: float = ID_TOKEN_REFRESH_MARGIN):
+        self.provider = provider
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fetches = 0
+        self.background_refreshes = 0
+        self.failures = 0
+
+    def _audience_lock(self, audience: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(audience, threading.Lock())
+
+    def _fresh(self, audience: str) -> Optional[str]:
+        """Token servible sin esperar; lanza el refresco en segundo plano si toca."""
+        entry = self._tokens.get(audience)
+        if entry is None:
+            return None
+        token, expiry = entry
+        remaining = expiry - time.time()
+        if remaining <= MIN_REMAINING:
+            return None
+        if remaining <= self.refresh_margin:
+            self._refresh_in_background(audience)
+        self.hits += 1
+        return token
+
+    def _fetch(self, audience: str) -> str:
+        try:
+            token, expiry = self.provider.fetch(audience)
+        except Exception:
+            self.failures += 1
+            raise
+        self._tokens[audience] = (token, expiry)
+        self.fetches += 1
+        return token
+
+    def _refresh_in_background(self, audience: str) -> None:
+        with self._lock:
+            if audience in self._refreshing:
+                return
+            self._refreshing.add(audience)
+
+        def refresh():
+            try:
+                with self._audience_lock(audience):
+                    self._fetch(audience)
+                self.background_refreshes += 1
+            except Exception as e:
+                logger.warning(f"No se pudo refrescar el ID token de {audience}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(audience)
+
+        threading.Thread(target=refresh, name="id-token-refresh", daemon=True).start()
+
+    def get(self, audience: str) -> str:
+        token = self._fresh(audience)
+        if token is not None:
+            return token
+        # Una sola petición por audiencia aunque lleguen varias búsquedas a la vez
+        with self._audience_lock(audience):
+            token = self._fresh(audience)
+            return token if token is not None else self._fetch(audience)
+
+    async def aget(self, audience: str) -> str:
+        token = self._fresh(audience)
+        if token is not None:
+            return token
+        return await asyncio.to_thread(self.get, audience)
+
+    def invalidate(self, audience: str) -> None:
+        self._tokens.pop(audience, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "provider": type(self.provider).__name__,
+            "hits": self.hits,
+            "fetches": self.fetches,
+            "background_refreshes": self.background_refreshes,
+            "failures": self.failures,
+            "expires_in": {audience: round(expiry - now) for audience, (_, expiry) in self._tokens.items()},
+        }
+
+
+def create_provider(name: str = ID_TOKEN_PROVIDER):
+    if name == "local":
+        return LocalIdTokenProvider()
+    return GoogleIdTokenProvider()
+
+id_token_cache = IdTokenCache(create_provider())
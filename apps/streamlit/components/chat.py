@@ -1,15 +1,63 @@
+import json
 import streamlit as st
 import requests
 from config import AGENT_API_URL
 
+ETIQUETAS_HERRAMIENTAS = {
+    "flights_finder": "Buscando vuelos",
+    "hotels_finder": "Buscando hoteles",
+    "destination_explorer_tool": "Explorando destinos",
+    "itinerary_planner_tool": "Planificando itinerario",
+    "comprehensive_itinerary_generator_tool": "Generando itinerario detallado",
+}
+
 def importar_mensajes():
-    res = requests.get(f"{AGENT_API_URL}/messages",
-        params={
-            "thread_id": st.session_state.thread_id
-        }
-    )
-    res.raise_for_status()
-    return res.json()
+    """Trae solo los mensajes nuevos del hilo: cursor incremental y ETag para no repetir la descarga"""
+    caches = st.session_state.setdefault("historial_hilos", {})
+    cache = caches.setdefault(st.session_state.thread_id, {"messages": [], "cursor": 0, "etag": None})
+    while True:
+        res = requests.get(f"{AGENT_API_URL}/messages",
+            params={
+                "thread_id": st.session_state.thread_id,
+                "since": cache["cursor"]
+            },
+            headers={"If-None-Match": cache["etag"]} if cache["etag"] else {}
+        )
+        if res.status_code == 304:
+            break
+        res.raise_for_status()
+        pagina = res.json()
+        cache["messages"].extend(pagina["messages"])
+        cache["cursor"] = pagina["cursor"]
+        cache["etag"] = None if pagina["has_more"] else res.headers.get("ETag")
+        if not pagina["has_more"]:
+            break
+    return list(cache["messages"])
+
+def stream_respuesta(prompt, estado, resultado):
+    """
+    Consume /chat/stream: devuelve (id de la llamada al LLM, token) y actualiza el
+    estado con el progreso de las herramientas
+    """
+    with requests.post(f"{AGENT_API_URL}/chat/stream", json={
+        "message": prompt,
+        "thread_id": st.session_state.thread_id
+    }, stream=True) as res:
+        res.raise_for_status()
+        for linea in res.iter_lines(decode_unicode=True):
+            if not linea or not linea.startswith("data: "):
+                continue
+            evento = json.loads(linea[len("data: "):])
+            if evento["type"] == "token":
+                yield evento.get("id"), evento["content"]
+            elif evento["type"] == "tool_start":
+                estado.update(label=f"{ETIQUETAS_HERRAMIENTAS.get(evento['tool'], evento['tool'])}...")
+            elif evento["type"] == "node" and evento.get("subgraph"):
+                estado.write(f"· {evento['node']}")
+            elif evento["type"] == "done":
+                resultado.update(evento)
+            elif evento["type"] == "error":
+                raise RuntimeError(evento["message"])
 
 def chat():
 
@@ -35,26 +83,32 @@ def chat():
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner("Pensando..."):
-                try:
-                    res = requests.post(f"{AGENT_API_URL}/chat", json={
-                        "message": prompt,
-                        "thread_id": st.session_state.thread_id
-                    })
-                    res.raise_for_status()
-                    result = res.json()
-                    reply = result["response"]
-                    reasoning = result["reasoning_chain"]
-                except Exception as e:
-                    reply = f"❌ Error: {str(e)}"
-                    reasoning = ""
-
+            resultado = {}
+            try:
+                estado = st.status("Pensando...")
+                # Cada llamada del orquestador al LLM sustituye a la anterior en el mismo hueco
+                hueco = st.empty()
+                texto, llamada = "", None
+                for id_llamada, token in stream_respuesta(prompt, estado, resultado):
+                    if id_llamada != llamada:
+                        texto, llamada = "", id_llamada
+                    texto += token
+                    hueco.markdown(texto + "▌")
+                estado.update(label="Listo", state="complete")
+                reply = resultado.get("response", texto)
+                reasoning = resultado.get("reasoning_chain", "")
+                # La respuesta final reemplaza lo que se fue mostrando (también si no llegó como tokens)
+                hueco.markdown(reply)
+            except Exception as e:
+                reply = f"❌ Error: {str(e)}"
+                reasoning = ""
                 st.markdown(reply)
-                if reasoning:
-                    with st.expander("Ver cadena de razonamiento"):
-                        st.text(reasoning)
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": reply,
-                    "reasoning": reasoning
-                })
\ No newline at end of file
+
+            if reasoning:
+                with st.expander("Ver cadena de razonamiento"):
+                    st.text(reasoning)
+            st.session_state.messages.append({
+                "role": "assistant", 
+                "content": reply,
+                "reasoning": reasoning
+            })
@@ -0,0 +1,150 @@
+"""
+Benchmark de concurrencia de apidata: Flask bajo gunicorn con hilos (modo wsgi)
+frente al modo asíncrono (asgi) con las búsquedas en el event loop.
+
+Levanta una Cloud Function falsa que tarda --retardo segundos en responder,
+arranca cada modo con gunicorn tal y como lo hace la imagen y lanza --peticiones
+búsquedas simultáneas a /vuelos, todas distintas para que la caché de la
+pasarela no las agrupe.
+
+    python benchmarks/apidata_concurrencia.py --peticiones 200 --retardo 2
+
+Necesita las dependencias de terraform/modules/apidata/requirements.txt.
+"""
+import argparse
+import asyncio
+import math
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+APIDATA = Path(__file__).resolve().parents[1] / "terraform" / "modules" / "apidata"
+COMUN = APIDATA.parent / "comun"
+
+MODOS = {
+    "wsgi (gunicorn, 1 proceso x 8 hilos)": ["--workers", "1", "--threads", "8", "--timeout", "0", "app:app"],
+    "asgi (gunicorn + uvicorn, 1 proceso)": ["--workers", "1", "-k", "uvicorn.workers.UvicornWorker", "--timeout", "0", "asgi:app"],
+}
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def servir_funcion_falsa(puerto, retardo, tam_kb):
+    app = FastAPI()
+    cuerpo = b"[" + b",".join([b'{"Aerolinea":"IB","Precio":100}'] * (tam_kb * 1024 // 32)) + b"]"
+
+    @app.post("/")
+    async def buscar(request: Request):
+        await request.body()
+        await asyncio.sleep(retardo)
+        return Response(cuerpo, media_type="application/json")
+
+    uvicorn.run(app, host="127.0.0.1", port=puerto, log_level="error", backlog=4096)
+
+
+def funcion_falsa(retardo, tam_kb):
+    # En su propio proceso, para que no compita por la CPU con el cliente del benchmark
+    puerto = puerto_libre()
+    proceso = subprocess.Popen([sys.executable, __file__, "--funcion-falsa", str(puerto),
+                                "--retardo", str(retardo), "--tam-kb", str(tam_kb)])
+    url = f"http://127.0.0.1:{puerto}/"
+    for _ in range(200):
+        try:
+            httpx.get(url, timeout=1)
+            return proceso, url
+        except httpx.HTTPError:
+            time.sleep(0.05)
+    proceso.kill()
+    raise RuntimeError("No arrancó la Cloud Function falsa")
+
+
+def arrancar(argumentos, url_funcion, directorio):
+    puerto = puerto_libre()
+    entorno = {
+        **os.environ,
+        "FUNC_VUELOS_URL": url_funcion,
+        "GATEWAY_CACHE_TTL": "0",
+        "OLTP_URL": f"sqlite:///{directorio}/apidata.sqlite",
+        "WARMUP_REINTENTOS": "0",
+        # Módulos compartidos que la imagen copia junto a apidata
+        "PYTHONPATH": str(COMUN),
+    }
+    proceso = subprocess.Popen(["gunicorn", "-b", f"127.0.0.1:{puerto}", "--backlog", "4096", *argumentos],
+                               cwd=APIDATA, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{puerto}"
+    for _ in range(200):
+        try:
+            httpx.get(f"{url}/metrics/cache", timeout=1)
+            return proceso, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proceso.kill()
+    raise RuntimeError(f"No arrancó: {argumentos}")
+
+
+async def lanzar(url, peticiones, timeout, ruta="/vuelos"):
+    limites = httpx.Limits(max_connections=peticiones, max_keepalive_connections=peticiones)
+    async with httpx.AsyncClient(timeout=timeout, limits=limites) as cliente:
+        async def una(i):
+            inicio = time.perf_counter()
+            try:
+                r = await cliente.post(f"{url}{ruta}", json={"origen": "MAD", "destino": "LIS", "n": i})
+                ok = r.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            return ok, time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(una(i) for i in range(peticiones)))
+        return resultados, time.perf_counter() - inicio
+
+
+def main(args):
+    if args.funcion_falsa:
+        return servir_funcion_falsa(args.funcion_falsa, args.retardo, args.tam_kb)
+    funcion, url_funcion = funcion_falsa(args.retardo, args.tam_kb)
+    print(f"{args.peticiones} búsquedas simultáneas, Cloud Function de {args.retardo}s y {args.tam_kb} KB\n")
+    print(f"{'modo':<40} {'total':>8} {'req/s':>8} {'p50':>8} {'p95':>8} {'errores':>8}")
+
+    def imprimir(nombre, resultados, total):
+        tiempos = sorted(t for ok, t in resultados if ok)
+        errores = sum(not ok for ok, _ in resultados)
+        p50 = statistics.median(tiempos) if tiempos else math.nan
+        p95 = tiempos[math.ceil(len(tiempos) * 0.95) - 1] if tiempos else math.nan
+        print(f"{nombre:<40} {total:7.1f}s {len(tiempos) / total:8.1f} {p50:7.1f}s {p95:7.1f}s {errores:8}")
+
+    # Referencia: el mismo cliente contra la Cloud Function falsa, sin pasarela
+    imprimir("directo a la Cloud Function", *asyncio.run(lanzar(url_funcion.rstrip("/"), args.peticiones, args.timeout, "/")))
+    with tempfile.TemporaryDirectory() as directorio:
+        for nombre, argumentos in MODOS.items():
+            proceso, url = arrancar(argumentos, url_funcion, directorio)
+            try:
+                imprimir(nombre, *asyncio.run(lanzar(url, args.peticiones, args.timeout)))
+            finally:
+                proceso.terminate()
+                proceso.wait()
+    funcion.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de concurrencia de apidata")
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--retardo", type=float, default=2.0, help="Segundos que tarda la Cloud Function falsa")
+    parser.add_argument("--tam-kb", type=int, default=64, help="Tamaño de la respuesta de la Cloud Function")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--funcion-falsa", type=int, metavar="PUERTO", help=argparse.SUPPRESS)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,68 @@
+"""
+Benchmark de carga para el endpoint /chat del apiagent.
+
+Lanza N conversaciones concurrentes (un thread_id distinto por petición) contra
+un apiagent levantado con un único worker de uvicorn y mide throughput y latencias.
+Ejecutarlo contra el commit anterior (ruta bloqueante) y contra el actual
+(graph.ainvoke) para comparar:
+
+    uvicorn src.app:app --workers 1 --port 8000
+    python benchmarks/carga_chat.py --url http://localhost:8000 --concurrencia 32 --peticiones 64
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+async def una_peticion(client: httpx.AsyncClient, url: str, endpoint: str, mensaje: str) -> float:
+    inicio = time.perf_counter()
+    response = await client.post(f"{url}{endpoint}", json={
+        "message": mensaje,
+        "thread_id": f"bench-{uuid.uuid4()}"
+    })
+    response.raise_for_status()
+    return time.perf_counter() - inicio
+
+
+async def main(args):
+    semaforo = asyncio.Semaphore(args.concurrencia)
+    latencias = []
+    errores = 0
+
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        async def lanzar():
+            nonlocal errores
+            async with semaforo:
+                try:
+                    latencias.append(await una_peticion(client, args.url, args.endpoint, args.mensaje))
+                except Exception as e:
+                    errores += 1
+                    print(f"[ERROR] {e}")
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(lanzar() for _ in range(args.peticiones)))
+        total = time.perf_counter() - inicio
+
+    print(f"Endpoint:      {args.endpoint}")
+    print(f"Peticiones:    {args.peticiones} (concurrencia {args.concurrencia}, errores {errores})")
+    print(f"Tiempo total:  {total:.2f}s")
+    print(f"Throughput:    {len(latencias) / total:.2f} req/s")
+    if latencias:
+        latencias.sort()
+        print(f"Latencia p50:  {statistics.median(latencias):.2f}s")
+        print(f"Latencia p95:  {latencias[int(len(latencias) * 0.95) - 1]:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de carga del apiagent")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/chat")
+    parser.add_argument("--mensaje", default="Hola, ¿qué me recomiendas para un fin de semana en Europa?")
+    parser.add_argument("--concurrencia", type=int, default=32)
+    parser.add_argument("--peticiones", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=300)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,84 @@
+"""
+Benchmark de latencia de checkpoint por turno: MemorySaver vs SQLCheckpointSaver.
+
+Usa un grafo sin LLM con la misma forma que el orquestador (llm -> tools -> llm)
+y payloads de herramientas de tamaño realista, de modo que solo se mide el coste
+de guardar y leer checkpoints.
+
+    PYTHONPATH=apps/apiagent python benchmarks/checkpointer.py --turnos 50
+    PYTHONPATH=apps/apiagent python benchmarks/checkpointer.py --url postgresql://...
+"""
+import argparse
+import asyncio
+import operator
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, StateGraph
+
+from src.utils.checkpointer import SQLCheckpointSaver, aflush_checkpointer
+
+
+class EstadoBench(TypedDict):
+    messages: Annotated[list[AnyMessage], operator.add]
+    last_flight_info: str
+
+
+def construir_grafo(checkpointer, tam_payload: int):
+    def llm(state: EstadoBench):
+        if isinstance(state["messages"][-1], ToolMessage):
+            return {"messages": [AIMessage(content="Aquí tienes los vuelos.")]}
+        return {"messages": [AIMessage(content="", tool_calls=[{"name": "flights_finder", "args": {}, "id": str(uuid.uuid4())}])]}
+
+    def tools(state: EstadoBench):
+        payload = "x" * tam_payload
+        tool_call_id = state["messages"][-1].tool_calls[0]["id"]
+        return {"messages": [ToolMessage(content=payload, tool_call_id=tool_call_id)], "last_flight_info": payload}
+
+    builder = StateGraph(EstadoBench)
+    builder.add_node("llm", llm)
+    builder.add_node("tools", tools)
+    builder.set_entry_point("llm")
+    builder.add_conditional_edges("llm", lambda s: "tools" if s["messages"][-1].tool_calls else END)
+    builder.add_edge("tools", "llm")
+    return builder.compile(checkpointer=checkpointer)
+
+
+async def medir(nombre: str, checkpointer, args) -> None:
+    grafo = construir_grafo(checkpointer, args.tam_payload)
+    config = {"configurable": {"thread_id": f"bench-{uuid.uuid4()}"}}
+    latencias = []
+    for turno in range(args.turnos):
+        inicio = time.perf_counter()
+        await grafo.ainvoke({"messages": [HumanMessage(content=f"Turno {turno}")]}, config)
+        await aflush_checkpointer(checkpointer)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    # El último turno es el que arrastra todo el hilo: se guarda antes de ordenar
+    ultimo = latencias[-1]
+    latencias.sort()
+    print(f"{nombre:<22} p50 {statistics.median(latencias):7.2f} ms   "
+          f"p95 {latencias[int(len(latencias) * 0.95) - 1]:7.2f} ms   "
+          f"último turno {ultimo:7.2f} ms")
+
+
+async def main(args):
+    print(f"{args.turnos} turnos, payload de herramienta de {args.tam_payload} bytes")
+    await medir("MemorySaver", MemorySaver(), args)
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url or f"sqlite:///{os.path.join(tmp, 'bench.sqlite')}"
+        await medir(f"SQL ({url.split('://')[0]})", SQLCheckpointSaver(url, table_prefix="bench", batch_size=args.batch_size), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de checkpointers")
+    parser.add_argument("--turnos", type=int, default=50)
+    parser.add_argument("--tam-payload", dest="tam_payload", type=int, default=20_000)
+    parser.add_argument("--batch-size", dest="batch_size", type=int, default=50)
+    parser.add_argument("--url", default=None, help="URL SQL alternativa (por defecto SQLite temporal)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""
+Micro-benchmark de la ingesta de coches: preparación del DataFrame y filtrado de
+duplicados, fila a fila (implementación anterior) frente a la vectorizada.
+
+Genera N registros con la forma de procesar_alquileres y un conjunto de claves
+ya existentes en BigQuery que solapa con la mitad de ellos.
+
+    python benchmarks/coches_dedup.py --filas 100000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "terraform" / "modules" / "function_coches"))
+from transformaciones import COLUMNAS_CLAVE, extraer_asientos, filtrar_nuevos, preparar_dataframe  # noqa: E402
+
+
+# --- Implementación anterior (fila a fila), como referencia ---
+def extraer_asientos_anterior(valor):
+    try:
+        if isinstance(valor, (int, float)):
+            return int(valor)
+        if isinstance(valor, str):
+            return sum(int(p) for p in valor.split("+") if p.isdigit())
+    except Exception:
+        pass
+    return 0
+
+def preparar_dataframe_anterior(registros):
+    df = pd.DataFrame(registros)
+    df['Asientos'] = df['Asientos'].apply(extraer_asientos_anterior)
+    df['Precio'] = df['Precio'].fillna(0.0)
+    for col in ['Ciudad', 'Compañía', 'Vehículo', 'Categoría', 'Transmisión']:
+        df[col] = df[col].fillna('').astype(str)
+    return df
+
+def filtrar_nuevos_anterior(df, existentes):
+    claves_existentes = set(existentes[COLUMNAS_CLAVE].itertuples(index=False, name=None))
+    return df[~df.apply(lambda row: (row['Ciudad'], row['Compañía'], row['Vehículo']) in claves_existentes, axis=1)]
+
+
+def generar_registros(n: int, semilla: int = 42):
+    rnd = random.Random(semilla)
+    asientos = [5, 4, 7, "4+1", "2+2", "5", None, 9.0]
+    return [{
+        'Ciudad': rnd.choice(["Madrid", "Roma", "París", "Lisboa"]),
+        'Compañía': f"Proveedor {rnd.randrange(40)}",
+        'Vehículo': f"Modelo {rnd.randrange(n // 4 + 1)}",
+        'Categoría': rnd.choice(["Pequeño", "Mediano", "SUV", None]),
+        'Asientos': rnd.choice(asientos),
+        'Transmisión': rnd.choice(["Manual", "Automático", None]),
+        'Precio': round(rnd.uniform(20, 400), 2),
+    } for _ in range(n)]
+
+
+def medir(nombre: str, funcion, repeticiones: int):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    print(f"{nombre:<40} {min(tiempos):10.1f} ms")
+    return resultado
+
+
+def main(args):
+    registros = generar_registros(args.filas)
+    existentes = pd.DataFrame(generar_registros(args.filas // 2, semilla=7) + registros[: args.filas // 2])[COLUMNAS_CLAVE]
+    print(f"{args.filas} filas, {len(existentes)} claves existentes (mejor de {args.repeticiones})\n")
+
+    asientos = pd.DataFrame(registros)['Asientos']
+    medir("extraer_asientos (apply)", lambda: asientos.apply(extraer_asientos_anterior), args.repeticiones)
+    medir("extraer_asientos (factorize)", lambda: extraer_asientos(asientos), args.repeticiones)
+
+    df_anterior = medir("preparar_dataframe (fila a fila)", lambda: preparar_dataframe_anterior(registros), args.repeticiones)
+    df_nuevo = medir("preparar_dataframe (vectorizado)", lambda: preparar_dataframe(registros), args.repeticiones)
+    assert df_anterior['Asientos'].tolist() == df_nuevo['Asientos'].tolist()
+
+    nuevos_anterior = medir("filtrado de duplicados (apply + set)", lambda: filtrar_nuevos_anterior(df_nuevo, existentes), args.repeticiones)
+    nuevos = medir("filtrado de duplicados (hash + isin)", lambda: filtrar_nuevos(df_nuevo, existentes), args.repeticiones)
+    # La versión vectorizada además quita claves repetidas dentro del propio lote
+    assert set(nuevos.index) <= set(nuevos_anterior.index)
+    print(f"\nFilas nuevas: {len(nuevos_anterior)} (anterior) / {len(nuevos)} (sin repetidos en el lote)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la ingesta de coches")
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    main(parser.parse_args())
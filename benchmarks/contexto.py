@@ -0,0 +1,63 @@
+"""
+Tokens enviados al orquestador por turno en hilos largos: historial completo vs
+ventana con resumen y recorte de resultados de herramientas.
+
+Simula turnos con la forma real del agente (pregunta, tool_call, resultado de
+vuelos/hoteles grande, respuesta) y aplica la misma lógica que manage_context
+y call_tools_llm, con un resumen de tamaño fijo en lugar de la llamada a Gemini.
+
+    PYTHONPATH=apps/apiagent python benchmarks/contexto.py --turnos 50
+"""
+import argparse
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src.utils.context import build_context, estimate_tokens, window_start
+
+SYSTEM_PROMPT = "x" * 9_000  # tamaño aproximado de TOOLS_SYSTEM_PROMPT
+RESUMEN = "r" * 1_500
+
+
+def turno(i: int, tam_tool: int):
+    tool_call_id = str(uuid.uuid4())
+    herramienta = "flights_finder" if i % 2 else "hotels_finder"
+    return [
+        HumanMessage(content=f"Pregunta {i}: busca opciones para mi viaje " + "." * 200),
+        AIMessage(content="", tool_calls=[{"name": herramienta, "args": {}, "id": tool_call_id}]),
+        ToolMessage(content="v" * tam_tool, tool_call_id=tool_call_id, name=herramienta),
+        AIMessage(content="Estas son las mejores opciones: " + "a" * 1_500),
+    ]
+
+
+def main(args):
+    messages, resumen, resumido_hasta = [], None, 0
+    total_completo = total_gestionado = 0
+    print(f"{'turno':>5} {'completo':>10} {'gestionado':>11}")
+    for i in range(1, args.turnos + 1):
+        messages = messages + turno(i, args.tam_tool)[:1]
+        # manage_context: resumir lo que sale de la ventana si es suficiente
+        inicio = window_start(messages, args.max_tokens, args.keep_tool_turns)
+        if estimate_tokens(messages[resumido_hasta:inicio]) >= args.min_resumen:
+            resumen, resumido_hasta = RESUMEN, inicio
+
+        completo = estimate_tokens([HumanMessage(content=SYSTEM_PROMPT)] + messages)
+        gestionado = estimate_tokens(build_context(SYSTEM_PROMPT, messages, resumen, resumido_hasta, args.max_tokens, args.keep_tool_turns))
+        total_completo += completo
+        total_gestionado += gestionado
+        if i % 5 == 0 or i == 1:
+            print(f"{i:>5} {completo:>10} {gestionado:>11}")
+        messages = messages + turno(i, args.tam_tool)[1:]
+
+    print(f"\nTokens de entrada totales en {args.turnos} turnos: completo {total_completo}, gestionado {total_gestionado} "
+          f"({100 * (1 - total_gestionado / total_completo):.0f}% menos)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de tokens por turno del orquestador")
+    parser.add_argument("--turnos", type=int, default=50)
+    parser.add_argument("--tam-tool", dest="tam_tool", type=int, default=15_000)
+    parser.add_argument("--max-tokens", dest="max_tokens", type=int, default=8_000)
+    parser.add_argument("--min-resumen", dest="min_resumen", type=int, default=2_000)
+    parser.add_argument("--keep-tool-turns", dest="keep_tool_turns", type=int, default=1)
+    main(parser.parse_args())
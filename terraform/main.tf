@@ -12,7 +12,11 @@ module "bigquery" {
   bq_dataset = var.bq_dataset
   
   tables = [
+    # Cambiar el particionado de una tabla obliga a recrearla: los vuelos se escriben en una tabla nueva,
+    # particionada, y la migración única de function_vuelos copia en ella la histórica y la sustituye por
+    # una vista con el mismo nombre, así que quien lee var.table_vuelos sigue viendo los vuelos nuevos
     { name = var.table_vuelos, schema = "schemas/vuelos.json" },
+    { name = "${var.table_vuelos}_particionada", schema = "schemas/vuelos.json", partition_field = "FechaVuelo", clustering = ["ClaveVuelo"], deletion_protection = true },
     { name = var.table_hoteles, schema = "schemas/hoteles.json" },
     { name = var.table_coches, schema = "schemas/coches.json" },
     { name = var.table_usuarios, schema = "schemas/usuarios.json" },
@@ -47,12 +51,13 @@ module "function_vuelos" {
   env_variables = {
     PROJECT_ID     = var.project_id
     DATASET        = var.bq_dataset
-    TABLE          = var.table_vuelos
+    TABLE          = "${var.table_vuelos}_particionada"
     RAPIDAPI_KEY   = var.RAPIDAPI_KEY
     API_DATA_URL   = module.apidata.api_data_url
     SERPAPI_KEY    = var.SERPAPI_KEY
   }
-  depends_on = [ module.apidata ]
+  tabla_historica = var.table_vuelos
+  depends_on = [ module.apidata, module.bigquery ]
 
 }
 
@@ -83,6 +88,8 @@ module "function_coches" {
   dataset                = var.bq_dataset
   table_usuarios         = var.table_usuarios
   table_viajes           = var.table_viajes
+  # Solo una URL de Postgres; cualquier otro valor deja apidata con SQLite local
+  oltp_url               = can(regex("^postgres(ql)?://", var.DATABASE_URL)) ? var.DATABASE_URL : ""
 }
 
 module "apiagent" {
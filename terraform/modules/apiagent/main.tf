@@ -42,6 +42,12 @@ resource "google_cloud_run_v2_service" "service-apiagent" {
         value = var.DATABASE_URL
       }
 
+      env {
+        name  = "CHECKPOINTER_URL"
+        # Solo una URL de Postgres; cualquier otro valor deja el SQLite local por defecto
+        value = can(regex("^postgres(ql)?://", var.DATABASE_URL)) ? var.DATABASE_URL : ""
+      }
+
       env {
         name  = "API_VERSION"
         value = var.API_VERSION
@@ -0,0 +1,165 @@
+"""
+Almacén OLTP de usuarios y viajes: consultas puntuales en milisegundos en lugar
+de un job de BigQuery por login o por listado de viajes.
+
+OLTP_URL elige el motor:
+  * sqlite:///ruta/fichero.sqlite (por defecto, para desarrollo local);
+  * postgresql://... en producción (la misma base de datos que usa apiagent).
+
+Solo Postgres es compartido por todas las instancias de Cloud Run. Con SQLite
+cada instancia tiene su propia copia y el almacén es solo una caché local
+(compartido=False): app.py sigue consultando BigQuery para lo que otra
+instancia haya podido escribir.
+
+BigQuery sigue siendo la copia analítica (Grafana): las escrituras se replican
+en segundo plano desde app.py, y al arrancar con el almacén vacío se importan
+las filas que ya había en BigQuery.
+"""
+import os
+import sqlite3
+import threading
+
+OLTP_URL = os.environ.get("OLTP_URL") or "sqlite:////tmp/apidata.sqlite"
+OLTP_POOL_SIZE = int(os.environ.get("OLTP_POOL_SIZE", "8"))
+
+COLUMNAS_USUARIOS = ["id", "usuario", "nombre", "apellido", "correo", "PWD"]
+COLUMNAS_VIAJES = ["thread_id", "user", "titulo"]
+
+# "user" es palabra reservada en Postgres, por eso va entre comillas en todas las consultas
+ESQUEMA = [
+    """CREATE TABLE IF NOT EXISTS usuarios (
+        id TEXT PRIMARY KEY,
+        usuario TEXT NOT NULL UNIQUE,
+        nombre TEXT,
+        apellido TEXT,
+        correo TEXT NOT NULL UNIQUE,
+        pwd TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS viajes (
+        thread_id TEXT PRIMARY KEY,
+        "user" TEXT NOT NULL,
+        titulo TEXT
+    )""",
+    'CREATE INDEX IF NOT EXISTS idx_viajes_user ON viajes ("user", thread_id)',
+]
+
+SELECT_USUARIO = 'SELECT id, usuario, nombre, apellido, correo, pwd AS "PWD" FROM usuarios'
+INSERT_USUARIO = ("INSERT INTO usuarios (id, usuario, nombre, apellido, correo, pwd) VALUES (?, ?, ?, ?, ?, ?) "
+                  "ON CONFLICT DO NOTHING")
+INSERT_VIAJE = 'INSERT INTO viajes (thread_id, "user", titulo) VALUES (?, ?, ?) ON CONFLICT DO NOTHING'
+
+
+def _valores(fila, columnas):
+    return tuple(fila.get(c) for c in columnas)
+
+
+class _SQLite:
+    marcador = "?"
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+
+    def _conexion(self):
+        # Una conexión por hilo de gunicorn; WAL permite leer mientras otro hilo escribe
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, isolation_level=None, timeout=5)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA journal_mode=WAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def ejecutar(self, sql, parametros=()):
+        cursor = self._conexion().execute(sql, parametros)
+        return [dict(fila) for fila in cursor.fetchall()], cursor.rowcount
+
+    def ejecutar_varios(self, sql, filas):
+        conexion = self._conexion()
+        conexion.execute("BEGIN")
+        try:
+            conexion.executemany(sql, filas)
+            conexion.execute("COMMIT")
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+
+
+class _Postgres:
+    marcador = "%s"
+
+    def __init__(self, url):
+        from psycopg.rows import dict_row
+        from psycopg_pool import ConnectionPool
+
+        self.pool = ConnectionPool(url, min_size=1, max_size=OLTP_POOL_SIZE,
+                                   kwargs={"autocommit": True, "row_factory": dict_row})
+
+    def ejecutar(self, sql, parametros=()):
+        with self.pool.connection() as conexion:
+            cursor = conexion.execute(sql, parametros)
+            filas = cursor.fetchall() if cursor.description else []
+            return filas, cursor.rowcount
+
+    def ejecutar_varios(self, sql, filas):
+        with self.pool.connection() as conexion, conexion.transaction():
+            with conexion.cursor() as cursor:
+                cursor.executemany(sql, filas)
+
+
+class AlmacenOLTP:
+    def __init__(self, url=OLTP_URL):
+        if url.startswith("sqlite:///"):
+            self._motor = _SQLite(url[len("sqlite:///"):])
+            self.compartido = False
+        elif url.startswith(("postgres://", "postgresql://")):
+            self._motor = _Postgres(url)
+            self.compartido = True
+        else:
+            raise ValueError(f"OLTP_URL no soportada: {url}")
+
+    def _sql(self, sql):
+        return sql.replace("?", self._motor.marcador)
+
+    def _ejecutar(self, sql, parametros=()):
+        return self._motor.ejecutar(self._sql(sql), parametros)
+
+    def crear_esquema(self):
+        for sentencia in ESQUEMA:
+            self._ejecutar(sentencia)
+
+    # --- Usuarios ---
+    def contar_usuarios(self):
+        filas, _ = self._ejecutar("SELECT COUNT(*) AS n FROM usuarios")
+        return filas[0]["n"]
+
+    def buscar_usuario(self, usuario):
+        filas, _ = self._ejecutar(f"{SELECT_USUARIO} WHERE usuario = ?", (usuario,))
+        return filas[0] if filas else None
+
+    def insertar_usuario(self, usuario):
+        """False si ya existe un usuario con ese id, usuario o correo."""
+        _, insertadas = self._ejecutar(INSERT_USUARIO, _valores(usuario, COLUMNAS_USUARIOS))
+        return insertadas == 1
+
+    # --- Viajes ---
+    def contar_viajes(self):
+        filas, _ = self._ejecutar("SELECT COUNT(*) AS n FROM viajes")
+        return filas[0]["n"]
+
+    def insertar_viaje(self, viaje):
+        _, insertadas = self._ejecutar(INSERT_VIAJE, _valores(viaje, COLUMNAS_VIAJES))
+        return insertadas == 1
+
+    def viajes_de(self, user):
+        filas, _ = self._ejecutar('SELECT thread_id, "user", titulo FROM viajes WHERE "user" = ? ORDER BY thread_id DESC',
+                                  (user,))
+        return filas
+
+    # --- Importación desde BigQuery ---
+    def importar(self, usuarios=(), viajes=()):
+        """Carga filas ya existentes sin pisar las del almacén (las duplicadas se ignoran)."""
+        if usuarios:
+            self._motor.ejecutar_varios(self._sql(INSERT_USUARIO), [_valores(u, COLUMNAS_USUARIOS) for u in usuarios])
+        if viajes:
+            self._motor.ejecutar_varios(self._sql(INSERT_VIAJE), [_valores(v, COLUMNAS_VIAJES) for v in viajes])
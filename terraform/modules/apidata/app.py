@@ -1,8 +1,15 @@
 import os
-import requests
-from flask import Flask, request, jsonify
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, request, jsonify
 from google.cloud import bigquery
 
+from cache_pasarela import GATEWAY_CACHE_MAX_BYTES, CacheRespuestas, clave_peticion
+from almacen import COLUMNAS_USUARIOS, COLUMNAS_VIAJES
+from busqueda import MEDIA_TYPE, linea_error, linea_fin, linea_seccion, payloads_busqueda
+from escritor_bq import crear_escritor
+from recursos import calentar_en_segundo_plano, estado, get_almacen, get_bigquery, leer_bigquery, post_upstream
+
 app = Flask(__name__)
 
 FUNC_VUELOS_URL = os.environ.get("FUNC_VUELOS_URL")
@@ -12,36 +19,225 @@ PROJECT_ID = os.environ.get("PROJECT_ID")
 DATASET = os.environ.get("DATASET")
 TABLE_USUARIOS = os.environ.get("TABLE_USUARIOS")
 TABLE_VIAJES = os.environ.get("TABLE_VIAJES")
+FUNC_URLS = {"vuelos": FUNC_VUELOS_URL, "hoteles": FUNC_HOTELES_URL, "coches": FUNC_COCHES_URL}
+
+# Cliente de BigQuery, sesión HTTP y almacén OLTP compartidos, calentados antes de la primera petición
+calentar_en_segundo_plano()
+
+# Usuarios y viajes se leen y escriben en el almacén OLTP; BigQuery recibe una copia en segundo plano
+def replicar_en_bigquery(tabla, clave):
+    def escribir(lote):
+        errors = get_bigquery().insert_rows_json(f"{PROJECT_ID}.{DATASET}.{tabla}", lote,
+                                                 row_ids=[fila[clave] for fila in lote])
+        if errors:
+            raise RuntimeError(f"Errores al replicar en {tabla}: {errors}")
+    return escribir
+
+replica_usuarios = crear_escritor("usuarios", replicar_en_bigquery(TABLE_USUARIOS, "id"))
+replica_viajes = crear_escritor("viajes", replicar_en_bigquery(TABLE_VIAJES, "thread_id"))
+
+def usuario_existente_en_bigquery(usuario):
+    """Con un almacén no compartido, un id, usuario o correo pudo registrarse en otra instancia."""
+    filas = leer_bigquery(TABLE_USUARIOS, COLUMNAS_USUARIOS,
+                          "WHERE id = @id OR usuario = @usuario OR correo = @correo LIMIT 1",
+                          [bigquery.ScalarQueryParameter(campo, "STRING", usuario.get(campo))
+                           for campo in ("id", "usuario", "correo")])
+    if filas:
+        get_almacen().importar(usuarios=filas)
+    return bool(filas)
+
+def viajes_de(user):
+    """
+    Con Postgres el almacén tiene todos los viajes. Con SQLite (un almacén por
+    instancia) no se sabe si falta alguno, así que se importan antes los de BigQuery.
+    """
+    almacen = get_almacen()
+    if not almacen.compartido:
+        almacen.importar(viajes=leer_bigquery(TABLE_VIAJES, COLUMNAS_VIAJES, "WHERE user = @user",
+                                              [bigquery.ScalarQueryParameter("user", "STRING", user)]))
+    return almacen.viajes_de(user)
+
+def buscar_usuario(usuario):
+    """
+    Busca en el almacén y, si no está, en BigQuery: un usuario registrado antes
+    de que existiera el almacén (o en otra instancia con SQLite) se importa aquí.
+    """
+    almacen = get_almacen()
+    encontrado = almacen.buscar_usuario(usuario)
+    if encontrado is None:
+        filas = leer_bigquery(TABLE_USUARIOS, COLUMNAS_USUARIOS, "WHERE usuario = @usuario LIMIT 1",
+                              [bigquery.ScalarQueryParameter("usuario", "STRING", usuario)])
+        if filas:
+            almacen.importar(usuarios=filas)
+            encontrado = almacen.buscar_usuario(usuario)
+    return encontrado
+
+# Búsquedas idénticas (mismo payload canonicalizado) comparten respuesta durante GATEWAY_CACHE_TTL
+cache_busquedas = CacheRespuestas()
+
+# El cuerpo de la Cloud Function se reenvía por trozos según llegan (sin reagruparlos, para que
+# las respuestas NDJSON de las funciones lleguen línea a línea), sin parsearlo ni volver a serializarlo
+CABECERAS_REENVIADAS = ("Content-Type", "X-Estado-Proveedores")
+
+def respuesta_cacheada(respuesta, origen):
+    contenido, status, cabeceras = respuesta
+    return Response(contenido, status=status, headers={**cabeceras, "X-Cache": origen})
+
+def reenviar_en_streaming(url, data, origen, clave=None, vuelo=None):
+    """Con vuelo (la petición que llama por todas) también guarda los bytes para la caché."""
+    upstream = post_upstream(url, json=data, stream=True, headers={"Accept-Encoding": "identity"})
+    cabeceras = {k: upstream.headers[k] for k in CABECERAS_REENVIADAS if k in upstream.headers}
+    guardados = [] if vuelo is not None else None
+    estado_envio = {"tam": 0, "completo": False, "cerrado": False}
+
+    def cerrar():
+        # Se llama al acabar el generador o al cerrar la respuesta (también si el cliente se va antes)
+        if estado_envio["cerrado"]:
+            return
+        estado_envio["cerrado"] = True
+        upstream.close()
+        if vuelo is not None:
+            completa = estado_envio["completo"] and guardados is not None
+            cache_busquedas.salir(clave, vuelo, (b"".join(guardados), upstream.status_code, cabeceras) if completa else None)
+
+    def trozos():
+        nonlocal guardados
+        try:
+            for trozo in upstream.iter_content(chunk_size=None):
+                if guardados is not None:
+                    estado_envio["tam"] += len(trozo)
+                    if estado_envio["tam"] > GATEWAY_CACHE_MAX_BYTES:
+                        guardados = None
+                    else:
+                        guardados.append(trozo)
+                yield trozo
+            estado_envio["completo"] = True
+        finally:
+            cerrar()
+
+    respuesta = Response(trozos(), status=upstream.status_code, headers={**cabeceras, "X-Cache": origen})
+    respuesta.call_on_close(cerrar)
+    return respuesta
+
+def reenviar(ruta, url, data):
+    clave = clave_peticion(ruta, data)
+    origen, dato = cache_busquedas.entrar(clave)
+    if origen == "hit":
+        return respuesta_cacheada(dato, origen)
+    if origen == "coalesced":
+        respuesta = cache_busquedas.esperar(dato)
+        if respuesta is not None:
+            return respuesta_cacheada(respuesta, origen)
+        # La llamada compartida falló o no se pudo guardar: esta petición llama por su cuenta
+        return reenviar_en_streaming(url, data, "bypass")
+    try:
+        return reenviar_en_streaming(url, data, origen, clave, dato)
+    except Exception:
+        cache_busquedas.salir(clave, dato)
+        raise
+
+def llamar_completo(url, data):
+    upstream = post_upstream(url, json=data, headers={"Accept-Encoding": "identity"})
+    cabeceras = {k: upstream.headers[k] for k in CABECERAS_REENVIADAS if k in upstream.headers}
+    return upstream.content, upstream.status_code, cabeceras
+
+def obtener_respuesta(ruta, url, data):
+    """Como reenviar(), pero devuelve la respuesta entera (contenido, status, cabeceras) y su origen."""
+    clave = clave_peticion(ruta, data)
+    origen, dato = cache_busquedas.entrar(clave)
+    if origen == "hit":
+        return dato, origen
+    if origen == "coalesced":
+        respuesta = cache_busquedas.esperar(dato)
+        if respuesta is not None:
+            return respuesta, origen
+        return llamar_completo(url, data), "bypass"
+    try:
+        respuesta = llamar_completo(url, data)
+    except Exception:
+        cache_busquedas.salir(clave, dato)
+        raise
+    cache_busquedas.salir(clave, dato, respuesta if len(respuesta[0]) <= GATEWAY_CACHE_MAX_BYTES else None)
+    return respuesta, origen
+
+def json_invalido():
+    return jsonify({"status": "error", "message": "Se esperaba un cuerpo JSON"}), 400
 
 @app.route('/vuelos', methods=['POST'])
 def handle_vuelos():
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return json_invalido()
     if data.get("respuesta") == True:
         print("🛫 Datos de vuelos limpios recibidos:", data)
         return '', 204
     else:
-        response = requests.post(FUNC_VUELOS_URL, json=data)
-        return jsonify(response.json()), response.status_code
+        return reenviar("vuelos", FUNC_VUELOS_URL, data)
 
 @app.route('/hoteles', methods=['POST'])
 def handle_hoteles():
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return json_invalido()
     if data.get("respuesta") == True:
         print("🏨 Datos de hoteles limpios recibidos:", data)
         return '', 204
     else:
-        response = requests.post(FUNC_HOTELES_URL, json=data)
-        return jsonify(response.json()), response.status_code
+        return reenviar("hoteles", FUNC_HOTELES_URL, data)
 
 @app.route('/coches', methods=['POST'])
 def handle_coches():
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return json_invalido()
     if data.get("respuesta") == True:
         print("🚗 Datos de coches limpios recibidos:", data)
         return '', 204
     else:
-        response = requests.post(FUNC_COCHES_URL, json=data)
-        return jsonify(response.json()), response.status_code
+        return reenviar("coches", FUNC_COCHES_URL, data)
+
+@app.route('/busqueda', methods=['POST'])
+def handle_busqueda():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return json_invalido()
+    try:
+        payloads = payloads_busqueda(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    inicio = time.perf_counter()
+    def ms():
+        return round((time.perf_counter() - inicio) * 1000)
+
+    def buscar(seccion, payload):
+        try:
+            respuesta, origen = obtener_respuesta(seccion, FUNC_URLS[seccion], payload)
+            return linea_seccion(seccion, respuesta, origen, ms())
+        except Exception as e:
+            return linea_error(seccion, e, ms())
+
+    def lineas():
+        # Cada sección se envía en cuanto termina; la última línea marca el final
+        with ThreadPoolExecutor(max_workers=len(payloads)) as pool:
+            for futuro in as_completed([pool.submit(buscar, s, p) for s, p in payloads.items()]):
+                yield futuro.result()
+        yield linea_fin(ms())
+
+    return Response(lineas(), mimetype=MEDIA_TYPE)
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    return jsonify(estado), 200 if estado["listo"] else 503
+
+@app.route('/metrics/cache', methods=['GET'])
+def metrics_cache():
+    return jsonify(cache_busquedas.metricas()), 200
+
+@app.route('/metrics/replica', methods=['GET'])
+def metrics_replica():
+    # Filas descartadas o perdidas y retraso de la copia en BigQuery
+    return jsonify({"usuarios": replica_usuarios.metricas(), "viajes": replica_viajes.metricas()}), 200
 
 
 @app.route('/registro', methods=['POST'])
@@ -57,50 +253,25 @@ def handle_usuarios():
             "message": f"Faltan campos requeridos: {', '.join(missing_fields)}"
         }), 400
 
-    client = bigquery.Client()
-    table_id = f"{PROJECT_ID}.{DATASET}.{TABLE_USUARIOS}"
-
-    # Check if user already exists
-    check_query = f"""
-    SELECT id FROM `{table_id}`
-    WHERE id = @id OR usuario = @usuario OR correo = @correo
-    LIMIT 1
-    """
-    
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("id", "STRING", data['id']),
-            bigquery.ScalarQueryParameter("usuario", "STRING", data['usuario']),
-            bigquery.ScalarQueryParameter("correo", "STRING", data['correo'])
-        ]
-    )
-    
-    existing_user = list(client.query(check_query, job_config=job_config))
-    if existing_user:
+    # Las restricciones UNIQUE del almacén rechazan id, usuario o correo repetidos
+    usuario = {campo: data.get(campo) for campo in COLUMNAS_USUARIOS}
+    almacen = get_almacen()
+    repetido = not almacen.compartido and usuario_existente_en_bigquery(usuario)
+    if repetido or not almacen.insertar_usuario(usuario):
         return jsonify({
             "status": "error",
             "message": "Ya existe un usuario con ese ID, nombre de usuario o correo"
         }), 409
 
-    # Insert new user
-    errors = client.insert_rows_json(table_id, [data])
-    if errors:
-        return jsonify({
-            "status": "error",
-            "errors": errors
-        }), 500
-    else:
-        return jsonify({
-            "status": "success",
-            "message": "Usuario registrado exitosamente",
-            "user_id": data['id']
-        }), 201
+    replica_usuarios.encolar([usuario])
+    return jsonify({
+        "status": "success",
+        "message": "Usuario registrado exitosamente",
+        "user_id": data['id']
+    }), 201
 
 @app.route('/viajes', methods=['POST', 'GET'])
 def handle_viajes():
-    client = bigquery.Client()
-    table_id = f"{PROJECT_ID}.{DATASET}.{TABLE_VIAJES}"
-
     if request.method == 'POST':
         data = request.get_json()
         
@@ -112,32 +283,17 @@ def handle_viajes():
             }), 400
             
         # Validate user exists in usuarios table
-        user_query = f"""
-        SELECT usuario FROM `{PROJECT_ID}.{DATASET}.{TABLE_USUARIOS}`
-        WHERE usuario = @user
-        LIMIT 1
-        """
-        
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("user", "STRING", data['user'])
-            ]
-        )
-        
-        user_result = list(client.query(user_query, job_config=job_config))
-        if not user_result:
+        if buscar_usuario(data['user']) is None:
             return jsonify({
                 "status": "error",
                 "message": "Usuario no encontrado"
             }), 404
 
-        errors = client.insert_rows_json(table_id, [data])
-        if errors:
-            print("Errores al insertar viaje en BigQuery:", errors)
-            return jsonify({"status": "error", "errors": errors}), 500
-        else:
-            print("✅ Viaje insertado en BigQuery:", data)
-            return jsonify({"status": "success"}), 200
+        viaje = {campo: data.get(campo) for campo in COLUMNAS_VIAJES}
+        get_almacen().insertar_viaje(viaje)
+        replica_viajes.encolar([viaje])
+        print("✅ Viaje guardado:", viaje)
+        return jsonify({"status": "success"}), 200
 
     elif request.method == 'GET':
         user = request.args.get('user')
@@ -147,21 +303,7 @@ def handle_viajes():
                 "message": "El parámetro 'user' es requerido"
             }), 400
             
-        query = f"""
-        SELECT * FROM `{table_id}`
-        WHERE user = @user
-        ORDER BY thread_id DESC
-        """
-        
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("user", "STRING", user)
-            ]
-        )
-        
-        query_job = client.query(query, job_config=job_config)
-        results = [dict(row) for row in query_job]
-        return jsonify(results), 200
+        return jsonify(viajes_de(user)), 200
 
 @app.route('/login', methods=['POST'])
 def handle_login():
@@ -169,31 +311,12 @@ def handle_login():
     if not data or 'usuario' not in data or 'pwd' not in data:
         return jsonify({"status": "error", "message": "Se requieren usuario y contraseña"}), 400
 
-    client = bigquery.Client()
-    table_id = f"{PROJECT_ID}.{DATASET}.{TABLE_USUARIOS}"
-    
-    # Query to check credentials
-    query = f"""
-    SELECT * FROM `{table_id}`
-    WHERE usuario = @usuario AND pwd = @pwd
-    LIMIT 1
-    """
-    
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("usuario", "STRING", data['usuario']),
-            bigquery.ScalarQueryParameter("pwd", "STRING", data['pwd'])
-        ]
-    )
-    
-    query_job = client.query(query, job_config=job_config)
-    results = list(query_job)
-    
-    if results:
+    user = buscar_usuario(data['usuario'])
+    if user is not None and user['PWD'] == data['pwd']:
         return jsonify({
             "status": "success",
             "message": "Login exitoso",
-            "user": dict(results[0])
+            "user": user
         }), 200
     else:
         return jsonify({
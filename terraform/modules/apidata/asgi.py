@@ -0,0 +1,204 @@
+"""
+Modo de servicio asíncrono de apidata (APIDATA_MODO=asgi, el de la imagen).
+
+/vuelos, /hoteles, /coches y /busqueda se atienden en el event loop con un AsyncClient
+compartido: mientras la Cloud Function busca (10-60 s) la petición no ocupa
+ningún hilo, así que una instancia puede tener cientos de búsquedas en vuelo.
+El resto de rutas (usuarios, viajes, métricas, /ready) siguen siendo las de
+Flask, montadas como WSGI y servidas desde un pool de hilos.
+
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from app import (CABECERAS_REENVIADAS, FUNC_COCHES_URL, FUNC_HOTELES_URL, FUNC_URLS, FUNC_VUELOS_URL,
+                 app as flask_app, cache_busquedas)
+from busqueda import MEDIA_TYPE, linea_error, linea_fin, linea_seccion, payloads_busqueda
+from cache_pasarela import GATEWAY_CACHE_MAX_BYTES, clave_peticion
+from recursos import UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT
+
+# Búsquedas simultáneas hacia las Cloud Functions por instancia
+UPSTREAM_MAX_CONEXIONES = int(os.environ.get("UPSTREAM_MAX_CONEXIONES", "500"))
+# Hilos para las rutas de Flask (BigQuery y almacén OLTP son bloqueantes)
+WSGI_HILOS = int(os.environ.get("WSGI_HILOS", "16"))
+
+cliente = None
+
+
+@asynccontextmanager
+async def lifespan(_):
+    global cliente
+    cliente = httpx.AsyncClient(
+        timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONEXIONES, max_keepalive_connections=100),
+    )
+    yield
+    await cliente.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def respuesta_cacheada(respuesta, origen):
+    contenido, status, cabeceras = respuesta
+    return Response(contenido, status_code=status, headers={**cabeceras, "X-Cache": origen})
+
+
+async def reenviar_en_streaming(url, data, origen, clave=None, vuelo=None):
+    """Versión asíncrona de app.reenviar_en_streaming."""
+    peticion = cliente.build_request("POST", url, json=data, headers={"Accept-Encoding": "identity"})
+    upstream = await cliente.send(peticion, stream=True)
+    cabeceras = {k: upstream.headers[k] for k in CABECERAS_REENVIADAS if k in upstream.headers}
+    guardados = [] if vuelo is not None else None
+    estado_envio = {"tam": 0, "completo": False, "cerrado": False}
+
+    async def cerrar():
+        if estado_envio["cerrado"]:
+            return
+        estado_envio["cerrado"] = True
+        await upstream.aclose()
+        if vuelo is not None:
+            completa = estado_envio["completo"] and guardados is not None
+            cache_busquedas.salir(clave, vuelo, (b"".join(guardados), upstream.status_code, cabeceras) if completa else None)
+
+    async def trozos():
+        nonlocal guardados
+        try:
+            async for trozo in upstream.aiter_raw():
+                if guardados is not None:
+                    estado_envio["tam"] += len(trozo)
+                    if estado_envio["tam"] > GATEWAY_CACHE_MAX_BYTES:
+                        guardados = None
+                    else:
+                        guardados.append(trozo)
+                yield trozo
+            estado_envio["completo"] = True
+        finally:
+            await cerrar()
+
+    return StreamingResponse(trozos(), status_code=upstream.status_code, headers={**cabeceras, "X-Cache": origen},
+                             background=BackgroundTask(cerrar))
+
+
+async def reenviar(ruta, url, data):
+    clave = clave_peticion(ruta, data)
+    origen, dato = cache_busquedas.entrar(clave)
+    if origen == "hit":
+        return respuesta_cacheada(dato, origen)
+    if origen == "coalesced":
+        respuesta = await cache_busquedas.aesperar(dato)
+        if respuesta is not None:
+            return respuesta_cacheada(respuesta, origen)
+        return await reenviar_en_streaming(url, data, "bypass")
+    try:
+        return await reenviar_en_streaming(url, data, origen, clave, dato)
+    except BaseException:
+        cache_busquedas.salir(clave, dato)
+        raise
+
+
+async def llamar_completo(url, data):
+    upstream = await cliente.post(url, json=data, headers={"Accept-Encoding": "identity"})
+    cabeceras = {k: upstream.headers[k] for k in CABECERAS_REENVIADAS if k in upstream.headers}
+    return upstream.content, upstream.status_code, cabeceras
+
+
+async def obtener_respuesta(ruta, url, data):
+    """Versión asíncrona de app.obtener_respuesta."""
+    clave = clave_peticion(ruta, data)
+    origen, dato = cache_busquedas.entrar(clave)
+    if origen == "hit":
+        return dato, origen
+    if origen == "coalesced":
+        respuesta = await cache_busquedas.aesperar(dato)
+        if respuesta is not None:
+            return respuesta, origen
+        return await llamar_completo(url, data), "bypass"
+    try:
+        respuesta = await llamar_completo(url, data)
+    except BaseException:
+        cache_busquedas.salir(clave, dato)
+        raise
+    cache_busquedas.salir(clave, dato, respuesta if len(respuesta[0]) <= GATEWAY_CACHE_MAX_BYTES else None)
+    return respuesta, origen
+
+
+async def leer_json(request: Request):
+    """Como get_json(silent=True) de Flask: None si el cuerpo no es un objeto JSON."""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def json_invalido():
+    return JSONResponse({"status": "error", "message": "Se esperaba un cuerpo JSON"}, status_code=400)
+
+
+async def busqueda(request: Request, ruta, url, icono):
+    data = await leer_json(request)
+    if data is None:
+        return json_invalido()
+    if data.get("respuesta") == True:
+        print(f"{icono} Datos de {ruta} limpios recibidos:", data)
+        return Response(status_code=204)
+    return await reenviar(ruta, url, data)
+
+
+@app.post("/vuelos")
+async def handle_vuelos(request: Request):
+    return await busqueda(request, "vuelos", FUNC_VUELOS_URL, "🛫")
+
+
+@app.post("/hoteles")
+async def handle_hoteles(request: Request):
+    return await busqueda(request, "hoteles", FUNC_HOTELES_URL, "🏨")
+
+
+@app.post("/coches")
+async def handle_coches(request: Request):
+    return await busqueda(request, "coches", FUNC_COCHES_URL, "🚗")
+
+
+@app.post("/busqueda")
+async def handle_busqueda(request: Request):
+    data = await leer_json(request)
+    if data is None:
+        return json_invalido()
+    try:
+        payloads = payloads_busqueda(data)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+    inicio = time.perf_counter()
+    def ms():
+        return round((time.perf_counter() - inicio) * 1000)
+
+    async def buscar(seccion, payload):
+        try:
+            respuesta, origen = await obtener_respuesta(seccion, FUNC_URLS[seccion], payload)
+            return linea_seccion(seccion, respuesta, origen, ms())
+        except Exception as e:
+            return linea_error(seccion, e, ms())
+
+    async def lineas():
+        # Si el cliente se va antes, las búsquedas siguen y su resultado queda en la caché
+        for siguiente in asyncio.as_completed([asyncio.ensure_future(buscar(s, p)) for s, p in payloads.items()]):
+            yield await siguiente
+        yield linea_fin(ms())
+
+    return StreamingResponse(lineas(), media_type=MEDIA_TYPE)
+
+
+# Todo lo demás lo sirve la aplicación Flask
+app.mount("/", WSGIMiddleware(flask_app, workers=WSGI_HILOS))
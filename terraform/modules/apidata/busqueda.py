@@ -0,0 +1,81 @@
+"""
+/busqueda: un viaje (origen, destino, fechas, adultos) se convierte en las tres
+búsquedas de /vuelos, /hoteles y /coches, que se lanzan a la vez. La respuesta
+es NDJSON con una línea por sección según van terminando y una última línea
+"fin":
+
+    {"seccion": "hoteles", "status": 200, "cache": "miss", "ms": 8123, "datos": {...}}
+    {"seccion": "vuelos", "status": 200, "cache": "hit", "ms": 2, "datos": [...]}
+    {"seccion": "coches", "error": "timeout", "ms": 45001}
+    {"seccion": "fin", "ms": 45001}
+
+Cada sección usa la misma caché que su ruta individual, y "datos" es el cuerpo
+de la Cloud Function tal cual, sin volver a serializarlo.
+"""
+import json
+
+SECCIONES = ("vuelos", "hoteles", "coches")
+CAMPOS_OBLIGATORIOS = ("origen", "destino", "fecha_salida", "fecha_vuelta")
+MEDIA_TYPE = "application/x-ndjson"
+
+
+def payloads_busqueda(spec):
+    """
+    Payload de cada Cloud Function a partir del viaje. 'destino' es el código
+    IATA; hoteles y coches usan 'ciudad_destino' si viene (si no, el IATA).
+    Lanza ValueError si falta algún campo obligatorio.
+    """
+    faltan = [campo for campo in CAMPOS_OBLIGATORIOS if not spec.get(campo)]
+    if faltan:
+        raise ValueError(f"Faltan campos requeridos: {', '.join(faltan)}")
+    adultos = spec.get("adultos", 1)
+    ciudad = spec.get("ciudad_destino") or spec["destino"]
+    payloads = {
+        "vuelos": {
+            "ciudad_origen": spec["origen"],
+            "ciudad_destino": spec["destino"],
+            "fecha_salida": spec["fecha_salida"],
+            "fecha_vuelta": spec["fecha_vuelta"],
+            "adults": adultos,
+            "cabin_class": spec.get("cabin_class", "ECONOMY"),
+            "tipo_de_viaje": 1,
+        },
+        "hoteles": {
+            "ciudad": ciudad,
+            "fecha_entrada": spec["fecha_salida"],
+            "fecha_vuelta": spec["fecha_vuelta"],
+            "adults": adultos,
+        },
+        "coches": {
+            "ciudad_destino": ciudad,
+            "fecha_salida": spec["fecha_salida"],
+            "fecha_vuelta": spec["fecha_vuelta"],
+        },
+    }
+    secciones = spec.get("secciones") or SECCIONES
+    return {seccion: payloads[seccion] for seccion in SECCIONES if seccion in secciones}
+
+
+def _linea(campos, datos=None):
+    linea = json.dumps(campos, ensure_ascii=False).encode("utf-8")
+    if datos is not None:
+        # Se inserta el cuerpo JSON tal cual; los saltos de línea fuera de cadenas son solo espacio
+        linea = linea[:-1] + b', "datos": ' + datos.replace(b"\n", b" ").replace(b"\r", b" ") + b"}"
+    return linea + b"\n"
+
+
+def linea_seccion(seccion, respuesta, origen, ms):
+    contenido, status, cabeceras = respuesta
+    campos = {"seccion": seccion, "status": status, "cache": origen, "ms": ms}
+    if "json" in cabeceras.get("Content-Type", "") and contenido.strip():
+        return _linea(campos, contenido)
+    campos["error"] = contenido.decode("utf-8", errors="replace")[:1000]
+    return _linea(campos)
+
+
+def linea_error(seccion, error, ms):
+    return _linea({"seccion": seccion, "error": str(error) or type(error).__name__, "ms": ms})
+
+
+def linea_fin(ms):
+    return _linea({"seccion": "fin", "ms": ms})
@@ -0,0 +1,167 @@
+"""
+Caché de respuestas de la pasarela para /vuelos, /hoteles y /coches.
+
+La clave es la ruta más el payload canonicalizado, así que dos búsquedas iguales
+escritas de forma distinta ("mad" / " MAD ", otro orden de campos) comparten
+entrada. Si llegan a la vez varias peticiones iguales solo una llama a la Cloud
+Function (single-flight); el resto espera y reutiliza su respuesta. Solo se
+guardan las respuestas 2xx, como bytes tal cual llegan de la Cloud Function y
+hasta GATEWAY_CACHE_MAX_BYTES por respuesta. Las respuestas NDJSON, que siempre
+son 200, solo se guardan si su última línea es un "fin" con "ok" verdadero.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+GATEWAY_CACHE_TTL = float(os.environ.get("GATEWAY_CACHE_TTL", "300"))
+GATEWAY_CACHE_MAX = int(os.environ.get("GATEWAY_CACHE_MAX", "1024"))
+# Las respuestas más grandes se reenvían sin guardarlas, para no acumularlas en memoria
+GATEWAY_CACHE_MAX_BYTES = int(os.environ.get("GATEWAY_CACHE_MAX_BYTES", str(2 * 1024 * 1024)))
+# Lo que espera una petición a que termine la búsqueda idéntica en curso
+GATEWAY_CACHE_ESPERA = float(os.environ.get("GATEWAY_CACHE_ESPERA", "120"))
+
+
+def _canonico(valor):
+    if isinstance(valor, str):
+        return " ".join(valor.split()).casefold()
+    if isinstance(valor, dict):
+        return {str(k): _canonico(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_canonico(v) for v in valor]
+    return valor
+
+
+def clave_peticion(ruta, payload):
+    texto = json.dumps(_canonico(payload), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return f"{ruta}:{hashlib.sha256(texto.encode('utf-8')).hexdigest()}"
+
+
+def es_cacheable(respuesta):
+    """2xx y, en NDJSON, terminada con {"tipo": "fin", "ok": true} (algún proveedor respondió)."""
+    contenido, status, cabeceras = respuesta
+    if not 200 <= status < 300:
+        return False
+    if "ndjson" not in cabeceras.get("Content-Type", ""):
+        return True
+    lineas = contenido.strip().rsplit(b"\n", 1)
+    try:
+        fin = json.loads(lineas[-1])
+    except ValueError:
+        return False
+    return isinstance(fin, dict) and fin.get("tipo") == "fin" and fin.get("ok") is True
+
+
+class _Vuelo:
+    """Llamada en curso a la que se suman las peticiones idénticas (de hilos o del event loop)."""
+
+    def __init__(self):
+        self.hecho = threading.Event()
+        self.resultado = None
+        self._avisos = []
+        self._lock = threading.Lock()
+
+    def al_terminar(self, aviso):
+        with self._lock:
+            if not self.hecho.is_set():
+                self._avisos.append(aviso)
+                return
+        aviso()
+
+    def terminar(self, resultado):
+        with self._lock:
+            self.resultado = resultado
+            self.hecho.set()
+            avisos, self._avisos = self._avisos, []
+        for aviso in avisos:
+            aviso()
+
+
+class CacheRespuestas:
+    def __init__(self, ttl=GATEWAY_CACHE_TTL, max_entradas=GATEWAY_CACHE_MAX, espera=GATEWAY_CACHE_ESPERA):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.espera = espera
+        self._entradas = OrderedDict()
+        self._en_curso = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.coalescidas = 0
+        self.expiradas = 0
+
+    def entrar(self, clave):
+        """
+        Devuelve (origen, dato):
+          * ('hit', respuesta) si hay una respuesta vigente;
+          * ('coalesced', vuelo) si ya hay una llamada idéntica en curso: esperar(vuelo);
+          * ('miss', vuelo) si le toca llamar a la Cloud Function: al acabar, salir(clave, vuelo, ...).
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                respuesta, caduca = entrada
+                if caduca > time.monotonic():
+                    self._entradas.move_to_end(clave)
+                    self.aciertos += 1
+                    return "hit", respuesta
+                del self._entradas[clave]
+                self.expiradas += 1
+            vuelo = self._en_curso.get(clave)
+            if vuelo is not None:
+                self.coalescidas += 1
+                return "coalesced", vuelo
+            vuelo = self._en_curso[clave] = _Vuelo()
+            self.fallos += 1
+            return "miss", vuelo
+
+    def esperar(self, vuelo):
+        """Respuesta de la llamada en curso, o None si falló o no terminó a tiempo (hay que llamar aparte)."""
+        if not vuelo.hecho.wait(self.espera):
+            return None
+        return vuelo.resultado
+
+    async def aesperar(self, vuelo):
+        """Como esperar(), sin bloquear el event loop mientras la llamada sigue en curso."""
+        loop = asyncio.get_running_loop()
+        terminado = loop.create_future()
+        vuelo.al_terminar(lambda: loop.call_soon_threadsafe(lambda: terminado.done() or terminado.set_result(None)))
+        try:
+            await asyncio.wait_for(terminado, self.espera)
+        except asyncio.TimeoutError:
+            return None
+        return vuelo.resultado
+
+    def salir(self, clave, vuelo, respuesta=None):
+        """
+        Cierra la llamada en curso. respuesta es (contenido, status, cabeceras), o
+        None si falló o no se pudo guardar entera; solo se cachean las que pasan es_cacheable.
+        """
+        with self._lock:
+            if self._en_curso.get(clave) is vuelo:
+                del self._en_curso[clave]
+            if respuesta is not None and es_cacheable(respuesta) and self.ttl > 0:
+                self._entradas[clave] = (respuesta, time.monotonic() + self.ttl)
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+        vuelo.terminar(respuesta)
+
+    def metricas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos + self.coalescidas
+            return {
+                "entradas": len(self._entradas),
+                "bytes": sum(len(respuesta[0]) for respuesta, _ in self._entradas.values()),
+                "en_curso": len(self._en_curso),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "coalescidas": self.coalescidas,
+                "expiradas": self.expiradas,
+                # Cada acierto o petición coalescida es una búsqueda de pago que no llega a la Cloud Function
+                "llamadas_ahorradas": self.aciertos + self.coalescidas,
+                "ratio_aciertos": round((self.aciertos + self.coalescidas) / consultas, 3) if consultas else None,
+                "ttl": self.ttl,
+            }
@@ -21,7 +21,7 @@ resource "null_resource" "build_push_image" {
   } 
   provisioner "local-exec" {
     command = <<EOT
-        docker build --platform=linux/amd64 -t ${var.region}-docker.pkg.dev/${var.project_id}/${var.repository_name}/${var.image_name}:latest ${path.module} && docker push ${var.region}-docker.pkg.dev/${var.project_id}/${var.repository_name}/${var.image_name}:latest 
+        docker build --platform=linux/amd64 -t ${var.region}-docker.pkg.dev/${var.project_id}/${var.repository_name}/${var.image_name}:latest -f ${path.module}/dockerfile ${path.module}/.. && docker push ${var.region}-docker.pkg.dev/${var.project_id}/${var.repository_name}/${var.image_name}:latest 
     EOT
   }
   depends_on = [null_resource.docker_auth]
@@ -35,6 +35,9 @@ resource "google_cloud_run_v2_service" "service-apidata" {
   deletion_protection = false
 
   template {
+      # En modo asgi una instancia atiende cientos de búsquedas en vuelo
+      max_instance_request_concurrency = var.max_concurrency
+
       containers {
         image = "europe-west1-docker.pkg.dev/${var.project_id}/${var.repository_name}/${var.image_name}:latest"
       
@@ -73,12 +76,34 @@ resource "google_cloud_run_v2_service" "service-apidata" {
         value = var.table_viajes
       }
 
+      # Usuarios y viajes se sirven desde Postgres; vacío = SQLite local en el contenedor
+      env {
+        name  = "OLTP_URL"
+        value = var.oltp_url
+      }
+
 
       
 
       ports {
         container_port = 8080
       }
+
+      # CPU siempre asignada: el hilo que copia usuarios y viajes a BigQuery sigue
+      # escribiendo entre peticiones (escritor_bq no escribe en la petición)
+      resources {
+        cpu_idle = false
+      }
+
+      # No recibe tráfico hasta que BigQuery y la sesión HTTP están calentados
+      startup_probe {
+        http_get {
+          path = "/ready"
+        }
+        period_seconds    = 3
+        timeout_seconds   = 2
+        failure_threshold = 40
+      }
       }
     
   }
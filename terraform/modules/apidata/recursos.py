@@ -0,0 +1,127 @@
+"""
+Recursos compartidos por todas las peticiones del proceso: el cliente de
+BigQuery, una sesión HTTP con pool de conexiones hacia las Cloud Functions y el
+almacén OLTP de usuarios y viajes.
+
+Se crean una sola vez y se calientan al arrancar (credenciales, conexión, una
+consulta trivial y el esquema del almacén) en un hilo aparte; /ready responde
+503 hasta que terminan.
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from google.cloud import bigquery
+
+from almacen import COLUMNAS_USUARIOS, COLUMNAS_VIAJES, AlmacenOLTP
+
+PROJECT_ID = os.environ.get("PROJECT_ID")
+DATASET = os.environ.get("DATASET")
+TABLE_USUARIOS = os.environ.get("TABLE_USUARIOS")
+TABLE_VIAJES = os.environ.get("TABLE_VIAJES")
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", "90"))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+# Reintentos del calentamiento si BigQuery o las credenciales aún no responden
+WARMUP_REINTENTOS = int(os.environ.get("WARMUP_REINTENTOS", "5"))
+
+UPSTREAM_TIMEOUT = (UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT)
+
+_lock = threading.Lock()
+_bigquery = None
+_sesion = None
+_almacen = None
+estado = {"listo": False, "error": None, "calentamiento_ms": None}
+
+
+def get_bigquery():
+    global _bigquery
+    if _bigquery is None:
+        with _lock:
+            if _bigquery is None:
+                _bigquery = bigquery.Client(project=PROJECT_ID)
+    return _bigquery
+
+
+def get_sesion():
+    global _sesion
+    if _sesion is None:
+        with _lock:
+            if _sesion is None:
+                sesion = requests.Session()
+                adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+                sesion.mount("https://", adaptador)
+                sesion.mount("http://", adaptador)
+                _sesion = sesion
+    return _sesion
+
+
+def get_almacen():
+    global _almacen
+    if _almacen is None:
+        with _lock:
+            if _almacen is None:
+                almacen = AlmacenOLTP()
+                almacen.crear_esquema()
+                _almacen = almacen
+    return _almacen
+
+
+def leer_bigquery(tabla, columnas, filtro="", parametros=()):
+    """Filas de una tabla de BigQuery como dicts (para importar al almacén)."""
+    job_config = bigquery.QueryJobConfig(query_parameters=list(parametros))
+    lista = ", ".join(f"`{c}`" for c in columnas)
+    query = f"SELECT {lista} FROM `{PROJECT_ID}.{DATASET}.{tabla}` {filtro}"
+    return [dict(fila) for fila in get_bigquery().query(query, job_config=job_config).result()]
+
+
+def importar_si_vacio(almacen):
+    """
+    Copia de BigQuery las tablas del almacén que estén vacías. Cada tabla se
+    comprueba por separado: si la importación de viajes falla después de la de
+    usuarios, el siguiente calentamiento la vuelve a intentar.
+    """
+    if not almacen.contar_usuarios():
+        usuarios = leer_bigquery(TABLE_USUARIOS, COLUMNAS_USUARIOS)
+        almacen.importar(usuarios=usuarios)
+        logging.info(f"Almacén OLTP: {len(usuarios)} usuarios importados desde BigQuery")
+    if not almacen.contar_viajes():
+        viajes = leer_bigquery(TABLE_VIAJES, COLUMNAS_VIAJES)
+        almacen.importar(viajes=viajes)
+        logging.info(f"Almacén OLTP: {len(viajes)} viajes importados desde BigQuery")
+
+
+def post_upstream(url, **kwargs):
+    """POST a una Cloud Function por la sesión compartida y con timeout."""
+    kwargs.setdefault("timeout", UPSTREAM_TIMEOUT)
+    return get_sesion().post(url, **kwargs)
+
+
+def calentar():
+    inicio = time.perf_counter()
+    for intento in range(1, WARMUP_REINTENTOS + 1):
+        try:
+            client = get_bigquery()
+            # Obtiene el token y abre la conexión con BigQuery antes de la primera petición real
+            list(client.query("SELECT 1").result())
+            get_sesion()
+            almacen = get_almacen()
+            if not almacen.compartido and os.environ.get("K_SERVICE"):
+                logging.warning("OLTP_URL no es un Postgres compartido: cada instancia de Cloud Run tiene su propio "
+                                "almacén y usuarios y viajes se siguen comprobando en BigQuery")
+            importar_si_vacio(almacen)
+            estado.update(listo=True, error=None, calentamiento_ms=round((time.perf_counter() - inicio) * 1000))
+            logging.info(f"Recursos listos en {estado['calentamiento_ms']} ms")
+            return
+        except Exception as e:
+            estado["error"] = str(e)
+            logging.warning(f"Calentamiento fallido (intento {intento}/{WARMUP_REINTENTOS}): {e}")
+            time.sleep(min(2 ** intento, 30))
+    logging.error("Los recursos no se pudieron calentar; /ready seguirá respondiendo 503")
+
+
+def calentar_en_segundo_plano():
+    threading.Thread(target=calentar, name="calentamiento", daemon=True).start()
@@ -43,4 +43,21 @@ variable "table_usuarios" {
 variable "table_viajes" {
   description = "Nombre de la tabla de vuelos."
   type        = string
-}
\ No newline at end of file
+}
+
+variable "oltp_url" {
+  description = "URL de Postgres para el almacén de usuarios y viajes (vacío = SQLite por instancia, con BigQuery como referencia)."
+  type        = string
+  default     = ""
+
+  validation {
+    condition     = var.oltp_url == "" || can(regex("^postgres(ql)?://", var.oltp_url))
+    error_message = "oltp_url debe estar vacía o ser una URL postgres:// o postgresql://."
+  }
+}
+
+variable "max_concurrency" {
+  description = "Peticiones simultáneas por instancia de Cloud Run (en modo wsgi, bajarlo a 8)."
+  type        = number
+  default     = 250
+}
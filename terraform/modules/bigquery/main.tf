@@ -12,7 +12,23 @@ resource "google_bigquery_table" "table" {
   table_id   = each.value.name
   project    = var.project_id
   schema     = file(each.value.schema)
-  deletion_protection  = false  
+  deletion_protection  = each.value.deletion_protection
+
+  # Particionado y clustering opcionales: permiten que los MERGE por clave solo lean las particiones afectadas
+  dynamic "time_partitioning" {
+    for_each = each.value.partition_field == null ? [] : [each.value.partition_field]
+    content {
+      type  = "DAY"
+      field = time_partitioning.value
+    }
+  }
+  clustering = each.value.clustering
+
+  lifecycle {
+    # Una tabla sustituida por una vista fuera de Terraform (la de vuelos, tras migrar a la
+    # particionada) conserva nombre y esquema: Terraform no debe intentar quitarle la vista
+    ignore_changes = [view]
+  }
 }
 
 
@@ -11,7 +11,10 @@ variable "bq_dataset" {
 variable "tables" {
   description = "Lista de nombres de tablas con sus esquemas"
   type        = list(object({
-    name   = string
-    schema = string
+    name                = string
+    schema              = string
+    partition_field     = optional(string)
+    clustering          = optional(list(string))
+    deletion_protection = optional(bool, false)
   }))
 }
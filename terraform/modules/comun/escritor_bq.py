@@ -0,0 +1,157 @@
+"""
+Escritura en BigQuery fuera del camino de la respuesta.
+
+La función encola las filas y responde; un hilo de la instancia las agrupa en
+lotes y las escribe con reintentos. Con BQ_ESCRITOR=local las filas se quedan
+en memoria (ColaLocal) para probar la función sin BigQuery.
+
+La petición nunca escribe ni espera: en Cloud Functions (y en Cloud Run sin
+CPU siempre asignada) la CPU se limita en cuanto se envía la respuesta, así
+que el hilo puede quedarse parado con filas en la cola. Si la fila más
+antigua lleva más de BQ_MAX_ESPERA segundos esperando, las filas nuevas se
+descartan (y se cuentan en descartadas) en vez de acumularse. apidata corre
+con CPU siempre asignada, así que allí no debería pasar. metricas() da las
+filas escritas, descartadas y perdidas y el retraso de la cola.
+
+Es la única copia del módulo: el zip de cada Cloud Function y la imagen de
+apidata lo incluyen desde terraform/modules/comun (en local, con
+PYTHONPATH=../comun).
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+BQ_ESCRITOR = os.environ.get("BQ_ESCRITOR", "hilo")
+BQ_LOTE = int(os.environ.get("BQ_LOTE", "500"))
+BQ_INTERVALO = float(os.environ.get("BQ_INTERVALO", "2"))
+BQ_REINTENTOS = int(os.environ.get("BQ_REINTENTOS", "3"))
+BQ_MAX_PENDIENTES = int(os.environ.get("BQ_MAX_PENDIENTES", "20000"))
+BQ_MAX_ESPERA = float(os.environ.get("BQ_MAX_ESPERA", "10"))
+
+
+class EscritorEnSegundoPlano:
+    """
+    Acumula filas de varias peticiones y llama a escribir(lote) cada BQ_LOTE filas
+    o cada BQ_INTERVALO segundos. escribir debe lanzar una excepción si falla.
+    """
+
+    def __init__(self, nombre, escribir, tam_lote=BQ_LOTE, intervalo=BQ_INTERVALO,
+                 reintentos=BQ_REINTENTOS, max_pendientes=BQ_MAX_PENDIENTES, max_espera=BQ_MAX_ESPERA):
+        self.nombre = nombre
+        self.escribir = escribir
+        self.tam_lote = tam_lote
+        self.intervalo = intervalo
+        self.reintentos = reintentos
+        self.max_espera = max_espera
+        # Cada elemento es (momento en que se encoló, fila)
+        self._cola = queue.Queue(maxsize=max_pendientes)
+        self._hilo = None
+        self._lock = threading.Lock()
+        self.escritas = 0
+        self.descartadas = 0
+        self.perdidas = 0
+
+    def encolar(self, filas):
+        """No bloquea nunca: si la cola no se escribe o está llena, las filas se descartan."""
+        self._arrancar()
+        retraso = self.retraso()
+        if retraso > self.max_espera:
+            self.descartadas += len(filas)
+            logging.warning(f"[{self.nombre}] La cola lleva {retraso:.1f}s sin escribirse: se descartan {len(filas)} filas ({self.descartadas} en total).")
+            return
+
+        ahora = time.monotonic()
+        descartadas = 0
+        for fila in filas:
+            try:
+                self._cola.put_nowait((ahora, fila))
+            except queue.Full:
+                descartadas += 1
+        if descartadas:
+            self.descartadas += descartadas
+            logging.warning(f"[{self.nombre}] Cola llena: se descartan {descartadas} filas ({self.descartadas} en total).")
+
+    def retraso(self):
+        """Segundos que lleva en la cola la fila pendiente más antigua (0 si no hay)."""
+        with self._cola.mutex:
+            if not self._cola.queue:
+                return 0.0
+            return time.monotonic() - self._cola.queue[0][0]
+
+    def metricas(self):
+        return {
+            "escritas": self.escritas,
+            "descartadas": self.descartadas,
+            "perdidas": self.perdidas,
+            "pendientes": self._cola.qsize(),
+            "retraso_s": round(self.retraso(), 1),
+        }
+
+    def vaciar(self, timeout=30):
+        """Espera a que se escriba todo lo pendiente (al apagar la instancia)."""
+        if self._hilo is None:
+            return
+        limite = time.monotonic() + timeout
+        while self._cola.unfinished_tasks and time.monotonic() < limite:
+            time.sleep(0.05)
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name=f"escritor-{self.nombre}", daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()[1]]
+            limite = time.monotonic() + self.intervalo
+            while len(lote) < self.tam_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante)[1])
+                except queue.Empty:
+                    break
+            self._escribir_con_reintentos(lote)
+            for _ in lote:
+                self._cola.task_done()
+
+    def _escribir_con_reintentos(self, lote):
+        for intento in range(1, self.reintentos + 1):
+            try:
+                self.escribir(lote)
+                self.escritas += len(lote)
+                return
+            except Exception as e:
+                logging.warning(f"[{self.nombre}] Fallo escribiendo {len(lote)} filas (intento {intento}/{self.reintentos}): {e}")
+                time.sleep(min(2 ** intento, 30))
+        self.perdidas += len(lote)
+        logging.error(f"[{self.nombre}] Se pierden {len(lote)} filas tras {self.reintentos} intentos ({self.perdidas} en total).")
+
+
+class ColaLocal:
+    """Sustituto para pruebas: guarda las filas encoladas sin escribirlas."""
+
+    def __init__(self, nombre, escribir=None, **_):
+        self.nombre = nombre
+        self.filas = []
+
+    def encolar(self, filas):
+        self.filas.extend(filas)
+
+    def metricas(self):
+        return {"escritas": 0, "descartadas": 0, "perdidas": 0, "pendientes": len(self.filas),
+                "retraso_s": 0.0}
+
+    def vaciar(self, timeout=30):
+        pass
+
+
+def crear_escritor(nombre, escribir):
+    escritor = ColaLocal(nombre) if BQ_ESCRITOR == "local" else EscritorEnSegundoPlano(nombre, escribir)
+    atexit.register(escritor.vaciar)
+    return escritor
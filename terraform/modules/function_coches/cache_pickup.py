@@ -0,0 +1,170 @@
+"""
+Caché persistente de /car/auto-complete: ciudad -> ids de aeropuerto de recogida.
+
+La relación ciudad -> aeropuertos casi no cambia, así que cada ciudad se consulta
+en RapidAPI como mucho una vez cada PICKUP_CACHE_TTL segundos. Las entradas se
+guardan en:
+
+  * un fichero local (PICKUP_CACHE_PATH), que dura lo que la instancia;
+  * opcionalmente un objeto en Cloud Storage (PICKUP_CACHE_BUCKET), compartido
+    por todas las instancias y que sobrevive a los despliegues. Cada instancia
+    nueva arranca con él; semilla_pickup.py lo rellena con los destinos más
+    buscados antes de que nadie los pida.
+
+Al cargar, para cada ciudad gana la entrada más reciente de las dos fuentes.
+Las escrituras no bloquean la petición: se agrupan y las hace el escritor en
+segundo plano de escritor_bq.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+import urllib.parse
+
+import httpx
+
+from escritor_bq import crear_escritor
+
+PICKUP_CACHE_TTL = float(os.getenv("PICKUP_CACHE_TTL", str(30 * 24 * 3600)))
+PICKUP_CACHE_PATH = os.getenv("PICKUP_CACHE_PATH", "/tmp/pickup_cache.json")
+PICKUP_CACHE_BUCKET = os.getenv("PICKUP_CACHE_BUCKET")
+PICKUP_CACHE_OBJETO = os.getenv("PICKUP_CACHE_OBJETO", "pickup_cache.json")
+
+CAR_HOST = "booking-com18.p.rapidapi.com"
+
+
+def normalizar_ciudad(ciudad: str) -> str:
+    """'  Málaga ' y 'malaga' comparten entrada: sin acentos, minúsculas y espacios simples."""
+    sin_acentos = unicodedata.normalize("NFKD", ciudad or "")
+    sin_acentos = "".join(c for c in sin_acentos if not unicodedata.combining(c))
+    return " ".join(sin_acentos.casefold().split())
+
+
+def consultar_aeropuertos(ciudad: str, headers: dict, timeout: float = 30) -> list:
+    """Ids de tipo aeropuerto que devuelve /car/auto-complete. Lanza la excepción si falla."""
+    url = f"https://{CAR_HOST}/car/auto-complete?query={urllib.parse.quote(ciudad)}"
+    resp = httpx.get(url, headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    data = resp.json().get("data", [])
+    return [item.get("id") for item in data if item.get("type", "").lower() == "airport"]
+
+
+def _leer_json(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"No se pudo leer la caché de pickup {ruta}: {e}")
+        return {}
+
+
+class AlmacenGCS:
+    """Objeto JSON en Cloud Storage; la escritura solo sustituye la versión que se leyó."""
+
+    def __init__(self, bucket, objeto):
+        from google.cloud import storage
+
+        self.blob = storage.Client().bucket(bucket).blob(objeto)
+        self.generacion = 0
+
+    def leer(self):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.blob.reload()
+            self.generacion = self.blob.generation
+            return json.loads(self.blob.download_as_bytes(if_generation_match=self.generacion))
+        except NotFound:
+            self.generacion = 0
+            return {}
+
+    def escribir(self, entradas):
+        from google.api_core.exceptions import PreconditionFailed
+
+        try:
+            self.blob.upload_from_string(json.dumps(entradas, ensure_ascii=False), content_type="application/json",
+                                         if_generation_match=self.generacion)
+        except PreconditionFailed:
+            # Otra instancia escribió antes: se mezcla lo suyo con lo nuestro y se reintenta una vez
+            combinadas = _mezclar(self.leer(), entradas)
+            self.blob.upload_from_string(json.dumps(combinadas, ensure_ascii=False), content_type="application/json",
+                                         if_generation_match=self.generacion)
+        self.generacion = self.blob.generation
+
+
+def _mezclar(*fuentes):
+    """Une varios {ciudad: {"ids", "actualizado"}} quedándose con la entrada más reciente."""
+    resultado = {}
+    for fuente in fuentes:
+        for ciudad, entrada in (fuente or {}).items():
+            if not isinstance(entrada, dict) or not entrada.get("ids"):
+                continue
+            actual = resultado.get(ciudad)
+            if actual is None or entrada.get("actualizado", 0) > actual.get("actualizado", 0):
+                resultado[ciudad] = entrada
+    return resultado
+
+
+class CachePickup:
+    def __init__(self, ttl=PICKUP_CACHE_TTL, ruta=PICKUP_CACHE_PATH, bucket=PICKUP_CACHE_BUCKET,
+                 objeto=PICKUP_CACHE_OBJETO):
+        self.ttl = ttl
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.almacen = None
+        remotas = {}
+        if bucket:
+            try:
+                self.almacen = AlmacenGCS(bucket, objeto)
+                remotas = self.almacen.leer()
+            except Exception as e:
+                logging.warning(f"Caché de pickup en gs://{bucket}/{objeto} no disponible: {e}")
+        self._entradas = _mezclar(remotas, _leer_json(ruta))
+        # Cada elemento encolado es una ciudad modificada; un lote se persiste con una sola escritura
+        self._escritor = crear_escritor("pickup", lambda ciudades: self._persistir())
+        logging.info(f"Caché de pickup cargada con {len(self._entradas)} ciudades.")
+
+    def obtener(self, ciudad):
+        """Ids guardados para la ciudad, o None si no hay entrada o ha caducado."""
+        entrada = self._entradas.get(normalizar_ciudad(ciudad))
+        if entrada is None or time.time() - entrada.get("actualizado", 0) > self.ttl:
+            self.fallos += 1
+            return None
+        self.aciertos += 1
+        return list(entrada["ids"])
+
+    def guardar(self, ciudad, ids):
+        """No se guardan listas vacías: una ciudad sin aeropuertos se vuelve a consultar."""
+        if not ids:
+            return
+        clave = normalizar_ciudad(ciudad)
+        with self._lock:
+            self._entradas[clave] = {"ids": list(ids), "actualizado": time.time()}
+        self._escritor.encolar([clave])
+
+    def vaciar(self, timeout=30):
+        """Espera a que se persistan las entradas pendientes."""
+        self._escritor.vaciar(timeout)
+
+    def _persistir(self):
+        # Solo la copia se hace con el lock; el disco y Cloud Storage no bloquean a obtener/guardar
+        with self._lock:
+            entradas = dict(self._entradas)
+        try:
+            temporal = f"{self.ruta}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(entradas, f, ensure_ascii=False)
+            os.replace(temporal, self.ruta)
+        except OSError as e:
+            logging.warning(f"No se pudo guardar la caché de pickup en {self.ruta}: {e}")
+        if self.almacen is not None:
+            try:
+                self.almacen.escribir(entradas)
+            except Exception as e:
+                logging.warning(f"No se pudo guardar la caché de pickup en Cloud Storage: {e}")
@@ -1,7 +1,8 @@
+import asyncio
 import json
 import os
+import time
 import httpx
-import urllib.parse
 import pandas as pd
 from google.cloud import bigquery
 import functions_framework
@@ -9,12 +10,15 @@ import google.cloud.logging
 import logging
 import traceback
 
+from cache_pickup import CAR_HOST, CachePickup, consultar_aeropuertos
+from escritor_bq import crear_escritor
+from transformaciones import filtrar_nuevos, preparar_dataframe
+
 # Configuración
 PROJECT_ID = os.getenv("PROJECT_ID")
 DATASET = os.getenv("DATASET")
 TABLE = os.getenv("TABLE")
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
-CAR_HOST = "booking-com18.p.rapidapi.com"
 CAR_HEADERS = {
     "x-rapidapi-key": RAPIDAPI_KEY,
     "x-rapidapi-host": CAR_HOST
@@ -22,27 +26,77 @@ CAR_HEADERS = {
 DEFAULT_RATE = float(os.getenv("USD_TO_EUR_RATE", "0.9"))
 ENDPOINT_BASE = os.getenv("API_DATA_URL")
 ENDPOINT_COCHES_LIMPIOS = f"{ENDPOINT_BASE}/coches/limpios"
+# Búsqueda por aeropuerto: plazo global (la función tiene 60 s), máximo de peticiones simultáneas y timeout de cada una
+COCHES_PLAZO = float(os.getenv("COCHES_PLAZO", "45"))
+COCHES_CONCURRENCIA = int(os.getenv("COCHES_CONCURRENCIA", "4"))
+COCHES_TIMEOUT = float(os.getenv("COCHES_TIMEOUT", "40"))
 
 # Inicializar cliente de logging
 client_logging = google.cloud.logging.Client()
 client_logging.setup_logging()
 
+# Ciudad -> aeropuertos: se cachea en disco/Cloud Storage (calentado con semilla_pickup.py)
+cache_pickup = CachePickup()
+
 def obtener_pickup_ids(ciudad_destino: str) -> list:
+    airport_ids = cache_pickup.obtener(ciudad_destino)
+    if airport_ids is not None:
+        return airport_ids
     try:
-        with httpx.Client() as client:
-            query = urllib.parse.quote(ciudad_destino)
-            url = f"https://{CAR_HOST}/car/auto-complete?query={query}"
-            resp = client.get(url, headers=CAR_HEADERS, timeout=30)
-            resp.raise_for_status()
-            data = resp.json().get("data", [])
-            airport_ids = [item.get("id") for item in data if item.get("type", "").lower() == "airport"]
-            if not airport_ids:
-                raise ValueError(f"No se encontraron aeropuertos para {ciudad_destino}")
-            return airport_ids
+        airport_ids = consultar_aeropuertos(ciudad_destino, CAR_HEADERS)
+        if not airport_ids:
+            raise ValueError(f"No se encontraron aeropuertos para {ciudad_destino}")
+        cache_pickup.guardar(ciudad_destino, airport_ids)
+        return airport_ids
     except Exception as e:
         logging.error(f"Error in obtener_pickup_ids: {e}")
         return [] # Return empty list in case of error
 
+async def buscar_en_aeropuertos(pickup_ids, params_comunes, ciudad):
+    """
+    Busca en todos los aeropuertos a la vez con un único AsyncClient, como mucho
+    COCHES_CONCURRENCIA peticiones simultáneas y COCHES_PLAZO segundos en total.
+    Los resultados se incorporan según llegan; los aeropuertos que no responden
+    a tiempo quedan con la lista vacía y su error.
+    """
+    semaforo = asyncio.Semaphore(COCHES_CONCURRENCIA)
+    url_car = f"https://{CAR_HOST}/car/search"
+    todos_registros, resultados_por_aeropuerto = [], []
+    vacio = {"data": {"search_results": []}}
+
+    async with httpx.AsyncClient(timeout=COCHES_TIMEOUT, limits=httpx.Limits(max_connections=COCHES_CONCURRENCIA)) as client:
+        async def buscar(pid):
+            async with semaforo:
+                resp_car = await client.get(url_car, headers=CAR_HEADERS, params={"pickUpId": pid, **params_comunes})
+                resp_car.raise_for_status()
+                return pid, resp_car.json()
+
+        tareas = {asyncio.ensure_future(buscar(pid)): pid for pid in pickup_ids}
+        pendientes = set(tareas)
+        limite = time.monotonic() + COCHES_PLAZO
+        while pendientes:
+            hechas, pendientes = await asyncio.wait(pendientes, timeout=max(0, limite - time.monotonic()),
+                                                    return_when=asyncio.FIRST_COMPLETED)
+            if not hechas:
+                break
+            for tarea in hechas:
+                pid = tareas[tarea]
+                try:
+                    _, data_coches = tarea.result()
+                    todos_registros.extend(procesar_alquileres(data_coches, ciudad))
+                    resultados_por_aeropuerto.append({"pickUpId": pid, "resultados": data_coches})
+                except Exception as e:
+                    logging.error(f"Error fetching car data for pickup ID {pid}: {e}")
+                    resultados_por_aeropuerto.append({"pickUpId": pid, "resultados": vacio, "error": str(e)})
+
+        for tarea in pendientes:
+            tarea.cancel()
+            logging.warning(f"Sin respuesta del aeropuerto {tareas[tarea]} en {COCHES_PLAZO}s")
+            resultados_por_aeropuerto.append({"pickUpId": tareas[tarea], "resultados": vacio, "error": "timeout"})
+        await asyncio.gather(*pendientes, return_exceptions=True)
+
+    return todos_registros, resultados_por_aeropuerto
+
 def procesar_alquileres(data, ciudad, rate=DEFAULT_RATE):
     registros = []
     resultados = data.get('data', {}).get('search_results', [])
@@ -75,55 +129,46 @@ def procesar_alquileres(data, ciudad, rate=DEFAULT_RATE):
         })
     return registros
 
-def preparar_dataframe(registros):
-    df = pd.DataFrame(registros)
+def insertar_bigquery(df):
+    """Lanza la excepción si falla, para que el escritor en segundo plano reintente."""
     if df.empty:
-        return df
-    df['Asientos'] = df['Asientos'] = df['Asientos'].apply(extraer_asientos)
-    df['Precio'] = df['Precio'].fillna(0.0)
-    for col in ['Ciudad', 'Compañía', 'Vehículo', 'Categoría', 'Transmisión']:
-        df[col] = df[col].fillna('').astype(str)
-    return df
-
-def extraer_asientos(valor):
-    try:
-        if isinstance(valor, (int, float)):
-            return int(valor)
-        if isinstance(valor, str):
-            partes = [int(p) for p in valor.split("+") if p.isdigit()]
-            return sum(partes)
-    except:
-        pass
-    return 0
+        return
+    client = bigquery.Client(project=PROJECT_ID)
+    table_id = f"{PROJECT_ID}.{DATASET}.{TABLE}"
+
+    # === 1. Leer solo las claves de las ciudades buscadas ===
+    query = f"""
+        SELECT Ciudad, Compañía, Vehículo
+        FROM `{table_id}`
+        WHERE Ciudad IN UNNEST(@ciudades)
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("ciudades", "STRING", sorted(df['Ciudad'].unique().tolist()))
+    ])
+    existentes = client.query(query, job_config=job_config).result().to_arrow().to_pandas()
+
+    # === 2. Anti-join vectorizado por clave hasheada ===
+    df = filtrar_nuevos(df, existentes)
 
-def insertar_bigquery(df):
-    try:
-        if df.empty:
-            return
-        client = bigquery.Client(project=PROJECT_ID)
-        table_id = f"{PROJECT_ID}.{DATASET}.{TABLE}"
-
-        # === 1. Leer claves existentes ===
-        query = f"""
-            SELECT Ciudad, Compañía, Vehículo
-            FROM `{table_id}`
-        """
-        existentes = client.query(query).result()
-        claves_existentes = set((r.Ciudad, r.Compañía, r.Vehículo) for r in existentes)
-
-        # === 2. Filtrar duplicados en el dataframe ===
-        df = df[~df.apply(lambda row: (row['Ciudad'], row['Compañía'], row['Vehículo']) in claves_existentes, axis=1)]
-
-        if df.empty:
-            logging.info("⏩ No hay coches nuevos para insertar.")
-            return
-
-        # === 3. Insertar solo nuevos registros ===
-        job = client.load_table_from_dataframe(df, table_id)
-        job.result()
-        logging.info(f"✅ Insertados {len(df)} registros nuevos en BigQuery.")
-    except Exception as e:
-        logging.exception("Error al insertar en BigQuery")
+    if df.empty:
+        logging.info("⏩ No hay coches nuevos para insertar.")
+        return
+
+    # === 3. Insertar solo nuevos registros ===
+    job = client.load_table_from_dataframe(df, table_id)
+    job.result()
+    logging.info(f"✅ Insertados {len(df)} registros nuevos en BigQuery.")
+
+def enviar_limpios(registros):
+    with httpx.Client() as client:
+        resp = client.post(ENDPOINT_COCHES_LIMPIOS, headers={"Content-Type": "application/json"}, json=registros, timeout=30)
+    # Solo los errores de conexión se reintentan; una respuesta de error no mejora reenviando
+    if resp.status_code >= 400:
+        logging.warning(f"/coches/limpios respondió {resp.status_code}")
+
+# BigQuery y /coches/limpios se alimentan en segundo plano: la respuesta no espera a ninguno
+escritor_bq = crear_escritor("coches", lambda lote: insertar_bigquery(pd.DataFrame(lote)))
+escritor_limpios = crear_escritor("coches-limpios", enviar_limpios)
 
 @functions_framework.http
 def buscar_coches(request):
@@ -149,50 +194,23 @@ def buscar_coches(request):
         drop_off_date = pd.to_datetime(fecha_vuelta, dayfirst=True).strftime("%Y-%m-%d")
         pick_up_time = "10:00"
         drop_off_time = "10:00"
-        todos_registros = []
-        resultados_por_aeropuerto = []
-
-        for pid in pickup_ids:
-            params_car = {
-                "pickUpId": pid,
-                "pickUpDate": pick_up_date,
-                "pickUpTime": pick_up_time,
-                "dropOffDate": drop_off_date,
-                "dropOffTime": drop_off_time
-            }
-            url_car = f"https://{CAR_HOST}/car/search"
-            try:
-                with httpx.Client() as client:
-                    resp_car = client.get(url_car, headers=CAR_HEADERS, params=params_car, timeout=60)
-                    resp_car.raise_for_status()
-                    data_coches = resp_car.json()
-                    registros = procesar_alquileres(data_coches, ciudad)
-                    todos_registros.extend(registros)
-                    resultados_por_aeropuerto.append({
-                        "pickUpId": pid,
-                        "resultados": data_coches
-                    })
-            except Exception as e:
-                logging.error(f"Error fetching car data for pickup ID {pid}: {e}")
-                # Consider adding an empty list or a default structure to avoid further errors
-                resultados_por_aeropuerto.append({
-                    "pickUpId": pid,
-                    "resultados": {"data": {"search_results": []}}  # Ensure structure is correct
-                })
+        params_comunes = {
+            "pickUpDate": pick_up_date,
+            "pickUpTime": pick_up_time,
+            "dropOffDate": drop_off_date,
+            "dropOffTime": drop_off_time
+        }
+        todos_registros, resultados_por_aeropuerto = asyncio.run(
+            buscar_en_aeropuertos(pickup_ids, params_comunes, ciudad)
+        )
 
         df = preparar_dataframe(todos_registros)
-        insertar_bigquery(df)
         # Añadir esta línea para incluir los resultados en la respuesta HTTP
         resultados_json = df.to_dict(orient="records")
 
-        try:
-            if not df.empty:
-                headers = {"Content-Type": "application/json"}
-                payload = df.to_dict(orient="records")
-                with httpx.Client() as client:
-                    client.post(ENDPOINT_COCHES_LIMPIOS, headers=headers, json=payload)
-        except Exception as e:
-            logging.warning(f"No se pudo enviar a /coches/limpios: {str(e)}")
+        if resultados_json:
+            escritor_bq.encolar(resultados_json)
+            escritor_limpios.encolar(resultados_json)
 
         return {
             "ciudad_destino_aeropuerto": ciudad,
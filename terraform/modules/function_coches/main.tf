@@ -8,11 +8,28 @@ resource "random_id" "bucket_suffix" {
   byte_length = 4
 }
 
+# Código de la función más los módulos compartidos de modules/comun (escritor_bq.py)
+locals {
+  ficheros_funcion = {
+    for f in fileset(path.module, "*") : f => "${path.module}/${f}"
+    if !anytrue([for ext in [".tf", ".zip"] : endswith(f, ext)])
+  }
+  ficheros_zip = merge(local.ficheros_funcion, {
+    "escritor_bq.py" = "${path.module}/../comun/escritor_bq.py"
+  })
+}
+
 data "archive_file" "function_zip" {
   type        = "zip"
-  source_dir  = "${path.module}"
   output_path = "${path.module}/${var.name}.zip"
-  excludes    = ["*.tf", "*.zip"]
+
+  dynamic "source" {
+    for_each = local.ficheros_zip
+    content {
+      content  = file(source.value)
+      filename = source.key
+    }
+  }
 }
 
 resource "google_storage_bucket_object" "function_zip" {
@@ -40,7 +57,10 @@ resource "google_cloudfunctions2_function" "function_coches" {
   service_config {
     available_memory = "512M"
     timeout_seconds  = 60
-    environment_variables = var.env_variables
+    # La caché de aeropuertos de recogida se comparte entre instancias en el bucket del código
+    environment_variables = merge(var.env_variables, {
+      PICKUP_CACHE_BUCKET = google_storage_bucket.function_bucket.name
+    })
   }
 }
 
@@ -0,0 +1,51 @@
+"""
+Calienta la caché compartida de aeropuertos de recogida consultando
+/car/auto-complete para los destinos más buscados, de modo que cada instancia
+nueva los encuentre ya en el objeto de Cloud Storage que carga al arrancar.
+
+    PICKUP_CACHE_BUCKET=zip-coches-storage RAPIDAPI_KEY=... python semilla_pickup.py destinos_top.txt
+
+Hay que ejecutarlo desde un entorno con los módulos compartidos
+(PYTHONPATH=../comun). Las ciudades que ya están en la caché y no han caducado
+no se vuelven a consultar (salvo con --todas).
+"""
+import argparse
+import os
+import sys
+
+from cache_pickup import CAR_HOST, PICKUP_CACHE_BUCKET, CachePickup, consultar_aeropuertos
+
+
+def main(args):
+    if not PICKUP_CACHE_BUCKET:
+        sys.exit("Falta PICKUP_CACHE_BUCKET: sin bucket la caché solo duraría lo que este proceso")
+    headers = {"x-rapidapi-key": os.environ["RAPIDAPI_KEY"], "x-rapidapi-host": CAR_HOST}
+    with open(args.destinos, encoding="utf-8") as f:
+        ciudades = [linea.strip() for linea in f if linea.strip() and not linea.startswith("#")]
+
+    cache = CachePickup()
+    consultadas = 0
+    for ciudad in ciudades:
+        if not args.todas and cache.obtener(ciudad) is not None:
+            continue
+        try:
+            ids = consultar_aeropuertos(ciudad, headers)
+        except Exception as e:
+            print(f"{ciudad}: error {e}", file=sys.stderr)
+            continue
+        consultadas += 1
+        if ids:
+            cache.guardar(ciudad, ids)
+            print(f"{ciudad}: {len(ids)} aeropuertos")
+        else:
+            print(f"{ciudad}: sin aeropuertos", file=sys.stderr)
+
+    cache.vaciar()
+    print(f"{consultadas} consultas, caché en gs://{PICKUP_CACHE_BUCKET}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calienta la caché de aeropuertos de recogida")
+    parser.add_argument("destinos", help="Fichero con una ciudad por línea")
+    parser.add_argument("--todas", action="store_true", help="Vuelve a consultar también las que no han caducado")
+    main(parser.parse_args())
@@ -0,0 +1,57 @@
+"""
+Transformaciones de pandas de la función de coches, separadas de main.py para
+poder usarlas (y medirlas) sin clientes de Google Cloud.
+"""
+import numpy as np
+import pandas as pd
+
+COLUMNAS_CLAVE = ['Ciudad', 'Compañía', 'Vehículo']
+COLUMNAS_TEXTO = ['Ciudad', 'Compañía', 'Vehículo', 'Categoría', 'Transmisión']
+
+
+def _asientos(valor) -> int:
+    try:
+        if isinstance(valor, (int, float)):
+            return int(valor)
+        if isinstance(valor, str):
+            return sum(int(p) for p in valor.split("+") if p.isdigit())
+    except (ValueError, OverflowError):
+        pass
+    return 0
+
+
+def extraer_asientos(serie: pd.Series) -> pd.Series:
+    """
+    Asientos como entero: los números se truncan, los textos tipo "4+1" suman sus
+    partes numéricas y el resto vale 0. La columna tiene muy pocos valores
+    distintos, así que se factoriza y la regla se aplica una vez por valor único.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.where(np.isfinite(serie), 0).astype('int64')
+    codigos, unicos = pd.factorize(serie)
+    # El código -1 (nulos) cae en el último elemento, que vale 0
+    valores = np.array([_asientos(v) for v in unicos] + [0], dtype='int64')
+    return pd.Series(valores[codigos], index=serie.index)
+
+
+def preparar_dataframe(registros):
+    df = pd.DataFrame(registros)
+    if df.empty:
+        return df
+    df['Asientos'] = extraer_asientos(df['Asientos'])
+    df['Precio'] = df['Precio'].fillna(0.0)
+    for col in COLUMNAS_TEXTO:
+        df[col] = df[col].fillna('').astype(str)
+    return df
+
+
+def clave_coche(df: pd.DataFrame) -> pd.Series:
+    """Hash uint64 de (Ciudad, Compañía, Vehículo), calculado de forma vectorizada."""
+    return pd.util.hash_pandas_object(df[COLUMNAS_CLAVE].astype(str), index=False)
+
+
+def filtrar_nuevos(df: pd.DataFrame, existentes: pd.DataFrame) -> pd.DataFrame:
+    """Anti-join por la clave hasheada: filas de df sin clave en existentes, sin repetir clave."""
+    claves = clave_coche(df)
+    nuevos = ~claves.isin(clave_coche(existentes)) if not existentes.empty else pd.Series(True, index=df.index)
+    return df[nuevos & ~claves.duplicated()]
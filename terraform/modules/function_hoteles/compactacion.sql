@@ -0,0 +1,33 @@
+-- Compactación periódica de la tabla de hoteles (consulta programada).
+-- La función inserta por streaming con insertId determinista, que solo deduplica
+-- reintentos cercanos en el tiempo: aquí se deja una fila por (Nombre, FechaEntrada,
+-- FechaSalida), la más reciente. Las filas de la última hora y media se ignoran
+-- porque pueden seguir en el buffer de streaming, donde no se admite DML.
+DECLARE corte TIMESTAMP DEFAULT TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 90 MINUTE);
+
+CREATE TEMP TABLE unicos AS
+SELECT * EXCEPT (rn)
+FROM (
+  SELECT
+    *,
+    ROW_NUMBER() OVER (PARTITION BY Nombre, FechaEntrada, FechaSalida ORDER BY InsertadoEn DESC) AS rn,
+    COUNT(*) OVER (PARTITION BY Nombre, FechaEntrada, FechaSalida) AS copias
+  FROM `${tabla}`
+  WHERE COALESCE(InsertadoEn, TIMESTAMP '1970-01-01') < corte
+    -- Con claves nulas el DELETE no casaría y la fila se duplicaría al reinsertarla
+    AND Nombre IS NOT NULL AND FechaEntrada IS NOT NULL AND FechaSalida IS NOT NULL
+)
+WHERE rn = 1 AND copias > 1;
+
+BEGIN TRANSACTION;
+
+DELETE FROM `${tabla}` T
+WHERE COALESCE(T.InsertadoEn, TIMESTAMP '1970-01-01') < corte
+  AND EXISTS (
+    SELECT 1 FROM unicos U
+    WHERE U.Nombre = T.Nombre AND U.FechaEntrada = T.FechaEntrada AND U.FechaSalida = T.FechaSalida
+  );
+
+INSERT INTO `${tabla}` SELECT * EXCEPT (copias) FROM unicos;
+
+COMMIT TRANSACTION;
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import logging
@@ -5,6 +6,7 @@ from datetime import datetime
 from serpapi import GoogleSearch
 from flask import jsonify
 from google.cloud import bigquery
+from escritor_bq import crear_escritor
 
 # === CONFIGURACIÓN ===
 SERPAPI_KEY = os.environ.get("SERPAPI_KEY")
@@ -61,36 +63,43 @@ def limpiar_hoteles(data, payload):
     return hoteles
 
 # === BIGQUERY ===
-def insertar_en_bigquery(hoteles):
-    client = bigquery.Client(project=PROJECT_ID)
-    tabla_ref = f"{PROJECT_ID}.{DATASET}.{TABLE}"
+def id_fila(hotel):
+    """insertId determinista: el mismo hotel y fechas producen siempre el mismo id."""
+    clave = "|".join(str(hotel.get(c, "")) for c in ("Nombre", "FechaEntrada", "FechaSalida"))
+    return hashlib.sha256(clave.encode("utf-8")).hexdigest()
 
-    # 1. Leer claves existentes en la tabla
-    query = f"""
-        SELECT Nombre, FechaEntrada, FechaSalida
-        FROM `{tabla_ref}`
+def insertar_en_bigquery(hoteles):
     """
-    existentes = client.query(query).result()
-    claves_existentes = set((r.Nombre, str(r.FechaEntrada), str(r.FechaSalida)) for r in existentes)
-
-    # 2. Filtrar hoteles nuevos
-    nuevos_hoteles = [
-        h for h in hoteles
-        if (h["Nombre"], h["FechaEntrada"], h["FechaSalida"]) not in claves_existentes
-    ]
+    Inserción por streaming sin leer la tabla antes. BigQuery descarta (best effort)
+    los reintentos con el mismo insertId en unos minutos; los duplicados que queden
+    los elimina la consulta programada compactacion.sql.
+    """
+    insertado_en = datetime.utcnow().isoformat()
+    filas = {}
+    for hotel in hoteles:
+        filas.setdefault(id_fila(hotel), dict(hotel, InsertadoEn=insertado_en))
 
-    if not nuevos_hoteles:
-        logging.info("⏩ No hay hoteles nuevos para insertar.")
+    if not filas:
+        logging.info("⏩ No hay hoteles que insertar.")
         return True
 
-    # 3. Insertar solo los nuevos
-    errors = client.insert_rows_json(tabla_ref, nuevos_hoteles)
+    client = bigquery.Client(project=PROJECT_ID)
+    tabla_ref = f"{PROJECT_ID}.{DATASET}.{TABLE}"
+    errors = client.insert_rows_json(tabla_ref, list(filas.values()), row_ids=list(filas.keys()))
     if not errors:
-        logging.info(f"✅ Insertados {len(nuevos_hoteles)} hoteles en BigQuery.")
+        logging.info(f"✅ Insertados {len(filas)} hoteles en BigQuery.")
         return True
     else:
         logging.error(f"❌ Errores al insertar en BigQuery: {errors}")
         return False
+
+def escribir_lote(hoteles):
+    if not insertar_en_bigquery(hoteles):
+        raise RuntimeError("Inserción de hoteles fallida")
+
+# Las filas se escriben en segundo plano: la respuesta no espera a BigQuery
+escritor = crear_escritor("hoteles", escribir_lote)
+
 # === CLOUD FUNCTION ENTRY POINT ===
 def buscar_hoteles(request):
     try:
@@ -104,11 +113,8 @@ def buscar_hoteles(request):
         resultado = buscar_en_serpapi(payload)
         hoteles = limpiar_hoteles(resultado, payload)
 
-        exito = insertar_en_bigquery(hoteles)
-        if exito:
-            return jsonify(hoteles), 200
-        else:
-            return jsonify({"error": "Error al insertar en BigQuery"}), 500
+        escritor.encolar(hoteles)
+        return jsonify(hoteles), 200
 
     except Exception as e:
         logging.error(f"💥 Error general: {e}", exc_info=True)
@@ -8,11 +8,28 @@ resource "random_id" "bucket_suffix" {
   byte_length = 4
 }
 
+# Código de la función más los módulos compartidos de modules/comun (escritor_bq.py)
+locals {
+  ficheros_funcion = {
+    for f in fileset(path.module, "*") : f => "${path.module}/${f}"
+    if !anytrue([for ext in [".tf", ".zip", ".sql"] : endswith(f, ext)])
+  }
+  ficheros_zip = merge(local.ficheros_funcion, {
+    "escritor_bq.py" = "${path.module}/../comun/escritor_bq.py"
+  })
+}
+
 data "archive_file" "function_zip" {
   type        = "zip"
-  source_dir  = "${path.module}"
   output_path = "${path.module}/${var.name}.zip"
-  excludes    = ["*.tf", "*.zip"]
+
+  dynamic "source" {
+    for_each = local.ficheros_zip
+    content {
+      content  = file(source.value)
+      filename = source.key
+    }
+  }
 }
 
 resource "google_storage_bucket_object" "function_zip" {
@@ -52,4 +69,17 @@ resource "google_cloudfunctions2_function" "function_hoteles" {
   member   = "allUsers"
 }
 
- 
+# Consulta programada que elimina los duplicados residuales de la inserción por streaming
+resource "google_bigquery_data_transfer_config" "compactacion_hoteles" {
+  project                = var.project_id
+  display_name           = "compactacion-${var.name}"
+  # El dataset se crea sin ubicación explícita, es decir, en US
+  location               = "US"
+  data_source_id         = "scheduled_query"
+  schedule               = var.compaction_schedule
+  params = {
+    query = templatefile("${path.module}/compactacion.sql", {
+      tabla = "${var.project_id}.${var.env_variables["DATASET"]}.${var.env_variables["TABLE"]}"
+    })
+  }
+}
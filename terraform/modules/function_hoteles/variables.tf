@@ -15,3 +15,9 @@ variable "region" {
   description = "Región de GCP donde se desplegarán los recursos."
   type        = string
 }
+
+variable "compaction_schedule" {
+  description = "Frecuencia de la compactación de duplicados de la tabla de hoteles."
+  type        = string
+  default     = "every 24 hours"
+}
@@ -1,10 +1,16 @@
+import datetime
+import hashlib
 import http.client
 import json
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from urllib.parse import urlencode
 from serpapi import GoogleSearch
 from google.cloud import bigquery
-from flask import jsonify
+from flask import Response, jsonify
+from escritor_bq import crear_escritor
 import logging  # Importa la biblioteca de logging
 
 # === CONFIGURACIÓN ===
@@ -13,6 +19,51 @@ RAPIDAPI_KEY = os.environ.get("RAPIDAPI_KEY")
 PROJECT_ID = os.environ.get("PROJECT_ID")
 DATASET = os.environ.get("DATASET")
 TABLE = os.environ.get("TABLE")
+# Plazo máximo (segundos) de cada proveedor; pasado ese tiempo se responde sin él
+BOOKING_TIMEOUT = float(os.environ.get("BOOKING_TIMEOUT", "25"))
+SERPAPI_TIMEOUT = float(os.environ.get("SERPAPI_TIMEOUT", "25"))
+
+# Pool reutilizado entre peticiones de la misma instancia de la función
+EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# Modo fechas flexibles: ±FLEX_MAX_DIAS como mucho, FLEX_PLAZO segundos en total y, por
+# proveedor, tantas búsquedas simultáneas como permita su límite de peticiones
+FLEX_MAX_DIAS = int(os.environ.get("FLEX_MAX_DIAS", "3"))
+FLEX_PLAZO = float(os.environ.get("FLEX_PLAZO", "50"))
+# Búsquedas por proveedor en cola o en marcha (también las de peticiones que ya agotaron su plazo)
+FLEX_MAX_EN_CURSO = int(os.environ.get("FLEX_MAX_EN_CURSO", str(2 * (2 * FLEX_MAX_DIAS + 1))))
+
+class PoolAcotado:
+    """
+    Pool de un proveedor que cuenta sus búsquedas sin terminar. Una búsqueda que
+    agota FLEX_PLAZO no se puede interrumpir y sigue ocupando un hilo, así que
+    con max_en_curso pendientes no se aceptan más en vez de acumularlas.
+    """
+
+    def __init__(self, hilos, max_en_curso=FLEX_MAX_EN_CURSO):
+        self._pool = ThreadPoolExecutor(max_workers=hilos)
+        self._max_en_curso = max_en_curso
+        self._en_curso = 0
+        self._lock = threading.Lock()
+
+    def _terminado(self, _):
+        with self._lock:
+            self._en_curso -= 1
+
+    def enviar(self, funcion, *args):
+        """El futuro de la búsqueda, o None si el proveedor está saturado."""
+        with self._lock:
+            if self._en_curso >= self._max_en_curso:
+                return None
+            self._en_curso += 1
+        futuro = self._pool.submit(funcion, *args)
+        futuro.add_done_callback(self._terminado)
+        return futuro
+
+FLEX_POOLS = {
+    "booking": PoolAcotado(int(os.environ.get("FLEX_CONCURRENCIA_BOOKING", "3"))),
+    "serpapi": PoolAcotado(int(os.environ.get("FLEX_CONCURRENCIA_SERPAPI", "3"))),
+}
 
 # === HEADERS BOOKING ===
 RAPIDAPI_HOST = "booking-com18.p.rapidapi.com"
@@ -33,7 +84,7 @@ def ms_a_duracion(ms):
 
 # === BOOKING ===
 def buscar_en_booking(payload):
-    conn = http.client.HTTPSConnection(RAPIDAPI_HOST)
+    conn = http.client.HTTPSConnection(RAPIDAPI_HOST, timeout=BOOKING_TIMEOUT)
     params = {
         "fromId": payload["ciudad_origen"],
         "toId": payload["ciudad_destino"],
@@ -95,6 +146,7 @@ def buscar_en_serpapi(payload):
     if payload["tipo_de_viaje"] == 1:
         params["return_date"] = payload["fecha_vuelta"]
     search = GoogleSearch(params)
+    search.timeout = SERPAPI_TIMEOUT
     return search.get_dict()
 
 def limpiar_serpapi(data):
@@ -131,37 +183,255 @@ def limpiar_serpapi(data):
                 logging.error(f"[SerpAPI] Error: {e}", exc_info=True)  # Loguea el error con detalle
     return vuelos
 
+# === BÚSQUEDA CONCURRENTE ===
+def proveedores_segun_terminan(payload):
+    """
+    Lanza Booking y SerpAPI a la vez y devuelve (nombre, vuelos, estado) de cada
+    proveedor en cuanto termina o agota su plazo, sin esperar al otro. El estado
+    es {"estado": ok|timeout|error, "vuelos", "ms"[, "error"]}.
+    """
+    proveedores = {
+        "booking": (lambda: limpiar_booking(buscar_en_booking(payload)), BOOKING_TIMEOUT),
+        "serpapi": (lambda: limpiar_serpapi(buscar_en_serpapi(payload)), SERPAPI_TIMEOUT),
+    }
+    inicio = time.monotonic()
+
+    def cronometrar(funcion):
+        # Duración medida al terminar el proveedor, no al recoger su resultado
+        resultado = funcion()
+        return resultado, round((time.monotonic() - inicio) * 1000)
+
+    futuros = {EXECUTOR.submit(cronometrar, funcion): nombre for nombre, (funcion, _) in proveedores.items()}
+    limites = {futuro: inicio + proveedores[nombre][1] for futuro, nombre in futuros.items()}
+    pendientes = set(futuros)
+    while pendientes:
+        hechos, pendientes = wait(pendientes, timeout=max(0, min(limites[f] for f in pendientes) - time.monotonic()),
+                                  return_when=FIRST_COMPLETED)
+        for futuro in hechos:
+            nombre = futuros[futuro]
+            try:
+                resultado, ms = futuro.result()
+                yield nombre, resultado, {"estado": "ok", "vuelos": len(resultado), "ms": ms}
+            except Exception as e:
+                logging.error(f"[{nombre}] Error: {e}", exc_info=True)
+                yield nombre, [], {"estado": "error", "vuelos": 0, "ms": round((time.monotonic() - inicio) * 1000), "error": str(e)}
+        for futuro in [f for f in pendientes if limites[f] <= time.monotonic()]:
+            pendientes.discard(futuro)
+            nombre, plazo = futuros[futuro], proveedores[futuros[futuro]][1]
+            logging.warning(f"[{nombre}] Sin respuesta en {plazo}s, se responde sin sus vuelos.")
+            yield nombre, [], {"estado": "timeout", "vuelos": 0, "ms": round(plazo * 1000)}
+
+def consultar_proveedores(payload):
+    """Todos los vuelos de los proveedores que respondieron y el estado de cada proveedor."""
+    vuelos, estado = [], {}
+    for nombre, resultado, estado_proveedor in proveedores_segun_terminan(payload):
+        vuelos.extend(resultado)
+        estado[nombre] = estado_proveedor
+    return vuelos, estado
+
+def lineas_ndjson(payload):
+    """
+    Modo streaming: una línea {"tipo": "vuelo", ...} por vuelo limpio en cuanto su
+    proveedor termina, una {"tipo": "proveedor", ...} con el estado de cada uno y
+    una última {"tipo": "fin", "ok": ..., "proveedores": {...}}. La respuesta ya
+    salió con 200, así que "ok": false es lo que indica que ningún proveedor
+    respondió (la pasarela no la cachea).
+    """
+    estado = {}
+    for nombre, resultado, estado_proveedor in proveedores_segun_terminan(payload):
+        estado[nombre] = estado_proveedor
+        escritor.encolar(resultado)
+        for vuelo in resultado:
+            yield json.dumps({"tipo": "vuelo", **vuelo}, ensure_ascii=False) + "\n"
+        yield json.dumps({"tipo": "proveedor", "proveedor": nombre, **estado_proveedor}, ensure_ascii=False) + "\n"
+    logging.info(f"Proveedores procesados: {estado}")
+    ok = any(e["estado"] == "ok" for e in estado.values())
+    if not ok:
+        logging.error("Ningún proveedor de vuelos respondió.")
+    yield json.dumps({"tipo": "fin", "ok": ok, "proveedores": estado}, ensure_ascii=False) + "\n"
+
+# === FECHAS FLEXIBLES ===
+def fechas_flexibles(payload, dias):
+    """Payloads de la ventana ±dias alrededor de fecha_salida (la vuelta se desplaza igual), sin días pasados."""
+    salida = datetime.date.fromisoformat(payload["fecha_salida"])
+    vuelta = datetime.date.fromisoformat(payload["fecha_vuelta"]) if payload.get("fecha_vuelta") else None
+    hoy = datetime.date.today()
+    payloads = {}
+    for desplazamiento in range(-dias, dias + 1):
+        dia = salida + datetime.timedelta(days=desplazamiento)
+        if dia < hoy:
+            continue
+        payload_dia = dict(payload, fecha_salida=dia.isoformat())
+        if vuelta:
+            payload_dia["fecha_vuelta"] = (vuelta + datetime.timedelta(days=desplazamiento)).isoformat()
+        payloads[dia] = payload_dia
+    return payloads
+
+def mejores_por_clave(vuelos):
+    """Quita ofertas repetidas (mismo vuelo en los dos proveedores o en dos búsquedas) quedándose con la más barata."""
+    mejores = {}
+    for vuelo in vuelos:
+        clave = clave_vuelo(vuelo)
+        if clave not in mejores or vuelo.get("PrecioEur", 0) < mejores[clave].get("PrecioEur", 0):
+            mejores[clave] = vuelo
+    return list(mejores.values())
+
+def calendario_precios(payload, dias):
+    """
+    Busca cada día de la ventana en Booking y SerpAPI a la vez (acotado por
+    FLEX_POOLS) y devuelve un calendario compacto: precio mínimo, número de
+    ofertas y mejor oferta por día, además del día más barato.
+    """
+    payloads = fechas_flexibles(payload, dias)
+    busquedas = {
+        "booking": lambda p: limpiar_booking(buscar_en_booking(p)),
+        "serpapi": lambda p: limpiar_serpapi(buscar_en_serpapi(p)),
+    }
+    vuelos_por_dia = {dia: [] for dia in payloads}
+    estado = {dia: {} for dia in payloads}
+    futuros = {}
+    for dia, payload_dia in payloads.items():
+        for nombre, buscar in busquedas.items():
+            futuro = FLEX_POOLS[nombre].enviar(buscar, payload_dia)
+            if futuro is None:
+                estado[dia][nombre] = "saturado"
+            else:
+                futuros[futuro] = (dia, nombre)
+    if any(e == "saturado" for proveedores in estado.values() for e in proveedores.values()):
+        logging.warning("⚠️ Proveedores saturados por búsquedas flexibles anteriores; hay días sin consultar.")
+    hechos, pendientes = wait(futuros, timeout=FLEX_PLAZO)
+
+    for futuro in hechos:
+        dia, nombre = futuros[futuro]
+        try:
+            resultado = futuro.result()
+            # Booking también devuelve el tramo de vuelta: el calendario es por día de salida
+            vuelos_por_dia[dia].extend(v for v in resultado if fecha_vuelo(v) in (dia, None))
+            estado[dia][nombre] = "ok"
+        except Exception as e:
+            logging.error(f"[{nombre} {dia}] Error: {e}", exc_info=True)
+            estado[dia][nombre] = "error"
+    for futuro in pendientes:
+        # Las que aún no habían empezado se quitan de la cola; las que están en marcha siguen contando en el pool
+        futuro.cancel()
+        dia, nombre = futuros[futuro]
+        estado[dia][nombre] = "timeout"
+
+    calendario, todos = [], []
+    for dia in sorted(payloads):
+        vuelos = mejores_por_clave(vuelos_por_dia[dia])
+        todos.extend(vuelos)
+        mejor = min(vuelos, key=lambda v: v.get("PrecioEur", 0), default=None)
+        calendario.append({
+            "fecha_salida": dia.isoformat(),
+            "fecha_vuelta": payloads[dia].get("fecha_vuelta"),
+            "precio_min": mejor["PrecioEur"] if mejor else None,
+            "ofertas": len(vuelos),
+            "mejor": mejor,
+            "proveedores": estado[dia],
+        })
+    con_precio = [d for d in calendario if d["precio_min"] is not None]
+    mejor_dia = min(con_precio, key=lambda d: d["precio_min"])["fecha_salida"] if con_precio else None
+    return {"calendario": calendario, "mejor_dia": mejor_dia}, todos
+
 # === BIGQUERY ===
+# Columnas del vuelo y nombre ASCII con el que viajan en el parámetro STRUCT del MERGE
+COLUMNAS_BQ = [
+    ("Compañia", "compania", "STRING"),
+    ("Aerolinea", "aerolinea", "STRING"),
+    ("PrecioEur", "precio_eur", "INT64"),
+    ("FechaSalida", "fecha_salida", "STRING"),
+    ("FechaLlegada", "fecha_llegada", "STRING"),
+    ("Duración", "duracion", "STRING"),
+    ("Escalas", "escalas", "INT64"),
+    ("EscalasEn", "escalas_en", "STRING"),
+    ("LogoUrl", "logo_url", "STRING"),
+    ("EnlaceCompra", "enlace_compra", "STRING"),
+    ("ClaveVuelo", "clave_vuelo", "STRING"),
+    ("FechaVuelo", "fecha_vuelo", "DATE"),
+]
+
+def clave_vuelo(vuelo):
+    """Hash estable de la clave natural (Aerolinea + FechaSalida + FechaLlegada)."""
+    clave = "|".join(str(vuelo.get(c, "")) for c in ("Aerolinea", "FechaSalida", "FechaLlegada"))
+    return hashlib.sha256(clave.encode("utf-8")).hexdigest()
+
+def fecha_vuelo(vuelo):
+    """Día de salida (columna de partición); None si FechaSalida no empieza por una fecha ISO."""
+    try:
+        return datetime.date.fromisoformat(str(vuelo.get("FechaSalida", ""))[:10])
+    except ValueError:
+        return None
+
+def filas_para_merge(vuelos):
+    """
+    Añade ClaveVuelo/FechaVuelo y deja una fila por clave: MERGE falla si dos filas de origen casan con la misma.
+    Los vuelos sin FechaVuelo se descartan: el ON del MERGE filtra por fecha y nunca los encontraría,
+    así que se insertarían de nuevo en cada búsqueda.
+    """
+    filas, sin_fecha = {}, 0
+    for vuelo in vuelos:
+        fila = dict(vuelo, ClaveVuelo=clave_vuelo(vuelo), FechaVuelo=fecha_vuelo(vuelo))
+        if fila["FechaVuelo"] is None:
+            sin_fecha += 1
+            continue
+        filas.setdefault(fila["ClaveVuelo"], fila)
+    if sin_fecha:
+        logging.warning(f"⚠️ {sin_fecha} vuelos sin FechaSalida ISO descartados del MERGE.")
+    return list(filas.values())
+
 def insertar_en_bigquery(vuelos, PROJECT_ID, DATASET, TABLE):
+    """
+    Upsert idempotente con un MERGE parametrizado. El destino se filtra por las
+    fechas del lote (partición FechaVuelo) y por ClaveVuelo (clustering),
+    así que el coste no depende del tamaño de la tabla.
+    """
+    filas = filas_para_merge(vuelos)
+    if not filas:
+        logging.info("⏩ No hay vuelos que guardar.")
+        return True
+
     client = bigquery.Client(project=PROJECT_ID)
     tabla_ref = f"{PROJECT_ID}.{DATASET}.{TABLE}"
 
-    # 1. Consultar claves existentes (usamos Aerolinea + FechaSalida + FechaLlegada)
+    parametro_vuelos = bigquery.ArrayQueryParameter("vuelos", "STRUCT", [
+        bigquery.StructQueryParameter(None, *[
+            bigquery.ScalarQueryParameter(alias, tipo, fila.get(columna)) for columna, alias, tipo in COLUMNAS_BQ
+        ])
+        for fila in filas
+    ])
+    fechas = sorted({fila["FechaVuelo"] for fila in filas})
+    parametro_fechas = bigquery.ArrayQueryParameter("fechas", "DATE", fechas)
+
+    columnas = ", ".join(f"`{columna}`" for columna, _, _ in COLUMNAS_BQ)
+    valores = ", ".join(f"S.{alias}" for _, alias, _ in COLUMNAS_BQ)
+    # Precio y enlaces cambian entre búsquedas: se actualizan en las filas que ya existen
+    actualizar = ", ".join(
+        f"`{columna}` = S.{alias}" for columna, alias, _ in COLUMNAS_BQ if columna in ("PrecioEur", "EnlaceCompra", "LogoUrl", "Compañia")
+    )
     query = f"""
-        SELECT Aerolinea, FechaSalida, FechaLlegada
-        FROM `{tabla_ref}`
+        MERGE `{tabla_ref}` T
+        USING UNNEST(@vuelos) S
+        ON T.FechaVuelo IN UNNEST(@fechas) AND T.ClaveVuelo = S.clave_vuelo
+        WHEN MATCHED THEN UPDATE SET {actualizar}
+        WHEN NOT MATCHED THEN INSERT ({columnas}) VALUES ({valores})
     """
-    existentes = client.query(query).result()
-    claves_existentes = set((r.Aerolinea, str(r.FechaSalida), str(r.FechaLlegada)) for r in existentes)
-
-    # 2. Filtrar vuelos nuevos
-    nuevos_vuelos = [
-        v for v in vuelos
-        if (v["Aerolinea"], v["FechaSalida"], v["FechaLlegada"]) not in claves_existentes
-    ]
+    try:
+        job = client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=[parametro_vuelos, parametro_fechas]))
+        job.result()
+    except Exception as e:
+        logging.error(f"❌ Errores al guardar en BigQuery: {e}", exc_info=True)
+        return False
+    logging.info(f"✅ MERGE de {len(filas)} vuelos en BigQuery ({job.num_dml_affected_rows} filas afectadas, "
+                 f"{job.total_bytes_processed or 0} bytes procesados).")
+    return True
 
-    if not nuevos_vuelos:
-        logging.info("⏩ No hay vuelos nuevos para insertar.")
-        return True
+def escribir_lote(vuelos):
+    if not insertar_en_bigquery(vuelos, PROJECT_ID, DATASET, TABLE):
+        raise RuntimeError("MERGE de vuelos fallido")
 
-    # 3. Insertar solo los nuevos
-    errors = client.insert_rows_json(tabla_ref, nuevos_vuelos)
-    if not errors:
-        logging.info(f"✅ Insertados {len(nuevos_vuelos)} registros nuevos en BigQuery.")
-        return True
-    else:
-        logging.error(f"❌ Errores al insertar en BigQuery: {errors}")
-        return False
+# Las filas se escriben en segundo plano: la respuesta no espera a BigQuery
+escritor = crear_escritor("vuelos", escribir_lote)
 
 # === MAIN (Cloud Function Entry Point) ===
 def buscar_vuelos(request):
@@ -177,27 +447,49 @@ def buscar_vuelos(request):
 
         payload = request_json
 
-        logging.info("🔎 Booking...")
-        resultado_booking = buscar_en_booking(payload)
-        vuelos_booking = limpiar_booking(resultado_booking)
-        logging.info("Resultados de Booking procesados.")
+        # Con "flex_dias" se devuelve el calendario de precios de ±flex_dias alrededor de fecha_salida
+        if payload.get("flex_dias"):
+            try:
+                dias = int(payload["flex_dias"])
+                datetime.date.fromisoformat(payload.get("fecha_salida", ""))
+                if payload.get("fecha_vuelta"):
+                    datetime.date.fromisoformat(payload["fecha_vuelta"])
+            except (TypeError, ValueError):
+                return jsonify({"error": "flex_dias debe ser un entero y las fechas, YYYY-MM-DD"}), 400
+            if dias < 1:
+                return jsonify({"error": "flex_dias debe ser mayor que 0"}), 400
+            dias = min(dias, FLEX_MAX_DIAS)
+            if not fechas_flexibles(payload, dias):
+                return jsonify({"error": f"Todos los días de la ventana ±{dias} ya han pasado"}), 400
+            logging.info(f"🔎 Calendario de precios ±{dias} días...")
+            calendario, vuelos = calendario_precios(payload, dias)
+            if all(e != "ok" for dia in calendario["calendario"] for e in dia["proveedores"].values()):
+                return jsonify({"error": "Ningún proveedor de vuelos respondió", **calendario}), 502
+            escritor.encolar(vuelos)
+            return jsonify(calendario), 200
+
+        # Con "stream" (o Accept: application/x-ndjson) los vuelos salen según llega cada proveedor
+        if payload.get("stream") or "application/x-ndjson" in request.headers.get("Accept", ""):
+            logging.info("🔎 Booking + SerpAPI (streaming)...")
+            return Response(lineas_ndjson(payload), mimetype="application/x-ndjson")
 
-        logging.info("🔎 SerpAPI...")
-        resultado_serpapi = buscar_en_serpapi(payload)
-        vuelos_serpapi = limpiar_serpapi(resultado_serpapi)
-        logging.info("Resultados de SerpAPI procesados.")
+        logging.info("🔎 Booking + SerpAPI...")
+        vuelos_combinados, estado_proveedores = consultar_proveedores(payload)
+        logging.info(f"Proveedores procesados: {estado_proveedores}")
+        # El cuerpo sigue siendo la lista de vuelos; el estado va en una cabecera
+        # o, si se pide con "incluir_estado", junto a los vuelos
+        cabeceras = {"X-Estado-Proveedores": json.dumps(estado_proveedores)}
 
-        vuelos_combinados = vuelos_booking + vuelos_serpapi
+        if all(e["estado"] != "ok" for e in estado_proveedores.values()):
+            logging.error("Ningún proveedor de vuelos respondió.")
+            return jsonify({"error": "Ningún proveedor de vuelos respondió", "proveedores": estado_proveedores}), 502, cabeceras
 
-        # Insertar en BigQuery
-        insercion_exitosa = insertar_en_bigquery(vuelos_combinados, PROJECT_ID, DATASET, TABLE)
+        # Guardar en BigQuery sin bloquear la respuesta
+        escritor.encolar(vuelos_combinados)
 
-        if insercion_exitosa:
-            logging.info("Datos insertados correctamente en BigQuery.  Devolviendo resultados.")
-            return jsonify(vuelos_combinados), 200
-        else:
-            logging.error("Error al insertar datos en BigQuery.", exc_info=True)
-            return jsonify({"error": "Error al insertar en BigQuery"}), 500
+        if payload.get("incluir_estado"):
+            return jsonify({"vuelos": vuelos_combinados, "proveedores": estado_proveedores}), 200, cabeceras
+        return jsonify(vuelos_combinados), 200, cabeceras
 
     except Exception as e:
         logging.error(f"💥 Error general: {e}", exc_info=True) # Loguea el error general con detalle
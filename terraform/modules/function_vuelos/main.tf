@@ -8,11 +8,28 @@ resource "random_id" "bucket_suffix" {
   byte_length = 4
 }
 
+# Código de la función más los módulos compartidos de modules/comun (escritor_bq.py)
+locals {
+  ficheros_funcion = {
+    for f in fileset(path.module, "*") : f => "${path.module}/${f}"
+    if !anytrue([for ext in [".tf", ".zip", ".sql"] : endswith(f, ext)])
+  }
+  ficheros_zip = merge(local.ficheros_funcion, {
+    "escritor_bq.py" = "${path.module}/../comun/escritor_bq.py"
+  })
+}
+
 data "archive_file" "function_zip" {
   type        = "zip"
-  source_dir  = "${path.module}"
   output_path = "${path.module}/${var.name}.zip"
-  excludes    = ["*.tf", "*.zip"]
+
+  dynamic "source" {
+    for_each = local.ficheros_zip
+    content {
+      content  = file(source.value)
+      filename = source.key
+    }
+  }
 }
 
 
@@ -52,4 +69,24 @@ resource "google_cloudfunctions2_function" "function_vuelos" {
   member   = "allUsers"
 }
 
- 
+# Copia única de la tabla histórica a la particionada (ver migracion_particionada.sql), que después
+# sustituye la tabla histórica por una vista con su mismo nombre: los lectores siguen viendo datos al día
+resource "google_bigquery_job" "migracion_vuelos" {
+  project  = var.project_id
+  job_id   = "migracion-${var.name}-particionada-vista"
+  # El dataset se crea sin ubicación explícita, es decir, en US
+  location = "US"
+
+  query {
+    query = templatefile("${path.module}/migracion_particionada.sql", {
+      origen       = "${var.project_id}.${var.env_variables["DATASET"]}.${var.tabla_historica}"
+      dataset      = "${var.project_id}.${var.env_variables["DATASET"]}"
+      tabla_origen = var.tabla_historica
+      destino      = "${var.project_id}.${var.env_variables["DATASET"]}.${var.env_variables["TABLE"]}"
+    })
+    use_legacy_sql = false
+    # Obligatorio para sentencias DML
+    create_disposition = ""
+    write_disposition  = ""
+  }
+}
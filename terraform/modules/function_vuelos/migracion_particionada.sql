@@ -0,0 +1,48 @@
+-- Migración única de la tabla de vuelos sin particionar a la particionada por FechaVuelo.
+-- ClaveVuelo y FechaVuelo se calculan como clave_vuelo() y fecha_vuelo() de main.py.
+-- Mientras la tabla histórica siga siendo una tabla:
+--   1. se copia a ${origen}_historica como copia de seguridad;
+--   2. sus filas pasan a la particionada (las que no tienen una FechaSalida ISO van a la
+--      partición NULL: la función nunca las actualiza, pero siguen siendo historia);
+--   3. se sustituye por una vista con el mismo nombre y esquema sobre la particionada,
+--      para que Grafana y el resto de lectores sigan viendo los vuelos nuevos.
+-- Cada paso se salta si ya está hecho, así que repetir el script no duplica filas.
+IF EXISTS (
+  SELECT 1 FROM `${dataset}.INFORMATION_SCHEMA.TABLES`
+  WHERE table_name = '${tabla_origen}' AND table_type = 'BASE TABLE'
+) THEN
+  CREATE TABLE IF NOT EXISTS `${origen}_historica` COPY `${origen}`;
+
+  MERGE `${destino}` T
+  USING (
+    SELECT * EXCEPT (rn)
+    FROM (
+      SELECT
+        * EXCEPT (ClaveVuelo, FechaVuelo),
+        TO_HEX(SHA256(CONCAT(IFNULL(Aerolinea, ''), '|', IFNULL(FechaSalida, ''), '|', IFNULL(FechaLlegada, '')))) AS ClaveVuelo,
+        SAFE.PARSE_DATE('%Y-%m-%d', SUBSTR(FechaSalida, 1, 10)) AS FechaVuelo,
+        -- Una fila por clave (el precio más bajo), como exige el MERGE
+        ROW_NUMBER() OVER (PARTITION BY Aerolinea, FechaSalida, FechaLlegada ORDER BY PrecioEur) AS rn
+      FROM `${origen}`
+    )
+    WHERE rn = 1 AND FechaVuelo IS NOT NULL
+  ) S
+  ON T.FechaVuelo = S.FechaVuelo AND T.ClaveVuelo = S.ClaveVuelo
+  WHEN NOT MATCHED THEN INSERT
+    (`Compañia`, `Aerolinea`, `PrecioEur`, `FechaSalida`, `FechaLlegada`, `Duración`, `Escalas`, `EscalasEn`, `LogoUrl`, `EnlaceCompra`, `ClaveVuelo`, `FechaVuelo`)
+  VALUES
+    (S.`Compañia`, S.Aerolinea, S.PrecioEur, S.FechaSalida, S.FechaLlegada, S.`Duración`, S.Escalas, S.EscalasEn, S.LogoUrl, S.EnlaceCompra, S.ClaveVuelo, S.FechaVuelo);
+
+  INSERT INTO `${destino}`
+    (`Compañia`, `Aerolinea`, `PrecioEur`, `FechaSalida`, `FechaLlegada`, `Duración`, `Escalas`, `EscalasEn`, `LogoUrl`, `EnlaceCompra`, `ClaveVuelo`, `FechaVuelo`)
+  SELECT
+    `Compañia`, Aerolinea, PrecioEur, FechaSalida, FechaLlegada, `Duración`, Escalas, EscalasEn, LogoUrl, EnlaceCompra,
+    TO_HEX(SHA256(CONCAT(IFNULL(Aerolinea, ''), '|', IFNULL(FechaSalida, ''), '|', IFNULL(FechaLlegada, '')))),
+    CAST(NULL AS DATE)
+  FROM `${origen}`
+  WHERE SAFE.PARSE_DATE('%Y-%m-%d', SUBSTR(FechaSalida, 1, 10)) IS NULL;
+
+  DROP TABLE `${origen}`;
+END IF;
+
+CREATE OR REPLACE VIEW `${origen}` AS SELECT * FROM `${destino}`;
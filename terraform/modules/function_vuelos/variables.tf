@@ -6,6 +6,11 @@ variable "env_variables" {
   type = map(string)
 }
 
+variable "tabla_historica" {
+  description = "Tabla de vuelos sin particionar: sus filas se copian una vez a la tabla TABLE y pasa a ser una vista sobre ella."
+  type        = string
+}
+
 variable "region" {
   description = "Región donde se despliega el Cloud Run Job"
   type        = string